@@ -0,0 +1,52 @@
+import copy
+import itertools
+
+try:
+    import bson
+except ImportError:  # pymongo is not installed, the documents are only copied
+    bson = None
+
+
+class LocalCollection:
+    """ Minimal stand-in of a pymongo collection, so the pipeline can be measured without a running MongoDB.
+    The documents are encoded to BSON (as the driver does before sending them) and kept in memory."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name="graphs"):
+        self.name = name
+        self.documents = []
+        self.bytes_written = 0
+
+    def insert_one(self, document):
+        if "_id" not in document:
+            document["_id"] = next(self._ids)
+
+        if bson is not None:
+            encoded = bson.encode(document)
+            self.bytes_written += len(encoded)
+            self.documents.append(encoded)
+        else:
+            self.documents.append(copy.deepcopy(document))
+
+    def replace_one(self, query, document, upsert=False):
+        self.insert_one(document)
+
+    def insert_many(self, documents):
+        for document in documents:
+            self.insert_one(document)
+
+    def count_documents(self, query=None):
+        return len(self.documents)
+
+
+class LocalDatabase:
+    """ Minimal stand-in of a pymongo database that creates a 'LocalCollection' on each access """
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = LocalCollection(name)
+        return self.collections[name]
@@ -0,0 +1,236 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from mapfunctions.geojson_functions import add_info_to_folder
+from mapfunctions.graph_functions import add_traffic_level_from_folder, save_graphs_from_folder_mongo, \
+    save_compact_graphs_from_folder_mongo
+from mapfunctions.resampling import save_resampled_graphs_mongo
+from mapfunctions.split import split_features_from_folder
+from mapfunctions.translation import translate_all_files_pairs, mix_tiles_from_two_folder
+
+import update_data_mongo.dates as mongo_dates
+import update_data_mongo.mongo as mongo
+
+import instrumentation.recorder as instrumentation
+
+from benchmarks.local_mongo import LocalDatabase
+from benchmarks.synthetic import create_synthetic_graph, load_cached_graph, create_synthetic_snapshots, get_tiles
+
+
+def count_features_in_folder(folder):
+    """ Count the features of all the files in the given folder
+    Args:
+        folder: The folder with the GeoJSON files
+    Returns:
+        The amount of features"""
+
+    amount = 0
+    for filename in os.listdir(folder):
+        if not filename.endswith(".json"):
+            continue
+        with open(f"{folder}/{filename}") as file:
+            amount += len(json.load(file)["features"])
+
+    return amount
+
+
+def measure_stage(results, stage, function, features=0, trace_memory=True):
+    """ Run one stage of the pipeline and add its wall time, peak memory and throughput to the results
+    Args:
+        results: The list where the result of the stage is added
+        stage: The name of the stage
+        function: The function (without arguments) that runs the stage
+        features: The amount of features processed by the stage
+        trace_memory: A boolean to indicate if the peak memory should be measured (tracemalloc slows the stage)
+    Returns:
+        The value returned by the function"""
+
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    with instrumentation.stage(stage):
+        output = function()
+    seconds = time.perf_counter() - start
+
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    results.append({
+        "stage": stage,
+        "seconds": seconds,
+        "peak_memory_mb": peak_memory,
+        "features": features,
+        "features_per_second": features / seconds if seconds > 0 else None
+    })
+
+    print(f"Stage '{stage}' finished in {seconds:.3f} seconds ({features} features)")
+
+    return output
+
+
+def run_pipeline_benchmark(amount_of_tiles=2, features_per_tile=50, snapshots=4, edges_per_feature=3,
+                           graph_rows=20, graph_columns=12, cached_graph=None, splits=15, precision=3,
+                           trace_memory=True, seed=0):
+    """ Run every stage of 'main.py' over synthetic snapshots and measure them
+    Args:
+        amount_of_tiles: The amount of tiles of each snapshot
+        features_per_tile: The amount of features of each tile
+        snapshots: The amount of snapshots
+        edges_per_feature: The maximum amount of edges followed by each feature
+        graph_rows: The number of horizontal streets of the synthetic graph
+        graph_columns: The number of vertical streets of the synthetic graph
+        cached_graph: A GraphML file to use instead of the synthetic graph (e.g. 'graph_output/base_graph.graphml')
+        splits: The amount of splits used by 'add_info_to_folder'
+        precision: The precision used by 'add_traffic_level_from_folder'
+        trace_memory: A boolean to indicate if the peak memory of each stage should be measured
+        seed: The seed of the synthetic data
+    Returns:
+        A dictionary with the configuration and the results of each stage"""
+
+    if cached_graph is not None:
+        graph = load_cached_graph(cached_graph)
+    else:
+        graph = create_synthetic_graph(rows=graph_rows, columns=graph_columns, amount_of_tiles=amount_of_tiles,
+                                       seed=seed)
+
+    working_directory = tempfile.mkdtemp(prefix="refine_benchmark_")
+    data_folders = [f"{working_directory}/data/tile{i + 1}" for i in range(amount_of_tiles)]
+    pairs_folders = [f"{working_directory}/output_pairs/tile{i + 1}" for i in range(amount_of_tiles)]
+    mixed_folders = [f"{working_directory}/output_pairs/mixed{i + 1}" for i in range(amount_of_tiles)]
+    add_info_folder = f"{working_directory}/output_add_info/mixed"
+    split_folder = f"{working_directory}/output_split/mixed"
+
+    for folder in pairs_folders + mixed_folders + [add_info_folder, split_folder]:
+        os.makedirs(folder, exist_ok=True)
+
+    create_synthetic_snapshots(graph, data_folders, snapshots=snapshots, features_per_tile=features_per_tile,
+                               edges_per_feature=edges_per_feature, seed=seed)
+
+    results = []
+    tiles = get_tiles(amount_of_tiles)
+    database = LocalDatabase()
+
+    # The benchmark already measures the memory of each stage, so the stages are not profiled
+    recorder = instrumentation.start_run("benchmark", profile_stage=None)
+
+    try:
+        def translation():
+            for (corners, outmin, outmax), data_folder, pairs_folder in zip(tiles, data_folders, pairs_folders):
+                translate_all_files_pairs(data_folder, outmin, outmax, pairs_folder)
+
+        features = sum(count_features_in_folder(folder) for folder in data_folders)
+        measure_stage(results, "translation", translation, features, trace_memory)
+
+        # The tiles are mixed one by one, the last mixed folder has the features of all the tiles
+        def mixing():
+            previous_folder = pairs_folders[0]
+            for pairs_folder, mixed_folder in zip(pairs_folders[1:], mixed_folders[1:]):
+                mix_tiles_from_two_folder([previous_folder, pairs_folder, mixed_folder])
+                previous_folder = mixed_folder
+            return previous_folder
+
+        features = sum(count_features_in_folder(folder) for folder in pairs_folders)
+        mixed_folder = measure_stage(results, "mixing", mixing, features, trace_memory)
+
+        features = count_features_in_folder(mixed_folder)
+        measure_stage(results, "add_info_to_folder",
+                      lambda: add_info_to_folder(mixed_folder, add_info_folder, graph, splits=splits),
+                      features, trace_memory)
+
+        features = count_features_in_folder(add_info_folder)
+        measure_stage(results, "split_features_from_folder",
+                      lambda: split_features_from_folder(add_info_folder, split_folder),
+                      features, trace_memory)
+
+        features = count_features_in_folder(split_folder)
+        graph = measure_stage(results, "add_traffic_level_from_folder",
+                              lambda: add_traffic_level_from_folder(graph, split_folder, precision=precision),
+                              features, trace_memory)
+
+        # Each saved document has one link per edge of the graph
+        features = graph.number_of_edges() * snapshots
+
+        def mongo_write():
+            save_graphs_from_folder_mongo(graph, split_folder, database["graphs"])
+            available_files_info = mongo_dates.get_files_dictionary_from_folder(split_folder)
+            mongo.insert_multiple_data(database["dates"], available_files_info)
+
+        measure_stage(results, "mongo_write", mongo_write, features, trace_memory)
+
+        measure_stage(results, "mongo_write_compact",
+                      lambda: save_compact_graphs_from_folder_mongo(graph, split_folder, database["compact_graphs"],
+                                                                    database["edge_orders"]),
+                      features, trace_memory)
+
+        measure_stage(results, "resampling",
+                      lambda: save_resampled_graphs_mongo(graph, database["resampled_graphs"]),
+                      features, trace_memory)
+
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+    return {
+        "datetime": datetime.now().isoformat(),
+        "configuration": {
+            "amount_of_tiles": amount_of_tiles,
+            "features_per_tile": features_per_tile,
+            "snapshots": snapshots,
+            "edges_per_feature": edges_per_feature,
+            "graph": cached_graph if cached_graph is not None else f"synthetic {graph_rows}x{graph_columns}",
+            "graph_nodes": graph.number_of_nodes(),
+            "graph_edges": graph.number_of_edges(),
+            "splits": splits,
+            "precision": precision,
+            "trace_memory": trace_memory,
+            "seed": seed,
+        },
+        "mongo_bytes_written": database["graphs"].bytes_written,
+        "mongo_compact_bytes_written": database["compact_graphs"].bytes_written + database["edge_orders"].bytes_written,
+        "stages": results,
+        "snapshots": recorder.snapshots,
+        "mongo_summary": recorder.to_dict()["mongo_summary"]
+    }
+
+
+def print_benchmark_report(report):
+    """ Print the results of 'run_pipeline_benchmark' as a table
+    Args:
+        report: The dictionary returned by 'run_pipeline_benchmark'"""
+
+    print(f"\n{'Stage':<32}{'Seconds':>12}{'Peak MB':>12}{'Features':>12}{'Features/s':>14}")
+    for stage in report["stages"]:
+        peak_memory = f"{stage['peak_memory_mb']:.2f}" if stage["peak_memory_mb"] is not None else "-"
+        per_second = f"{stage['features_per_second']:.1f}" if stage["features_per_second"] is not None else "-"
+        print(f"{stage['stage']:<32}{stage['seconds']:>12.3f}{peak_memory:>12}{stage['features']:>12}"
+              f"{per_second:>14}")
+
+    total = sum(stage["seconds"] for stage in report["stages"])
+    print(f"{'Total':<32}{total:>12.3f}\n")
+
+    print(f"Bytes written to 'graphs': {report['mongo_bytes_written']}")
+    print(f"Bytes written to 'compact_graphs' and 'edge_orders': {report['mongo_compact_bytes_written']}\n")
+
+
+def save_benchmark_report(report, folder="benchmark_results"):
+    """ Save the results of 'run_pipeline_benchmark' as a JSON file, so different runs can be compared
+    Args:
+        report: The dictionary returned by 'run_pipeline_benchmark'
+        folder: The folder where the file is saved
+    Returns:
+        The path of the saved file"""
+
+    os.makedirs(folder, exist_ok=True)
+    path = f"{folder}/benchmark_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.json"
+
+    with open(path, "w") as output_file:
+        json.dump(report, output_file, indent=4)
+
+    return path
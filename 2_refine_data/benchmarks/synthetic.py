@@ -0,0 +1,251 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import networkx as nx
+import osmnx as ox
+
+from mapfunctions.graph_functions import add_osmnx_info
+from mapfunctions.utils import normalize, get_geojson_corners_coordinates
+
+# First tile used by the extraction process, the rest of the tiles are added to the north of it
+FIRST_TILE_X = 7988
+FIRST_TILE_Y = 6393
+TILE_ZOOM = 14
+
+HIGHWAY_TYPES = ['primary', 'secondary', 'tertiary', 'residential', 'living_street']
+
+ROAD_TYPES = {
+    'motorway': "Motorway",
+    'primary': "Major road",
+    'secondary': "Secondary road",
+    'tertiary': "Connecting road",
+    'residential': "Local road",
+    'living_street': "Local road of minor importance",
+}
+
+MAXSPEEDS = {
+    'primary': 50,
+    'secondary': 50,
+    'tertiary': 40,
+    'residential': 30,
+    'living_street': 20,
+}
+
+
+def get_tiles(amount_of_tiles=2):
+    """ Get the corners, outmin and outmax of each tile, the same way they are defined in 'constants.py'
+    Args:
+        amount_of_tiles: The amount of tiles (stacked from south to north)
+    Returns:
+        A list with the tuple (corners, outmin, outmax) of each tile"""
+
+    tiles = []
+    for tile_number in range(amount_of_tiles):
+        corners = get_geojson_corners_coordinates(FIRST_TILE_X, FIRST_TILE_Y - tile_number, TILE_ZOOM,
+                                                  format="lnglat")
+        outmin = [corners[2][0], corners[0][1]]
+        outmax = [corners[0][0], corners[1][1]]
+        tiles.append((corners, outmin, outmax))
+
+    return tiles
+
+
+def create_synthetic_graph(rows=20, columns=12, amount_of_tiles=2, seed=0):
+    """ Create a grid road graph with the same attributes as the graphs built with 'init_graph_bbox'
+    Args:
+        rows: The number of horizontal streets of the grid
+        columns: The number of vertical streets of the grid
+        amount_of_tiles: The amount of tiles covered by the graph
+        seed: The seed used to choose the highway type of each street
+    Returns:
+        The synthetic graph"""
+
+    tiles = get_tiles(amount_of_tiles)
+    north = tiles[-1][0][0][1]
+    south = tiles[0][0][1][1]
+    east = tiles[0][0][2][0]
+    west = tiles[0][0][0][0]
+
+    rnd = random.Random(seed)
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+
+    # Keep a small margin so the streets are fully inside the tiles
+    lat_step = (north - south) / (rows + 1)
+    lng_step = (east - west) / (columns + 1)
+
+    for row in range(rows):
+        for column in range(columns):
+            graph.add_node(__node_id(row, column, columns),
+                           x=west + lng_step * (column + 1),
+                           y=south + lat_step * (row + 1),
+                           street_count=4)
+
+    # Each row and each column of the grid is a two-way street
+    streets = [("row", row) for row in range(rows)] + [("column", column) for column in range(columns)]
+    for street_number, (orientation, position) in enumerate(streets):
+        highway = rnd.choice(HIGHWAY_TYPES)
+        name = f"Synthetic {orientation} {position}"
+        osmid = 1_000_000 + street_number
+
+        if orientation == "row":
+            nodes = [__node_id(position, column, columns) for column in range(columns)]
+        else:
+            nodes = [__node_id(row, position, columns) for row in range(rows)]
+
+        for u, v in zip(nodes[:-1], nodes[1:]):
+            for source, target, reversed_edge in ((u, v, False), (v, u, True)):
+                graph.add_edge(source, target, key=0,
+                               osmid=osmid,
+                               name=name,
+                               highway=highway,
+                               oneway=False,
+                               reversed=reversed_edge,
+                               lanes="2",
+                               maxspeed=str(MAXSPEEDS[highway]))
+
+    for u, v, edge_data in graph.edges(data=True):
+        edge_data["dates"] = {}
+        edge_data["current_speed"] = None
+        edge_data["api_data"] = False
+        edge_data["traffic_level"] = None
+
+    return add_osmnx_info(graph)
+
+
+def load_cached_graph(filename="graph_output/base_graph.graphml"):
+    """ Load a graph saved with 'save_graph' and prepare it as 'init_graph_bbox' does
+    Args:
+        filename: The GraphML file of the graph
+    Returns:
+        The graph ready to be used by the refinement pipeline"""
+
+    graph = ox.load_graphml(filename)
+
+    for u, v, edge_data in graph.edges(data=True):
+        edge_data["dates"] = {}
+        edge_data["current_speed"] = None
+        edge_data["api_data"] = False
+        edge_data["traffic_level"] = None
+
+    return graph
+
+
+def __node_id(row, column, columns):
+    return row * columns + column + 1
+
+
+def __edges_inside_tile(graph, tile_corners):
+    west = tile_corners[0][0]
+    east = tile_corners[2][0]
+    south = tile_corners[1][1]
+    north = tile_corners[0][1]
+
+    def inside(node):
+        return west <= graph.nodes[node]["x"] <= east and south <= graph.nodes[node]["y"] <= north
+
+    return [(u, v) for u, v in graph.edges() if inside(u) and inside(v)]
+
+
+def __random_path(graph, edges, length, rnd):
+    """ Follow the graph from a random edge, as TomTom lines usually cover more than one edge """
+    u, v = rnd.choice(edges)
+    path = [u, v]
+    allowed = set(edges)
+
+    while len(path) - 1 < length:
+        next_nodes = [n for n in graph.successors(path[-1]) if n != path[-2] and (path[-1], n) in allowed]
+        if not next_nodes:
+            break
+        path.append(rnd.choice(next_nodes))
+
+    return path
+
+
+def create_synthetic_tile(graph, tile_corners, outmin, outmax, features=50, edges_per_feature=3, seed=0):
+    """ Create a tile with the same structure as the ones translated from the TomTom API ('.pbf.json')
+    Args:
+        graph: The graph where the lines of the tile are drawn
+        tile_corners: The corners of the tile (as in 'constants.TILE1_CORNERS')
+        outmin: The minimum coordinates of the tile (as in 'constants.OUTMIN_TILE1')
+        outmax: The maximum coordinates of the tile (as in 'constants.OUTMAX_TILE1')
+        features: The amount of features of the tile
+        edges_per_feature: The maximum amount of edges followed by each feature
+        seed: The seed of the random generator
+    Returns:
+        A dictionary with the tile (the coordinates of the features in the 0-4095 tile space)"""
+
+    rnd = random.Random(seed)
+    edges = __edges_inside_tile(graph, tile_corners)
+
+    if not edges:
+        raise ValueError("ERROR: There are no edges inside the tile")
+
+    tile = {"type": "FeatureCollection", "name": "Traffic flow", "features": []}
+
+    for _ in range(features):
+        path = __random_path(graph, edges, edges_per_feature, rnd)
+        line = [
+            [
+                normalize(graph.nodes[node]["x"], outmin[0], outmax[0], 4095, 0),
+                normalize(graph.nodes[node]["y"], outmin[1], outmax[1], 4095, 0)
+            ]
+            for node in path
+        ]
+
+        highway = graph.edges[path[0], path[1], 0]["highway"]
+        tile["features"].append({
+            "type": "Feature",
+            "properties": {
+                "road_type": ROAD_TYPES.get(highway, "Local road"),
+                "traffic_level": round(rnd.uniform(0.1, 1.0), 6),
+                "traffic_road_coverage": "full"
+            },
+            "geometry": {
+                "type": "MultiLineString",
+                "coordinates": [line]
+            }
+        })
+
+    return tile
+
+
+def create_synthetic_snapshots(graph, folders, snapshots=4, features_per_tile=50, edges_per_feature=3,
+                               first_datetime="2024_05_14_05_57_11", minutes_between_snapshots=30, seed=0):
+    """ Write synthetic tiles for each snapshot, with the same filenames as the extraction process
+    Args:
+        graph: The graph where the lines of the tiles are drawn
+        folders: A list with the output folder of each tile (one folder per tile, from south to north)
+        snapshots: The amount of snapshots (files) of each tile
+        features_per_tile: The amount of features of each tile
+        edges_per_feature: The maximum amount of edges followed by each feature
+        first_datetime: The datetime of the first snapshot (with the filename format)
+        minutes_between_snapshots: The minutes between two consecutive snapshots
+        seed: The seed of the random generator
+    Returns:
+        The list with the filenames of the snapshots"""
+
+    tiles = get_tiles(len(folders))
+
+    start = datetime.strptime(first_datetime, "%Y_%m_%d_%H_%M_%S")
+    filenames = []
+
+    for snapshot in range(snapshots):
+        current = start + timedelta(minutes=minutes_between_snapshots * snapshot)
+        filename = current.strftime("%Y_%m_%d_%H_%M_%S") + ".pbf.json"
+        filenames.append(filename)
+
+        for tile_number, folder in enumerate(folders):
+            corners, outmin, outmax = tiles[tile_number]
+            tile = create_synthetic_tile(graph, corners, outmin, outmax,
+                                         features=features_per_tile,
+                                         edges_per_feature=edges_per_feature,
+                                         seed=seed + snapshot * len(folders) + tile_number)
+
+            os.makedirs(folder, exist_ok=True)
+            with open(f"{folder}/{filename}", "w") as output_file:
+                output_file.write(json.dumps(tile))
+
+    return filenames
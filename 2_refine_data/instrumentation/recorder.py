@@ -0,0 +1,227 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Stage to profile (e.g. 'add_traffic_level') and how to profile it ('cprofile' or 'tracemalloc')
+PROFILE_STAGE = os.getenv("PROFILE_STAGE")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+PROFILE_FOLDER = os.getenv("PROFILE_FOLDER", "run_reports")
+
+CSV_COLUMNS = ["type", "stage", "snapshot", "collection", "seconds", "items", "documents",
+               "interpolation_iterations", "interpolated_edges", "slots", "gaps", "peak_memory_mb", "profile_file"]
+
+
+class RunRecorder:
+    """ Collect the timings and counters of a run of the refinement pipeline.
+    Stages contain snapshots (one per processed file), and MongoDB writes are attached to the current stage."""
+
+    def __init__(self, run_name="refinement", profile_stage=None, profile_mode="cprofile",
+                 profile_folder="run_reports"):
+        self.run_name = run_name
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.profile_folder = profile_folder
+
+        self.started = datetime.now()
+        self.stages = []
+        self.snapshots = []
+        self.mongo_writes = []
+
+        self._current_stage = None
+        self._current_snapshot = None
+
+    @contextmanager
+    def stage(self, name):
+        """ Measure a stage of the pipeline. The yielded dictionary can be used to add counters to the stage """
+        record = {"stage": name, "seconds": None, "items": 0}
+        previous_stage = self._current_stage
+        self._current_stage = record
+
+        profiler = self.__start_profiler(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.__stop_profiler(name, profiler, record)
+            self.stages.append(record)
+            self._current_stage = previous_stage
+
+    @contextmanager
+    def snapshot(self, filename):
+        """ Measure the processing of a single file (snapshot) inside the current stage """
+        record = {"stage": self._current_stage["stage"] if self._current_stage else None,
+                  "snapshot": filename, "seconds": None, "items": 0}
+        previous_snapshot = self._current_snapshot
+        self._current_snapshot = record
+
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.snapshots.append(record)
+            self._current_snapshot = previous_snapshot
+
+            if self._current_stage is not None:
+                self._current_stage["items"] += record["items"]
+
+    def annotate(self, **values):
+        """ Add counters to the current snapshot (or to the current stage if there is no snapshot) """
+        record = self._current_snapshot if self._current_snapshot is not None else self._current_stage
+        if record is not None:
+            record.update(values)
+
+    def record_mongo_write(self, collection, documents, seconds):
+        """ Save the latency of a write in MongoDB """
+        self.mongo_writes.append({
+            "stage": self._current_stage["stage"] if self._current_stage else None,
+            "snapshot": self._current_snapshot["snapshot"] if self._current_snapshot else None,
+            "collection": collection,
+            "documents": documents,
+            "seconds": seconds
+        })
+
+    def to_dict(self):
+        mongo_seconds = [write["seconds"] for write in self.mongo_writes]
+
+        return {
+            "run_name": self.run_name,
+            "started": self.started.isoformat(),
+            "profile_stage": self.profile_stage,
+            "profile_mode": self.profile_mode,
+            "stages": self.stages,
+            "snapshots": self.snapshots,
+            "mongo_writes": self.mongo_writes,
+            "mongo_summary": {
+                "writes": len(mongo_seconds),
+                "documents": sum(write["documents"] for write in self.mongo_writes),
+                "total_seconds": sum(mongo_seconds),
+                "max_seconds": max(mongo_seconds) if mongo_seconds else None,
+                "avg_seconds": sum(mongo_seconds) / len(mongo_seconds) if mongo_seconds else None,
+            }
+        }
+
+    def to_csv(self):
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+
+        for record_type, records in (("stage", self.stages), ("snapshot", self.snapshots),
+                                     ("mongo_write", self.mongo_writes)):
+            for record in records:
+                writer.writerow({"type": record_type, **record})
+
+        return output.getvalue()
+
+    def export(self, path):
+        """ Save the report of the run. The format (JSON or CSV) is chosen from the extension of the path """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        with open(path, "w", newline="") as output_file:
+            if path.endswith(".csv"):
+                output_file.write(self.to_csv())
+            else:
+                json.dump(self.to_dict(), output_file, indent=4, default=str)
+
+        return path
+
+    def __start_profiler(self, name):
+        if name != self.profile_stage:
+            return None
+
+        if self.profile_mode == "tracemalloc":
+            tracemalloc.start()
+            return "tracemalloc"
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def __stop_profiler(self, name, profiler, record):
+        if profiler is None:
+            return
+
+        os.makedirs(self.profile_folder, exist_ok=True)
+        prefix = f"{self.profile_folder}/{self.run_name}_{self.started.strftime('%Y_%m_%d_%H_%M_%S')}_{name}"
+
+        if profiler == "tracemalloc":
+            memory_snapshot = tracemalloc.take_snapshot()
+            record["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+            record["profile_file"] = f"{prefix}_memory.txt"
+            with open(record["profile_file"], "w") as output_file:
+                for statistic in memory_snapshot.statistics("lineno")[:50]:
+                    output_file.write(f"{statistic}\n")
+        else:
+            profiler.disable()
+
+            record["profile_file"] = f"{prefix}.prof"
+            profiler.dump_stats(record["profile_file"])
+
+            with open(f"{prefix}.txt", "w") as output_file:
+                pstats.Stats(profiler, stream=output_file).sort_stats("cumulative").print_stats(50)
+
+
+# Recorder shared by 'mapfunctions' and 'update_data_mongo'
+recorder = RunRecorder(profile_stage=PROFILE_STAGE, profile_mode=PROFILE_MODE, profile_folder=PROFILE_FOLDER)
+
+
+def start_run(run_name="refinement", profile_stage=PROFILE_STAGE, profile_mode=PROFILE_MODE,
+              profile_folder=PROFILE_FOLDER):
+    """ Start a new run, discarding the records of the previous one
+    Args:
+        run_name: The name of the run (used in the names of the report files)
+        profile_stage: The stage to profile (None to disable profiling)
+        profile_mode: 'cprofile' (time) or 'tracemalloc' (memory)
+        profile_folder: The folder where the profiling files are saved
+    Returns:
+        The recorder of the run"""
+
+    global recorder
+    recorder = RunRecorder(run_name=run_name, profile_stage=profile_stage, profile_mode=profile_mode,
+                           profile_folder=profile_folder)
+    return recorder
+
+
+def stage(name):
+    return recorder.stage(name)
+
+
+def snapshot(filename):
+    return recorder.snapshot(filename)
+
+
+def annotate(**values):
+    recorder.annotate(**values)
+
+
+def record_mongo_write(collection, documents, seconds):
+    recorder.record_mongo_write(collection, documents, seconds)
+
+
+def export_report(path=None):
+    """ Save the report of the current run
+    Args:
+        path: The path of the report ('.json' or '.csv'). By default, a JSON file in the profile folder
+    Returns:
+        The path of the saved report"""
+
+    if path is None:
+        path = f"{recorder.profile_folder}/{recorder.run_name}_{recorder.started.strftime('%Y_%m_%d_%H_%M_%S')}.json"
+
+    return recorder.export(path)
@@ -1,28 +1,41 @@
 import os
+from datetime import datetime
 
 import networkx as nx
 
 from mapfunctions.split import split_features_from_folder
 from mapfunctions.translation import translate_all_files_pairs, mix_tiles_from_two_folder
 from mapfunctions.geojson_functions import add_info_to_folder
+from mapfunctions.resampling import save_resampled_graphs_mongo
 from mapfunctions.graph_functions import init_graph_bbox, add_traffic_level_from_folder, \
-    save_graph, plot_graph_date_filename
+    save_graph, plot_graph_date_filename, save_graphs_from_folder_mongo, save_compact_graphs_from_folder_mongo, \
+    save_rollups_from_folder_mongo
 
 import update_data_mongo.dates as mongo_dates
 import update_data_mongo.mongo as mongo
+import update_data_mongo.compact as mongo_compact
+import update_data_mongo.retention as mongo_retention
+import update_data_mongo.indexes as mongo_indexes
 
 import mapfunctions.constants as const
 from update_data_mongo.mongo import get_database, insert_data
 
+import instrumentation.recorder as instrumentation
+
+# The stage set in PROFILE_STAGE (.env) is profiled with cProfile or tracemalloc (PROFILE_MODE)
+instrumentation.start_run("refinement")
+
 # =====================================================================================================================
 #                       GET THE GRAPH FROM THE FILE, WITH ALL THE NEEDED MODIFICATIONS DONE
 # =====================================================================================================================
 print("Getting the graph from the file\n\n")
 first_execution = False
 
-G = init_graph_bbox(const.GRAPH_BBOX_NORTH, const.GRAPH_BBOX_SOUTH,
-                    const.GRAPH_BBOX_EAST, const.GRAPH_BBOX_WEST,
-                    osm_ways_to_delete=const.osm_ways_to_delete)
+with instrumentation.stage("init_graph") as stage_info:
+    G = init_graph_bbox(const.GRAPH_BBOX_NORTH, const.GRAPH_BBOX_SOUTH,
+                        const.GRAPH_BBOX_EAST, const.GRAPH_BBOX_WEST,
+                        osm_ways_to_delete=const.osm_ways_to_delete)
+    stage_info["items"] = G.number_of_edges()
 
 save_graph(G, "graph_output/base_graph")
 print("Base graph saved as a file")
@@ -56,12 +69,14 @@ dir_output_tile_1 = "output_pairs/tile1"
 dir_output_tile_2 = "output_pairs/tile2"
 dir_output_mixed = "output_pairs/mixed"
 
-translate_all_files_pairs(dir_input_tile_1, const.OUTMIN_TILE1, const.OUTMAX_TILE1, dir_output_tile_1)
-translate_all_files_pairs(dir_input_tile_2, const.OUTMIN_TILE2, const.OUTMAX_TILE2, dir_output_tile_2)
+with instrumentation.stage("translation"):
+    translate_all_files_pairs(dir_input_tile_1, const.OUTMIN_TILE1, const.OUTMAX_TILE1, dir_output_tile_1)
+    translate_all_files_pairs(dir_input_tile_2, const.OUTMIN_TILE2, const.OUTMAX_TILE2, dir_output_tile_2)
 
 # Once we got the files for the tiles, we mix them into a single file (each file will have the same name/date)
 directories_to_mix = [dir_output_tile_1, dir_output_tile_2, dir_output_mixed]
-mix_tiles_from_two_folder(directories_to_mix)
+with instrumentation.stage("mixing"):
+    mix_tiles_from_two_folder(directories_to_mix)
 
 
 # =====================================================================================================================
@@ -73,7 +88,8 @@ print("Adding information to the GeoJSON files\n\n")
 
 dir_input = "output_pairs/mixed"
 dir_output = "output_add_info/mixed"
-add_info_to_folder(dir_input, dir_output, G, splits=15)
+with instrumentation.stage("add_info"):
+    add_info_to_folder(dir_input, dir_output, G, splits=15)
 
 
 # =====================================================================================================================
@@ -85,7 +101,8 @@ print("Splitting the GeoJSON features into smaller pieces\n\n")
 
 dir_input = "output_add_info/mixed"
 dir_output = "output_split/mixed"
-split_features_from_folder(dir_input, dir_output)
+with instrumentation.stage("split"):
+    split_features_from_folder(dir_input, dir_output)
 
 # =====================================================================================================================
 #                        ADD INFORMATION TO THE GRAPH (TRAFFIC_FLOW) & SAVE GRAPH IN MONGO
@@ -94,7 +111,43 @@ split_features_from_folder(dir_input, dir_output)
 print("Adding information to the graph\n\n")
 
 dir_input = "output_split/mixed"
-add_traffic_level_from_folder(G, dir_input, precision=3, save_each_graph_mongo=True)
+with instrumentation.stage("add_traffic_level"):
+    add_traffic_level_from_folder(G, dir_input, precision=3)
+
+with instrumentation.stage("save_graphs_mongo"):
+    # The time fields are added to the snapshots saved without them (older runs or imported with mongoimport), as the
+    # hours filter of the dashboards only uses 'minute_of_day'. The indexes used by the dashboards are created the
+    # first time (the next runs don't create them again)
+    mongo_indexes.backfill_time_fields(get_database("TFG"))
+    mongo_indexes.create_indexes(get_database("TFG"))
+
+    # The rollups of the dashboard aggregations are updated with each saved graph
+    rollups_collection = get_database("TFG")["rollups"]
+
+    if mongo_compact.GRAPHS_STORAGE_MODE == "compact":
+        # With GRAPHS_STORAGE_MODE='compact' (.env) only the compact snapshots (keyframes and deltas) are saved, and the
+        # rollups are updated from the graph in memory
+        save_compact_graphs_from_folder_mongo(G, dir_input, get_database("TFG")["compact_graphs"],
+                                              get_database("TFG")["edge_orders"],
+                                              keyframe_interval=mongo_compact.KEYFRAME_INTERVAL,
+                                              dtype=mongo_compact.QUANTIZATION_DTYPE)
+        save_rollups_from_folder_mongo(G, dir_input, rollups_collection)
+    else:
+        save_graphs_from_folder_mongo(G, dir_input, get_database("TFG")["graphs"],
+                                      rollups_collection=rollups_collection)
+
+# =====================================================================================================================
+#                  RESAMPLE THE SNAPSHOTS ONTO A REGULAR GRID OF SLOTS & SAVE THEM IN MONGO
+# =====================================================================================================================
+
+print("Resampling the snapshots onto a regular grid\n\n")
+
+with instrumentation.stage("resampling") as stage_info:
+    # The last snapshot of the previous run continues its grid, so the slots between both runs are interpolated
+    stage_info["items"] = save_resampled_graphs_mongo(G, get_database("TFG")["resampled_graphs"],
+                                                      slot_minutes=const.RESAMPLING_SLOT_MINUTES,
+                                                      max_gap_minutes=const.RESAMPLING_MAX_GAP_MINUTES,
+                                                      db=get_database("TFG"))
 
 # =====================================================================================================================
 #                                    SAVE DATES IN MONGO
@@ -103,8 +156,34 @@ add_traffic_level_from_folder(G, dir_input, precision=3, save_each_graph_mongo=T
 print("Saving dates in MongoDB\n\n")
 mixed_tiles_path = "output_split/mixed"
 
-available_files_info = mongo_dates.get_files_dictionary_from_folder(mixed_tiles_path)
-mongo.insert_multiple_data(mongo.get_database()["dates"], available_files_info)
+with instrumentation.stage("save_dates_mongo") as stage_info:
+    available_files_info = mongo_dates.get_files_dictionary_from_folder(mixed_tiles_path)
+    mongo.insert_multiple_data(mongo.get_database()["dates"], available_files_info)
+    stage_info["items"] = len(available_files_info)
+
+    if available_files_info:
+        mongo.insert_ingest_event(mongo.get_database(), min(info["datetime"] for info in available_files_info),
+                                  max(info["datetime"] for info in available_files_info), "graphs")
+
+# =====================================================================================================================
+#                     COMPACT THE SNAPSHOTS OLDER THAN THE RETENTION WINDOW (RETENTION_DAYS)
+# =====================================================================================================================
+
+if mongo_retention.RETENTION_DAYS > 0:
+    print("Compacting old snapshots\n\n")
+
+    with instrumentation.stage("retention"):
+        boundary = mongo_retention.run_retention(get_database("TFG"), retention_days=mongo_retention.RETENTION_DAYS,
+                                                 granularity=mongo_retention.RETENTION_GRANULARITY)
+        mongo.insert_ingest_event(get_database("TFG"), datetime.min, boundary, "retention")
+
+# =====================================================================================================================
+#                                    SAVE THE REPORT OF THE RUN
+# =====================================================================================================================
+
+report_path = instrumentation.export_report()
+instrumentation.export_report(report_path.replace(".json", ".csv"))
+print(f"Run report saved on '{report_path}'\n\n")
 
 # =====================================================================================================================
 #                                         DELETE FILES
@@ -1,3 +1,8 @@
+# Resampling of the snapshots onto a regular grid (minutes of each slot, and maximum minutes between two snapshots
+# to interpolate the slots between them, longer gaps are flagged)
+RESAMPLING_SLOT_MINUTES = 15
+RESAMPLING_MAX_GAP_MINUTES = 60
+
 # BBOX for the graph we will use in our model
 GRAPH_BBOX_NORTH = 36.711573
 GRAPH_BBOX_SOUTH = 36.728257
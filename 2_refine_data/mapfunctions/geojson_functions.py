@@ -5,15 +5,16 @@ import geojson
 
 from shapely.geometry import Point
 
-from mapfunctions.utils import float_to_hex_color, are_opposite_bearings, get_cardinal_direction_from_bearing, skip_feature
+from mapfunctions.utils import floats_to_hex_colors, are_opposite_bearings, get_cardinal_direction_from_bearing, skip_feature
 from mapfunctions.graph_functions import init_graph_point, init_graph_bbox
+import instrumentation.recorder as instrumentation
 
 
-def __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, error_management=False):
+def __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, stroke, error_management=False):
     property_error = False
 
     feature["properties"]["stroke-width"] = 6
-    feature["properties"]["stroke"] = float_to_hex_color(feature["properties"]["traffic_level"])
+    feature["properties"]["stroke"] = stroke
 
     feature["properties"]["aiming"] = get_cardinal_direction_from_bearing(bearing_api_edge)
     feature["properties"]["api_bearing"] = bearing_api_edge
@@ -58,7 +59,9 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
         graph: The graph to use to get the nearest edges
         error_management: A boolean to indicate if the error management is enabled
         print_distant_edges: A boolean to indicate if the distant edges should be printed
-        splits: The amount of splits to use"""
+        splits: The amount of splits to use
+    Returns:
+        The amount of features saved in the output file"""
 
     with open(f"{folder_input}/{filename}") as f:
         data = geojson.load(f)
@@ -69,6 +72,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
         coordinates_lat = []
         coordinates_lon = []
 
+        traffic_levels = []
+
         new_features = []
         i = 0
         for feature in data["features"]:
@@ -97,6 +102,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
             middle_coordinates_lon.append(middle_point[1])
             middle_coordinates_lat.append(middle_point[0])
 
+            traffic_levels.append(feature["properties"].get("traffic_level"))
+
         nearest_edges_and_distance_list = ox.distance.nearest_edges(graph, middle_coordinates_lon,
                                                                     middle_coordinates_lat, return_dist=True)
 
@@ -106,6 +113,9 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
         nearest_edges_list = nearest_edges_and_distance_list[0]
         nearest_distance_list = nearest_edges_and_distance_list[1]
 
+        # The color of every feature is computed at once
+        strokes = floats_to_hex_colors(traffic_levels)
+
         j = 0
         for feature in data["features"]:
 
@@ -147,7 +157,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
             else:
                 feature["properties"]["splits"] = amount_splits
 
-            __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, error_management=error_management)
+            __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, strokes[j],
+                                        error_management=error_management)
 
             j += 1
 
@@ -162,6 +173,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
 
         json.dump(res, open(f"{folder_output}/{filename}", "w"))
 
+    return len(new_features)
+
 
 def add_info_to_folder(folder_input, folder_output, graph,
                        error_management=False,
@@ -178,10 +191,11 @@ def add_info_to_folder(folder_input, folder_output, graph,
     for filename in os.listdir(folder_input):
         if filename.endswith(".json"):
             print(f"Adding information to {filename}")
-            add_info_to_file(filename, folder_input, folder_output, graph,
-                             error_management=error_management,
-                             print_distant_edges=print_distant_edges,
-                             splits=splits)
+            with instrumentation.snapshot(filename) as snapshot_info:
+                snapshot_info["items"] = add_info_to_file(filename, folder_input, folder_output, graph,
+                                                          error_management=error_management,
+                                                          print_distant_edges=print_distant_edges,
+                                                          splits=splits)
 
 
 if __name__ == "__main__":
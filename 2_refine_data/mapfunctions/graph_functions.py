@@ -9,7 +9,10 @@ import networkx as nx
 
 from mapfunctions import constants
 from mapfunctions.utils import are_opposite_bearings, skip_feature
-from update_data_mongo.mongo import get_database, insert_data
+from update_data_mongo.mongo import get_database, insert_data, upsert_data
+from update_data_mongo.compact import create_edge_order, encode_snapshot
+from update_data_mongo.rollups import update_rollups
+import instrumentation.recorder as instrumentation
 
 
 def add_osmnx_info(graph):
@@ -338,10 +341,14 @@ def interpolate_traffic_level(graph, filename, neighbours_dictionary=None, preci
         graph: The graph to interpolate the traffic level
         filename: The filename of the date to interpolate
         precision: The precision to check the traffic level of the interpolations
-        neighbours_dictionary: The dictionary with the neighbours of the edges"""
+        neighbours_dictionary: The dictionary with the neighbours of the edges
+    Returns:
+        The number of iterations needed until no edge changed its traffic level"""
 
     num_iter = 0
     num_edges_interpolated = 1
+    # Each edge is counted once, even if its traffic level changes in several iterations
+    interpolated_edges = set()
 
     if neighbours_dictionary is None:
         print("Getting the neighbours edges...")
@@ -375,10 +382,15 @@ def interpolate_traffic_level(graph, filename, neighbours_dictionary=None, preci
                             precision):
                         data['dates'][filename]['traffic_level'] = new_traffic_level
                         num_edges_interpolated += 1
+                        interpolated_edges.add((u, v))
 
         if num_iter % 50 == 0:
             print("\tIteration: ", num_iter, " - Interpolated ", num_edges_interpolated, " edges\t\tfile =", filename)
 
+    instrumentation.annotate(interpolation_iterations=num_iter, interpolated_edges=len(interpolated_edges))
+
+    return num_iter
+
 
 def plot_graph_date_filename(graph, filename, size=6):
     """ Plot the graph by the traffic level attribute of the edges from a specific date (filename)
@@ -404,40 +416,124 @@ def save_graph(graph, filename):
     ox.save_graphml(graph, f"{filename}.graphml")
 
 
-def add_traffic_level_from_folder(graph, folder, precision=6, save_each_graph_mongo=False):
+def add_traffic_level_from_folder(graph, folder, precision=6, save_each_graph_mongo=False, collection=None):
     """ Add the traffic level to the edges from a folder
     Args:
         graph: The graph to add the traffic level
         folder: The folder with the traffic level
         precision: The precision to check the traffic level of the interpolations
         save_each_graph_mongo: A boolean to indicate if the graph should be saved in the database
+        collection: The collection where the graphs are saved (by default, 'graphs' from the 'TFG' database)
     Returns:
         The graph with the traffic level added"""
 
-    if save_each_graph_mongo:
-        db = get_database("TFG")
-        col = db["graphs"]
-
     print("Getting the neighbours edges dictionary...")
     neighbours_dictionary = {}
     for u, v, data in graph.edges(data=True):
         neighbours_dictionary[(u, v)] = get_neighbours_edges(graph, u, v)
 
     for filename in os.listdir(f"{folder}"):
-        with open(f"{folder}/{filename}") as datafile:
+        with instrumentation.snapshot(filename) as snapshot_info, open(f"{folder}/{filename}") as datafile:
             graph = add_traffic_level_from_file(graph, datafile, filename,
                                                 neighbours_dictionary=neighbours_dictionary,
                                                 precision=precision)
+            snapshot_info["items"] = graph.number_of_edges()
             print(f"Added traffic level from {filename}\n\n")
 
     if save_each_graph_mongo:
-        # for i in range(1, 100): # TODO: Delete this for, when it's really executed. This was for a test of speed
-        for filename in os.listdir(f"{folder}"):
+        if collection is None:
+            collection = get_database("TFG")["graphs"]
+
+        save_graphs_from_folder_mongo(graph, folder, collection)
+
+    return graph
+
+
+def save_graphs_from_folder_mongo(graph, folder, collection, rollups_collection=None):
+    """ Save in the database one graph for each date (filename) of the folder
+    Args:
+        graph: The graph with the traffic level of the dates already added
+        folder: The folder with the files of the dates
+        collection: The collection where the graphs are saved
+        rollups_collection: The collection of the rollups updated with each graph (None to not update them)"""
+
+    for filename in os.listdir(f"{folder}"):
+        with instrumentation.snapshot(filename) as snapshot_info:
             graph_to_dictionary = __prepare_graph_date_before_saving_mongo(graph, filename)
-            insert_data(col, graph_to_dictionary)
+            insert_data(collection, graph_to_dictionary)
+            if rollups_collection is not None:
+                update_rollups(rollups_collection, graph_to_dictionary)
+            snapshot_info["items"] = len(graph_to_dictionary["links"])
             print(f"Saved graph with traffic level from {filename} to MongoDB\n\n")
 
-    return graph
+
+def save_rollups_from_folder_mongo(graph, folder, rollups_collection):
+    """ Update the rollups with the traffic level of each date (filename) of the folder, read from the graph in memory
+    (used when the complete snapshots are not saved in the database)
+    Args:
+        graph: The graph with the traffic level of the dates already added
+        folder: The folder with the files of the dates
+        rollups_collection: The collection of the rollups"""
+
+    for filename in os.listdir(f"{folder}"):
+        # Only the fields used by the rollups, without copying the graph
+        links = []
+        for u, v, data in graph.edges(data=True):
+            date_info = data['dates'][filename]
+            links.append({
+                "name": data.get('name'),
+                "highway": data.get('highway'),
+                "traffic_level": date_info['traffic_level'],
+                "current_speed": float(data['maxspeed']) * float(date_info['traffic_level']),
+                "api_data": date_info['api_data']
+            })
+
+        snapshot_datetime = datetime.strptime(filename.split(".")[0], "%Y_%m_%d_%H_%M_%S")
+        update_rollups(rollups_collection, {"datetime": snapshot_datetime, "links": links})
+        print(f"Updated the rollups with the traffic level from {filename}\n\n")
+
+
+def save_compact_graphs_from_folder_mongo(graph, folder, collection, edge_orders_collection, keyframe_interval=8,
+                                          dtype="uint8"):
+    """ Save in the database one compact snapshot for each date (filename) of the folder. The traffic level is
+    quantised, and only every 'keyframe_interval' snapshots are saved complete (the rest only save the changed edges)
+    Args:
+        graph: The graph with the traffic level of the dates already added
+        folder: The folder with the files of the dates
+        collection: The collection where the compact snapshots are saved
+        edge_orders_collection: The collection where the static information of the links is saved
+        keyframe_interval: The amount of snapshots between two keyframes
+        dtype: The type used to quantise the traffic level ('uint8' or 'uint16')"""
+
+    maxspeeds = [float(data['maxspeed']) for u, v, data in graph.edges(data=True)]
+
+    edge_order_id = None
+    keyframe_filename = None
+    previous_quantized = None
+
+    # The deltas are computed from the previous date, so the files are saved in chronological order
+    for i, filename in enumerate(sorted(os.listdir(f"{folder}"))):
+        with instrumentation.snapshot(filename) as snapshot_info:
+            graph_to_dictionary = __prepare_graph_date_before_saving_mongo(graph, filename)
+
+            if edge_order_id is None:
+                edge_order = create_edge_order(graph_to_dictionary["links"], maxspeeds)
+                edge_order_id = edge_order["_id"]
+                upsert_data(edge_orders_collection, {"_id": edge_order_id}, edge_order)
+
+            if i % keyframe_interval == 0:
+                previous_quantized = None
+                keyframe_filename = filename
+
+            compact_document, previous_quantized = encode_snapshot(graph_to_dictionary, edge_order_id,
+                                                                   previous_quantized=previous_quantized,
+                                                                   keyframe_filename=keyframe_filename,
+                                                                   chain_index=i % keyframe_interval,
+                                                                   dtype=dtype)
+            insert_data(collection, compact_document)
+
+            snapshot_info["items"] = len(graph_to_dictionary["links"])
+            print(f"Saved compact graph with traffic level from {filename} to MongoDB\n\n")
 
 
 def __prepare_graph_date_before_saving_mongo(graph, filename):
@@ -466,6 +562,10 @@ def __prepare_graph_date_before_saving_mongo(graph, filename):
     graph_to_dictionary["minute_int"] = graph_to_dictionary["datetime"].minute
     graph_to_dictionary["day_of_week"] = graph_to_dictionary["datetime"].strftime("%A")
 
+    # Integer fields, so the time filters of the dashboard are ranges that can use an index (0 is Monday)
+    graph_to_dictionary["minute_of_day"] = graph_to_dictionary["hour_int"] * 60 + graph_to_dictionary["minute_int"]
+    graph_to_dictionary["weekday_int"] = graph_to_dictionary["datetime"].weekday()
+
     # Calculamos el valor flotante de la hora
     graph_to_dictionary["hour_float"] = graph_to_dictionary["hour_int"] + (graph_to_dictionary["minute_int"] / 60.0)
 
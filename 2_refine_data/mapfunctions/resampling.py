@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import instrumentation.recorder as instrumentation
+from update_data_mongo.compact import get_compact_snapshot_links
+from update_data_mongo.mongo import upsert_data
+
+# Origin of the slot numbers (slot 0 starts at this datetime)
+SLOT_ORIGIN = datetime(1970, 1, 1)
+
+
+def get_datetime_from_filename(filename):
+    return datetime.strptime(filename.split(".")[0], "%Y_%m_%d_%H_%M_%S")
+
+
+def get_slot_from_datetime(date, slot_minutes=15):
+    """ Get the number of the slot that contains the given datetime
+    Args:
+        date: The datetime
+        slot_minutes: The minutes of each slot
+    Returns:
+        The number of the slot (the same datetime always has the same slot number)"""
+
+    return int((date - SLOT_ORIGIN).total_seconds() // (slot_minutes * 60))
+
+
+def get_datetime_from_slot(slot, slot_minutes=15):
+    return SLOT_ORIGIN + timedelta(minutes=slot * slot_minutes)
+
+
+def get_snapshots_matrix(graph, attribute="traffic_level"):
+    """ Get the values of an attribute of every edge and every date (filename) of the graph as a matrix
+    Args:
+        graph: The graph with the dates added by 'add_traffic_level_from_folder'
+        attribute: The attribute of the dates to get
+    Returns:
+        The list of edges (rows), the list of filenames (columns) sorted by datetime, the array with the minutes of
+        each filename since 'SLOT_ORIGIN' and the matrix (NaN when the edge has no value)"""
+
+    filenames = set()
+    for u, v, data in graph.edges(data=True):
+        filenames.update(data["dates"].keys())
+
+    filenames = sorted(filenames, key=get_datetime_from_filename)
+    minutes = np.array([(get_datetime_from_filename(filename) - SLOT_ORIGIN).total_seconds() / 60
+                        for filename in filenames])
+
+    edges = []
+    matrix = np.empty((graph.number_of_edges(), len(filenames)))
+
+    # One row per edge, the missing dates (and the None values) are NaN
+    for i, (u, v, key, data) in enumerate(graph.edges(keys=True, data=True)):
+        edges.append((u, v, key))
+
+        dates = data["dates"]
+        matrix[i] = np.fromiter((dates.get(filename, {}).get(attribute) for filename in filenames), dtype=np.float64,
+                                count=len(filenames))
+
+    return edges, filenames, minutes, matrix
+
+
+def get_previous_snapshot(db, before, max_gap_minutes=60):
+    """ Get the last snapshot saved before a datetime (by a previous run), if it is at most 'max_gap_minutes' before it
+    Args:
+        db: The database
+        before: The datetime of the first snapshot of the run
+        max_gap_minutes: The maximum minutes between two snapshots to interpolate the slots between them
+    Returns:
+        The filename of the snapshot and its links ('graphs' or 'compact_graphs'), or None if there is no snapshot"""
+
+    query = {"datetime": {"$lt": before, "$gte": before - timedelta(minutes=max_gap_minutes)}}
+    document = db["graphs"].find_one(query, {"filename": 1, "datetime": 1, "links.source": 1, "links.target": 1,
+                                             "links.key": 1, "links.traffic_level": 1}, sort=[("datetime", -1)])
+    compact_document = db["compact_graphs"].find_one(query, sort=[("datetime", -1)])
+
+    # The compact snapshot is used when both collections have the last snapshot (older runs saved both)
+    if compact_document is not None and (document is None or compact_document["datetime"] >= document["datetime"]):
+        return compact_document["filename"], get_compact_snapshot_links(db, compact_document)
+    if document is not None:
+        return document["filename"], document["links"]
+
+    return None
+
+
+def add_previous_snapshot(edges, filenames, minutes, matrix, previous_snapshot, attribute="traffic_level"):
+    """ Add the last snapshot of a previous run as the first column of the matrix of 'get_snapshots_matrix'
+    Args:
+        edges: The list of edges (rows)
+        filenames: The list of filenames (columns)
+        minutes: The array with the minutes of each filename since 'SLOT_ORIGIN'
+        matrix: The matrix (edges x filenames)
+        previous_snapshot: The filename and the links of the snapshot (see 'get_previous_snapshot')
+        attribute: The attribute of the links to get
+    Returns:
+        The filenames, minutes and matrix with the snapshot first (the edges that are not in the snapshot are NaN)"""
+
+    filename, links = previous_snapshot
+    values = {(link["source"], link["target"], link.get("key", 0)): link.get(attribute) for link in links}
+    column = np.fromiter((values.get(edge) for edge in edges), dtype=np.float64, count=len(edges))
+
+    snapshot_minutes = (get_datetime_from_filename(filename) - SLOT_ORIGIN).total_seconds() / 60
+
+    return [filename] + filenames, np.concatenate([[snapshot_minutes], minutes]), \
+        np.column_stack([column, matrix])
+
+
+def resample_matrix(minutes, matrix, slot_minutes=15, max_gap_minutes=60):
+    """ Resample the columns of the matrix (snapshots at irregular times) onto a regular grid of slots.
+    The value of each slot is linearly interpolated between the previous and the next snapshot. If they are more than
+    'max_gap_minutes' apart, the slot is flagged as a gap and its values are NaN
+    Args:
+        minutes: The sorted array with the minutes of each snapshot (column)
+        matrix: The matrix with the values (edges x snapshots)
+        slot_minutes: The minutes of each slot
+        max_gap_minutes: The maximum minutes between two snapshots to interpolate the slots between them
+    Returns:
+        The array of slot numbers, the resampled matrix (edges x slots), the array with the gap flag of each slot,
+        the indexes of the previous and next snapshot of each slot and the minutes to the nearest snapshot"""
+
+    first_slot = int(np.ceil(minutes[0] / slot_minutes))
+    last_slot = int(np.floor(minutes[-1] / slot_minutes))
+    slots = np.arange(first_slot, last_slot + 1)
+    slot_times = slots * slot_minutes
+
+    # First snapshot at (or after) each slot, and the snapshot before it
+    next_index = np.clip(np.searchsorted(minutes, slot_times, side="left"), 0, len(minutes) - 1)
+    exact = minutes[next_index] == slot_times
+    previous_index = np.where(exact, next_index, np.clip(next_index - 1, 0, len(minutes) - 1))
+
+    span = minutes[next_index] - minutes[previous_index]
+    weights = np.divide(slot_times - minutes[previous_index], span, out=np.zeros(len(slots)), where=span > 0)
+
+    resampled = matrix[:, previous_index] * (1 - weights) + matrix[:, next_index] * weights
+
+    gaps = span > max_gap_minutes
+    resampled[:, gaps] = np.nan
+
+    distance = np.minimum(slot_times - minutes[previous_index], minutes[next_index] - slot_times)
+
+    return slots, resampled, gaps, previous_index, next_index, distance
+
+
+def resample_graph(graph, slot_minutes=15, max_gap_minutes=60, db=None):
+    """ Resample the traffic level of every edge of the graph onto a regular grid of slots. Only the slots between the
+    first and the last date of the graph are generated, or from the last snapshot of the previous run if it is at most
+    'max_gap_minutes' before the first date, so the grid continues the one of the previous run
+    Args:
+        graph: The graph with the dates added by 'add_traffic_level_from_folder'
+        slot_minutes: The minutes of each slot (15 or 30)
+        max_gap_minutes: The maximum minutes between two snapshots to interpolate the slots between them
+        db: The database with the snapshots of the previous runs (None to only use the dates of the graph)
+    Returns:
+        A list with one document per slot, with the same link fields as the documents of the 'graphs' collection"""
+
+    edges, filenames, minutes, matrix = get_snapshots_matrix(graph)
+    if len(filenames) == 0:
+        return []
+
+    if db is not None:
+        previous_snapshot = get_previous_snapshot(db, get_datetime_from_filename(filenames[0]), max_gap_minutes)
+        if previous_snapshot is not None:
+            filenames, minutes, matrix = add_previous_snapshot(edges, filenames, minutes, matrix, previous_snapshot)
+
+    slots, resampled, gaps, previous_index, next_index, distance = resample_matrix(minutes, matrix, slot_minutes,
+                                                                                   max_gap_minutes)
+
+    maxspeeds = np.array([float(graph.edges[edge]["maxspeed"]) for edge in edges])
+    current_speeds = resampled * maxspeeds[:, np.newaxis]
+
+    links_info = [
+        {
+            "source": u,
+            "target": v,
+            "key": key,
+            "osmid": graph.edges[u, v, key].get("osmid"),
+            "name": graph.edges[u, v, key].get("name"),
+            "highway": graph.edges[u, v, key].get("highway")
+        }
+        for u, v, key in edges
+    ]
+
+    documents = []
+    for j, slot in enumerate(slots):
+        slot_datetime = get_datetime_from_slot(int(slot), slot_minutes)
+
+        document = {
+            "slot": int(slot),
+            "slot_minutes": slot_minutes,
+            "slot_of_day": (slot_datetime.hour * 60 + slot_datetime.minute) // slot_minutes,
+            "datetime": slot_datetime,
+            "hour_minute_string": slot_datetime.strftime("%H:%M"),
+            "day_of_week": slot_datetime.strftime("%A"),
+            "minute_of_day": slot_datetime.hour * 60 + slot_datetime.minute,
+            "weekday_int": slot_datetime.weekday(),
+            "gap": bool(gaps[j]),
+            "previous_filename": filenames[previous_index[j]],
+            "next_filename": filenames[next_index[j]],
+            "minutes_to_nearest_snapshot": float(distance[j])
+        }
+
+        # The gaps are saved without links, so the dashboards know that there is no data for the slot
+        if not gaps[j]:
+            traffic_levels = resampled[:, j]
+            speeds = current_speeds[:, j]
+            document["links"] = [
+                {
+                    **link_info,
+                    "traffic_level": None if np.isnan(traffic_levels[i]) else float(traffic_levels[i]),
+                    "current_speed": None if np.isnan(speeds[i]) else float(speeds[i])
+                }
+                for i, link_info in enumerate(links_info)
+            ]
+
+        documents.append(document)
+
+    instrumentation.annotate(slots=len(documents), gaps=int(gaps.sum()))
+
+    return documents
+
+
+def save_resampled_graphs_mongo(graph, collection, slot_minutes=15, max_gap_minutes=60, db=None):
+    """ Resample the graph and save one document per slot in the database. The slots already saved are replaced
+    Args:
+        graph: The graph with the dates added by 'add_traffic_level_from_folder'
+        collection: The collection where the slots are saved
+        slot_minutes: The minutes of each slot (15 or 30)
+        max_gap_minutes: The maximum minutes between two snapshots to interpolate the slots between them
+        db: The database with the snapshots of the previous runs (None to only use the dates of the graph)
+    Returns:
+        The amount of saved slots"""
+
+    documents = resample_graph(graph, slot_minutes=slot_minutes, max_gap_minutes=max_gap_minutes, db=db)
+
+    for document in documents:
+        upsert_data(collection, {"slot": document["slot"], "slot_minutes": slot_minutes}, document)
+
+    print(f"Saved {len(documents)} slots of {slot_minutes} minutes "
+          f"({sum(document['gap'] for document in documents)} gaps) to MongoDB\n\n")
+
+    return len(documents)
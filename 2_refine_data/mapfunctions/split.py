@@ -6,6 +6,7 @@ import shapely
 import geojson
 
 from mapfunctions.utils import skip_feature
+import instrumentation.recorder as instrumentation
 
 
 def split_features(geojson_file,
@@ -98,11 +99,14 @@ def split_line_with_two_points_in_parts(line, parts, format_geojson=False):
 def split_features_from_folder(folder_input, folder_output):
     # Read the files in the folder
     for filename in os.listdir(f"{folder_input}"):
-        with open(f"{folder_input}/{filename}") as f:
-            split_data = split_features(f)
+        with instrumentation.snapshot(filename) as snapshot_info:
+            with open(f"{folder_input}/{filename}") as f:
+                split_data = split_features(f)
 
-        with open(f"{folder_output}/{filename}", "w") as output_file:
-            geojson.dump(split_data, output_file)
+            with open(f"{folder_output}/{filename}", "w") as output_file:
+                geojson.dump(split_data, output_file)
+
+            snapshot_info["items"] = len(split_data["features"])
 
         print(f"File '{filename}' splitted and saved on '{folder_output}'")
 
@@ -1,6 +1,7 @@
 import json
 import os
 from mapfunctions.utils import normalize, get_geojson_corners_coordinates
+import instrumentation.recorder as instrumentation
 
 
 def create_multilinestring_geojson(coordinates, properties):
@@ -143,13 +144,14 @@ def translate_all_files_pairs(dirname_input, outmin, outmax, dirname_output):
 
         number_of_files += 1
 
-        with open(f"{dirname_output}/{filename}", "w") as output_file:
-            output_file.write(
-                json.dumps(
-                    translate_file_pairs_into_geojson(dirname_input, filename, outmin, outmax)
-                )
-            )
-            print(f"File '{filename}' translated and saved on '{dirname_output}'")
+        with instrumentation.snapshot(filename) as snapshot_info:
+            translation = translate_file_pairs_into_geojson(dirname_input, filename, outmin, outmax)
+            snapshot_info["items"] = len(translation["features"])
+
+            with open(f"{dirname_output}/{filename}", "w") as output_file:
+                output_file.write(json.dumps(translation))
+                print(f"File '{filename}' translated and saved on '{dirname_output}'")
+
 
 def mix_tiles_from_two_folder(folder_names):
     """ Mix the files from the first two folders into the third one
@@ -157,7 +159,7 @@ def mix_tiles_from_two_folder(folder_names):
         folder_names: A list with the names of the folders"""
 
     for file in os.listdir(f"{folder_names[0]}"):
-        with open(f"{folder_names[0]}/{file}") as file1:
+        with instrumentation.snapshot(file) as snapshot_info, open(f"{folder_names[0]}/{file}") as file1:
             json1 = json.load(file1)
 
             if file in os.listdir(f"{folder_names[1]}"):
@@ -170,6 +172,8 @@ def mix_tiles_from_two_folder(folder_names):
                     output_file.write(json.dumps(json1))
                     print(f"File '{file}' mixed and saved on '{folder_names[2]}'")
 
+            snapshot_info["items"] = len(json1["features"])
+
 
 if __name__ == "__main__":
     x_tile = 7988
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 
 def get_geojson_corners_coordinates(x_tile, y_tile, zoom, format="latlng"):
     """ Get the coordinates of the corners of a tile in the GeoJSON format
@@ -83,6 +85,27 @@ def float_to_hex_color(value):
     return hex_color
 
 
+def floats_to_hex_colors(values):
+    """ Convert a list of floats between 0 and 1 to the hex colors of 'float_to_hex_color' in one call
+    Args:
+        values: The list of floats (None is shown as green, as NaN)
+    Returns:
+        The list of hex colors"""
+
+    values = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    # Clamp the values to the range [0, 1] (NaN is 1, as with max(0, min(1, value)))
+    values = np.where(np.isnan(values), 1.0, np.clip(values, 0, 1))
+
+    # Interpolate between red and orange below 0.5, and between orange and green above
+    low = values < 0.5
+    ratio = np.where(low, values / 0.5, (values - 0.5) / 0.5)
+    r = np.where(low, 255, 255 - 255 * ratio).astype(np.int64)
+    g = np.where(low, 0 + ratio * 165, 165 + ratio * 90).astype(np.int64)
+
+    return [f'#{color:06X}' for color in ((r << 16) | (g << 8)).tolist()]
+
+
 def are_opposite_bearings(bearing_1, bearing_2, tolerance=45):
     """ Check if two bearings are opposite to each other
     Args:
@@ -0,0 +1,18 @@
+from benchmarks.pipeline_benchmark import run_pipeline_benchmark, print_benchmark_report, save_benchmark_report
+
+if __name__ == "__main__":
+    # SCALE OF THE SYNTHETIC DATA
+    amount_of_tiles = 2
+    features_per_tile = 50
+    snapshots = 4
+
+    # Use 'graph_output/base_graph.graphml' to run the benchmark over the real road graph
+    cached_graph = None
+
+    report = run_pipeline_benchmark(amount_of_tiles=amount_of_tiles,
+                                    features_per_tile=features_per_tile,
+                                    snapshots=snapshots,
+                                    cached_graph=cached_graph)
+
+    print_benchmark_report(report)
+    print(f"Benchmark saved on '{save_benchmark_report(report)}'")
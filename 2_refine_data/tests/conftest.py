@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the modules as the pipeline does (from the folder of 'main.py')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from update_data_mongo.compact import quantize, dequantize, get_quantization_scale, create_edge_order, \
+    encode_snapshot, decode_traffic_levels, decode_links
+
+
+def make_snapshot(filename, traffic_levels, api_data):
+    links = [{"source": i, "target": i + 1, "key": 0, "name": f"Street {i}", "highway": "primary",
+              "traffic_level": traffic_level, "current_speed": None if traffic_level is None else traffic_level * 50,
+              "api_data": api_data[i]}
+             for i, traffic_level in enumerate(traffic_levels)]
+    return {"filename": filename, "datetime": None, "links": links}
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16"])
+def test_quantize_round_trip(dtype):
+    values = np.array([0, 0.25, 0.5, 0.999, 1, np.nan])
+
+    quantized = quantize(values, dtype)
+    restored = dequantize(quantized, dtype)
+
+    assert quantized.dtype == np.dtype(dtype)
+    assert np.isnan(restored[-1])
+    assert np.allclose(restored[:-1], values[:-1], atol=0.5 / get_quantization_scale(dtype))
+
+
+def test_quantize_clips_and_reserves_the_empty_value():
+    quantized = quantize([-0.5, 1.5, None])
+
+    assert quantized.tolist() == [0, get_quantization_scale(), get_quantization_scale() + 1]
+
+
+def test_encode_decode_chain():
+    snapshots = [
+        make_snapshot("a", [0.1, 0.5, None, 1.0], [True, False, True, False]),
+        make_snapshot("b", [0.1, 0.6, None, 1.0], [True, True, True, False]),
+        make_snapshot("c", [None, 0.6, 0.3, 0.0], [False, True, True, False]),
+    ]
+    maxspeeds = [50, 50, 50, 50]
+    edge_order = create_edge_order(snapshots[0]["links"], maxspeeds)
+
+    previous = None
+    for chain_index, snapshot in enumerate(snapshots):
+        compact_document, quantized = encode_snapshot(snapshot, edge_order["_id"], previous_quantized=previous,
+                                                      keyframe_filename="a", chain_index=chain_index)
+        assert compact_document["keyframe"] == (chain_index == 0)
+        assert compact_document["keyframe_filename"] == "a"
+
+        decoded = decode_traffic_levels(compact_document, previous)
+        assert np.array_equal(decoded, quantized)
+
+        links = decode_links(edge_order, compact_document, decoded)
+        for link, original in zip(links, snapshot["links"]):
+            assert link["api_data"] == original["api_data"]
+            if original["traffic_level"] is None:
+                assert link["traffic_level"] is None and link["current_speed"] is None
+            else:
+                assert link["traffic_level"] == pytest.approx(original["traffic_level"], abs=1 / 254)
+                assert link["current_speed"] == pytest.approx(link["traffic_level"] * 50)
+        previous = decoded
+
+
+def test_delta_only_saves_the_changed_edges():
+    edge_order = create_edge_order(make_snapshot("a", [0.1, 0.5], [True, True])["links"], [50, 50])
+    _, keyframe = encode_snapshot(make_snapshot("a", [0.1, 0.5], [True, True]), edge_order["_id"])
+
+    delta, _ = encode_snapshot(make_snapshot("b", [0.1, 0.7], [True, True]), edge_order["_id"],
+                               previous_quantized=keyframe, keyframe_filename="a", chain_index=1)
+
+    assert np.frombuffer(delta["changed_indexes"], dtype=np.uint32).tolist() == [1]
+    assert "traffic_level" not in delta
+
+
+def test_edge_order_ignores_the_dynamic_fields():
+    first = create_edge_order(make_snapshot("a", [0.1, 0.5], [True, False])["links"], [50, 30])
+    second = create_edge_order(make_snapshot("b", [0.9, None], [False, True])["links"], [50, 30])
+
+    assert first["_id"] == second["_id"]
+    assert "traffic_level" not in first["links"][0]
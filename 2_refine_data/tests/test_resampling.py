@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import networkx as nx
+import numpy as np
+
+from mapfunctions.resampling import resample_matrix, get_slot_from_datetime, get_datetime_from_slot, \
+    get_snapshots_matrix, add_previous_snapshot
+
+
+def test_slot_round_trip():
+    date = datetime(2024, 5, 6, 10, 37)
+
+    slot = get_slot_from_datetime(date)
+
+    assert get_datetime_from_slot(slot) == datetime(2024, 5, 6, 10, 30)
+    assert get_slot_from_datetime(date, slot_minutes=30) * 2 == slot
+
+
+def test_resample_interpolates_between_snapshots():
+    minutes = np.array([0.0, 10.0, 40.0])
+    matrix = np.array([[0.0, 1.0, 0.4],
+                       [np.nan, 0.5, 0.5]])
+
+    slots, resampled, gaps, previous_index, next_index, distance = resample_matrix(minutes, matrix)
+
+    assert slots.tolist() == [0, 1, 2]
+    assert not gaps.any()
+    # Slot 15 is between 10 (1.0) and 40 (0.4), and slot 30 is two thirds of the way
+    assert np.allclose(resampled[0], [0.0, 0.9, 0.6])
+    assert np.isnan(resampled[1, 0]) and np.allclose(resampled[1, 1:], [0.5, 0.5])
+    assert previous_index.tolist() == [0, 1, 1]
+    assert next_index.tolist() == [0, 2, 2]
+    assert distance.tolist() == [0, 5, 10]
+
+
+def test_resample_flags_the_gaps():
+    minutes = np.array([0.0, 15.0, 120.0])
+    matrix = np.array([[0.2, 0.4, 0.8]])
+
+    slots, resampled, gaps, _, _, _ = resample_matrix(minutes, matrix, max_gap_minutes=60)
+
+    assert len(slots) == 9
+    assert gaps.tolist() == [False, False] + [True] * 6 + [False]
+    assert np.isnan(resampled[0, gaps]).all()
+    assert resampled[0, -1] == 0.8
+
+
+def test_resample_starts_at_the_first_whole_slot():
+    minutes = np.array([7.0, 37.0])
+    matrix = np.array([[0.0, 0.3]])
+
+    slots, resampled, _, _, _, _ = resample_matrix(minutes, matrix, slot_minutes=15)
+
+    assert slots.tolist() == [1, 2]
+    assert np.allclose(resampled[0], [0.08, 0.23])
+
+
+def test_snapshots_matrix_sorted_by_datetime():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(1, 2, 0, dates={"2024_05_06_10_20_00.json": {"traffic_level": 0.4},
+                                   "2024_05_06_10_00_00.json": {"traffic_level": 0.2}})
+    graph.add_edge(2, 3, 0, dates={"2024_05_06_10_20_00.json": {"traffic_level": None}})
+
+    edges, filenames, minutes, matrix = get_snapshots_matrix(graph)
+
+    assert edges == [(1, 2, 0), (2, 3, 0)]
+    assert filenames == ["2024_05_06_10_00_00.json", "2024_05_06_10_20_00.json"]
+    assert (minutes[1] - minutes[0]) == 20
+    # The missing dates and the None values are NaN
+    assert matrix[0].tolist() == [0.2, 0.4]
+    assert np.isnan(matrix[1]).all()
+
+
+def test_previous_snapshot_is_the_first_column():
+    edges = [(1, 2, 0), (2, 3, 0)]
+    filenames = ["1970_01_01_01_40_00.json"]
+    minutes = np.array([100.0])
+    matrix = np.array([[0.2], [0.4]])
+    # The links of the previous run only have the first edge
+    previous_snapshot = ("1970_01_01_01_30_00.json", [{"source": 1, "target": 2, "key": 0, "traffic_level": 0.8}])
+
+    filenames, minutes, matrix = add_previous_snapshot(edges, filenames, minutes, matrix, previous_snapshot)
+
+    assert filenames == ["1970_01_01_01_30_00.json", "1970_01_01_01_40_00.json"]
+    assert minutes.tolist() == [90.0, 100.0]
+    assert matrix[0].tolist() == [0.8, 0.2]
+    assert np.isnan(matrix[1, 0]) and matrix[1, 1] == 0.4
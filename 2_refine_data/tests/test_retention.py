@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from update_data_mongo.retention import compact_snapshots, merge_compacted
+
+
+def make_snapshot(minute, traffic_levels, api_data):
+    date = datetime(2024, 5, 6, 10, minute)
+    links = [{"source": i, "target": i + 1, "key": 0, "name": "Calle Larios", "highway": "primary",
+              "traffic_level": traffic_level, "current_speed": None if traffic_level is None else traffic_level * 50,
+              "api_data": api_data[i]}
+             for i, traffic_level in enumerate(traffic_levels) if traffic_level != "missing"]
+    return {"filename": date.strftime("%Y_%m_%d_%H_%M_%S") + ".json", "datetime": date, "links": links}
+
+
+def test_compacted_links_count_every_link():
+    documents = [make_snapshot(0, [0.5, None], [True, False]), make_snapshot(10, [0.25, "missing"], [False, False])]
+
+    compacted = compact_snapshots(documents, datetime(2024, 5, 6, 10, 0))
+
+    first, second = compacted["links"]
+    # 'links' counts the snapshots with the link, 'count' only the ones with traffic level
+    assert (first["links"], first["count"], first["api_count"]) == (2, 2, 1)
+    assert (second["links"], second["count"], second["api_count"]) == (1, 0, 0)
+    assert first["traffic_level_sum"] == 0.75 and second["traffic_level_min"] is None
+    assert compacted["filenames"] == [document["filename"] for document in documents]
+
+
+def test_merge_compacted_documents():
+    existing = compact_snapshots([make_snapshot(0, [0.5, None], [True, False])], datetime(2024, 5, 6, 10, 0))
+    new = compact_snapshots([make_snapshot(20, [1.0, 0.5], [True, True])], datetime(2024, 5, 6, 10, 0))
+
+    # The documents compacted before 'links' existed use 'count'
+    del existing["links"][0]["links"]
+    merged = merge_compacted(existing, new)
+
+    first, second = merged["links"]
+    assert (first["links"], first["count"], first["traffic_level_max"]) == (2, 2, 1.0)
+    assert (second["links"], second["count"], second["traffic_level_min"]) == (2, 1, 0.5)
+    assert merged["snapshots"] == 2
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from bson.binary import Binary
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'full' saves one document with every link per snapshot in 'graphs'. 'compact' only saves the snapshots in
+# 'compact_graphs': the traffic level quantised, a keyframe every KEYFRAME_INTERVAL snapshots and only the changed
+# edges in the snapshots between them
+GRAPHS_STORAGE_MODE = os.getenv("GRAPHS_STORAGE_MODE", "full")
+KEYFRAME_INTERVAL = int(os.getenv("KEYFRAME_INTERVAL", 8))
+QUANTIZATION_DTYPE = os.getenv("QUANTIZATION_DTYPE", "uint8")
+
+# Fields of the links that change between snapshots, the rest are saved once in 'edge_orders'
+DYNAMIC_LINK_FIELDS = ["traffic_level", "api_data", "current_speed"]
+
+
+def get_quantization_scale(dtype="uint8"):
+    # The maximum value of the type is reserved for the edges without traffic level
+    return int(np.iinfo(dtype).max) - 1
+
+
+def quantize(values, dtype="uint8"):
+    """ Quantise relative traffic levels (between 0 and 1) to integers
+    Args:
+        values: A list or array with the traffic levels (None or NaN if there is no traffic level)
+        dtype: 'uint8' (steps of 1/254) or 'uint16' (steps of 1/65534)
+    Returns:
+        The array of quantised traffic levels"""
+
+    scale = get_quantization_scale(dtype)
+    values = np.array(values, dtype=np.float64)
+    empty = np.isnan(values)
+
+    quantized = np.rint(np.clip(np.nan_to_num(values), 0, 1) * scale)
+    quantized[empty] = scale + 1
+
+    return quantized.astype(dtype)
+
+
+def dequantize(quantized, dtype="uint8"):
+    scale = get_quantization_scale(dtype)
+    values = quantized.astype(np.float64) / scale
+    values[quantized == scale + 1] = np.nan
+
+    return values
+
+
+def create_edge_order(links, maxspeeds):
+    """ Create the document with the static information of the links, in the order used by the compact snapshots
+    Args:
+        links: The links of a snapshot (as saved in the 'graphs' collection)
+        maxspeeds: The maxspeed of each link (used to rebuild 'current_speed')
+    Returns:
+        The document of the edge order (its '_id' is a hash of the links, so it is only saved once)"""
+
+    static_links = [{key: value for key, value in link.items() if key not in DYNAMIC_LINK_FIELDS} for link in links]
+    edge_order_id = hashlib.sha1(json.dumps([static_links, maxspeeds], sort_keys=True, default=str)
+                                 .encode()).hexdigest()
+
+    return {"_id": edge_order_id, "links": static_links, "maxspeeds": [float(speed) for speed in maxspeeds]}
+
+
+def encode_snapshot(document, edge_order_id, previous_quantized=None, keyframe_filename=None, chain_index=0,
+                    dtype="uint8"):
+    """ Encode a snapshot of the 'graphs' collection as a keyframe (if there is no previous snapshot) or as a delta
+    Args:
+        document: The snapshot (as saved in the 'graphs' collection)
+        edge_order_id: The '_id' of the edge order of the links
+        previous_quantized: The quantised traffic levels of the previous snapshot of the chain (None for a keyframe)
+        keyframe_filename: The filename of the keyframe of the chain
+        chain_index: The position of the snapshot in the chain (0 for the keyframe)
+        dtype: The type used to quantise the traffic levels
+    Returns:
+        The compact document and the quantised traffic levels of the snapshot"""
+
+    links = document["links"]
+    quantized = quantize([link["traffic_level"] for link in links], dtype)
+    api_data = np.array([bool(link["api_data"]) for link in links])
+
+    compact_document = {key: value for key, value in document.items() if key not in ["links", "_id"]}
+    compact_document.update({
+        "edge_order": edge_order_id,
+        "dtype": dtype,
+        "keyframe": previous_quantized is None,
+        "keyframe_filename": document["filename"] if previous_quantized is None else keyframe_filename,
+        "chain_index": chain_index,
+        "api_data": Binary(np.packbits(api_data).tobytes()),
+    })
+
+    if previous_quantized is None:
+        compact_document["traffic_level"] = Binary(quantized.tobytes())
+    else:
+        changed_indexes = np.flatnonzero(quantized != previous_quantized).astype(np.uint32)
+        compact_document["changed_indexes"] = Binary(changed_indexes.tobytes())
+        compact_document["changed_values"] = Binary(quantized[changed_indexes].tobytes())
+
+    return compact_document, quantized
+
+
+def decode_traffic_levels(compact_document, previous_quantized=None):
+    """ Get the quantised traffic levels of a compact snapshot
+    Args:
+        compact_document: The compact snapshot
+        previous_quantized: The quantised traffic levels of the previous snapshot of the chain (not used for keyframes)
+    Returns:
+        The array of quantised traffic levels"""
+
+    dtype = compact_document["dtype"]
+
+    if compact_document["keyframe"]:
+        return np.frombuffer(compact_document["traffic_level"], dtype=dtype).copy()
+
+    quantized = previous_quantized.copy()
+    changed_indexes = np.frombuffer(compact_document["changed_indexes"], dtype=np.uint32)
+    quantized[changed_indexes] = np.frombuffer(compact_document["changed_values"], dtype=dtype)
+
+    return quantized
+
+
+def decode_links(edge_order, compact_document, quantized):
+    """ Rebuild the links of a compact snapshot, with the same fields as the links of the 'graphs' collection
+    Args:
+        edge_order: The document of the edge order
+        compact_document: The compact snapshot
+        quantized: The quantised traffic levels of the snapshot
+    Returns:
+        The list of links"""
+
+    traffic_levels = dequantize(quantized, compact_document["dtype"])
+    current_speeds = traffic_levels * np.array(edge_order["maxspeeds"])
+    api_data = np.unpackbits(np.frombuffer(compact_document["api_data"], dtype=np.uint8),
+                             count=len(edge_order["links"])).astype(bool)
+
+    empty = np.isnan(traffic_levels)
+    traffic_levels = traffic_levels.tolist()
+    current_speeds = current_speeds.tolist()
+    api_data = api_data.tolist()
+
+    return [
+        {
+            **link,
+            "traffic_level": None if empty[i] else traffic_levels[i],
+            "api_data": api_data[i],
+            "current_speed": None if empty[i] else current_speeds[i]
+        }
+        for i, link in enumerate(edge_order["links"])
+    ]
+
+
+def get_compact_snapshot_links(db, compact_document):
+    """ Rebuild the links of a compact snapshot saved in the database, applying the deltas of its chain from the keyframe
+    Args:
+        db: The database
+        compact_document: The compact snapshot
+    Returns:
+        The list of links"""
+
+    chain = db["compact_graphs"].find({"keyframe_filename": compact_document["keyframe_filename"],
+                                       "chain_index": {"$lte": compact_document["chain_index"]}}) \
+        .sort("chain_index", 1)
+
+    quantized = None
+    for chain_document in chain:
+        quantized = decode_traffic_levels(chain_document, quantized)
+
+    edge_order = db["edge_orders"].find_one({"_id": compact_document["edge_order"]})
+    return decode_links(edge_order, compact_document, quantized)
@@ -17,6 +17,8 @@ def get_files_dictionary_from_folder(path):
         next_file = {"filename_extensions": file, "filename": file.split(".")[0],
                      "datetime": datetime.strptime(file.split(".")[0], "%Y_%m_%d_%H_%M_%S")}
         next_file["day_of_week"] = next_file["datetime"].strftime("%A")
+        next_file["minute_of_day"] = next_file["datetime"].hour * 60 + next_file["datetime"].minute
+        next_file["weekday_int"] = next_file["datetime"].weekday()
 
         available_files.append(next_file)
 
@@ -0,0 +1,90 @@
+from pymongo import ASCENDING, DESCENDING
+
+from update_data_mongo.mongo import get_database
+
+# Collections with the 'minute_of_day' and 'weekday_int' fields, and the fields used to compute them in the backfill
+# (the compacted snapshots and the rollups use the rounded 'hour_int' and 'minute_int', not the ones of 'datetime')
+TIME_FIELDS_SOURCES = {
+    "graphs": ("$hour_int", "$minute_int"),
+    "compact_graphs": ("$hour_int", "$minute_int"),
+    "compacted_graphs": ("$hour_int", "$minute_int"),
+    "rollups": ("$hour_int", "$minute_int"),
+    "dates": ({"$hour": "$datetime"}, {"$minute": "$datetime"}),
+    "resampled_graphs": ({"$hour": "$datetime"}, {"$minute": "$datetime"}),
+}
+
+INDEXES = {
+    "graphs": [
+        [("datetime", ASCENDING), ("minute_of_day", ASCENDING)],
+        [("filename", ASCENDING)],
+    ],
+    "dates": [
+        [("datetime", ASCENDING), ("minute_of_day", ASCENDING)],
+        [("filename", ASCENDING)],
+    ],
+    "compact_graphs": [
+        [("datetime", ASCENDING), ("minute_of_day", ASCENDING)],
+        [("filename", ASCENDING)],
+        [("keyframe_filename", ASCENDING), ("chain_index", ASCENDING)],
+    ],
+    "compacted_graphs": [
+        [("datetime", ASCENDING), ("minute_of_day", ASCENDING)],
+        [("filenames", ASCENDING)],
+    ],
+    "rollups": [
+        [("datetime", ASCENDING), ("group", ASCENDING)],
+        [("datetime", ASCENDING), ("minute_of_day", ASCENDING)],
+    ],
+    "resampled_graphs": [
+        [("slot_minutes", ASCENDING), ("slot", ASCENDING)],
+    ],
+    "ingest_events": [
+        [("ingested", DESCENDING)],
+    ],
+}
+
+
+def backfill_time_fields(db):
+    """ Add 'minute_of_day' and 'weekday_int' (0 is Monday) to the documents saved before these fields existed
+    Args:
+        db: The database
+    Returns:
+        A dictionary with the amount of updated documents of each collection"""
+
+    updated = {}
+    for collection, (hour, minute) in TIME_FIELDS_SOURCES.items():
+        result = db[collection].update_many({"minute_of_day": {"$exists": False}}, [
+            {
+                "$set": {
+                    "minute_of_day": {"$add": [{"$multiply": [hour, 60]}, minute]},
+                    # '$dayOfWeek' is 1 for Sunday, 'weekday_int' is 0 for Monday (as datetime.weekday())
+                    "weekday_int": {"$mod": [{"$add": [{"$dayOfWeek": "$datetime"}, 5]}, 7]}
+                }
+            }
+        ])
+        updated[collection] = result.modified_count
+        print(f"Added the time fields to {result.modified_count} documents of '{collection}'")
+
+    return updated
+
+
+def create_indexes(db):
+    """ Create the indexes used by the dashboards (the existing ones are not created again)
+    Args:
+        db: The database
+    Returns:
+        A dictionary with the names of the indexes of each collection"""
+
+    names = {}
+    for collection, indexes in INDEXES.items():
+        names[collection] = [db[collection].create_index(keys) for keys in indexes]
+        print(f"Indexes of '{collection}': {names[collection]}")
+
+    return names
+
+
+if __name__ == "__main__":
+    database = get_database("TFG")
+
+    backfill_time_fields(database)
+    create_indexes(database)
@@ -1,9 +1,12 @@
 import datetime
+import time
 from pymongo import MongoClient
 import json
 import os
 from dotenv import load_dotenv
 
+import instrumentation.recorder as instrumentation
+
 load_dotenv()
 
 CONNECTION_STRING = os.getenv("CONNECTION_STRING")
@@ -19,12 +22,36 @@ def get_database(database_name="TFG"):
 
 def insert_data(collection, data):
     # Insert data into the collection
+    start = time.perf_counter()
     collection.insert_one(data)
+    instrumentation.record_mongo_write(collection.name, 1, time.perf_counter() - start)
 
 
 def insert_multiple_data(collection, data_list):
     # Insert multiple data into the collection
+    start = time.perf_counter()
     collection.insert_many(data_list)
+    instrumentation.record_mongo_write(collection.name, len(data_list), time.perf_counter() - start)
+
+
+def upsert_data(collection, query, data):
+    # Replace the document that matches the query (or insert it if there is none)
+    start = time.perf_counter()
+    collection.replace_one(query, data, upsert=True)
+    instrumentation.record_mongo_write(collection.name, 1, time.perf_counter() - start)
+
+
+def bulk_update_data(collection, operations):
+    # Run multiple updates (e.g. 'UpdateOne' with upsert) in a single request
+    start = time.perf_counter()
+    collection.bulk_write(operations, ordered=False)
+    instrumentation.record_mongo_write(collection.name, len(operations), time.perf_counter() - start)
+
+
+def insert_ingest_event(db, from_date, to_date, source):
+    # The cache of the data dashboard discards the results of the date ranges that overlap a newer ingest event
+    insert_data(db["ingest_events"], {"from_date": from_date, "to_date": to_date, "source": source,
+                                      "ingested": datetime.datetime.now()})
 
 
 def insert_file(collection, file_path):
@@ -0,0 +1,357 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from dotenv import load_dotenv
+
+import instrumentation.recorder as instrumentation
+from update_data_mongo.compact import decode_traffic_levels, decode_links
+from update_data_mongo.mongo import get_database, upsert_data
+
+load_dotenv()
+
+# Snapshots older than RETENTION_DAYS are compacted into one document per half an hour of each day ('half_hour') or per
+# month, weekday and half an hour slot ('weekday_slot', the snapshots of the same weekday and time of a month are
+# merged). The compacted snapshots are deleted from 'graphs', so the retention is disabled by default (0)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 0))
+RETENTION_GRANULARITY = os.getenv("RETENTION_GRANULARITY", "half_hour")
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Histograms (sketches) used to approximate the median of the compacted snapshots
+TRAFFIC_LEVEL_BINS = 20
+CURRENT_SPEED_BINS = 26
+CURRENT_SPEED_BIN_WIDTH = 5
+
+LINK_STATIC_FIELDS = ["source", "target", "key", "osmid", "name", "highway"]
+
+
+def get_slot_start(date, slot_minutes=30):
+    minutes = (date.hour * 60 + date.minute) // slot_minutes * slot_minutes
+    return datetime(date.year, date.month, date.day) + timedelta(minutes=minutes)
+
+
+def get_month_start(date):
+    return datetime(date.year, date.month, 1)
+
+
+def get_retention_boundary(now=None, retention_days=30, granularity="half_hour"):
+    """ Get the datetime before which the snapshots are compacted (aligned to half an hour or to a month, so the
+    snapshots of a compacted document are never split between both tiers)
+    Args:
+        now: The current datetime (by default, datetime.now())
+        retention_days: The days of raw snapshots that are kept
+        granularity: 'half_hour' or 'weekday_slot'
+    Returns:
+        The retention boundary"""
+
+    if now is None:
+        now = datetime.now()
+
+    boundary = now - timedelta(days=retention_days)
+    if granularity == "weekday_slot":
+        return get_month_start(boundary)
+
+    return get_slot_start(boundary, 30)
+
+
+def __get_link_key(link):
+    return link["source"], link["target"], link.get("key", 0)
+
+
+def __histogram(values, bins, bin_width):
+    # Values outside of the histogram are added to the first or last bin, NaN values are not counted
+    empty = np.isnan(values)
+    indexes = np.clip(np.floor(np.nan_to_num(values) / bin_width), 0, bins - 1).astype(int)
+
+    return np.stack([((indexes == i) & ~empty).sum(axis=0) for i in range(bins)], axis=-1)
+
+
+def __sparse_histogram(counts):
+    # Only the bins with values are saved ('b0', 'b1'...), so MongoDB can sum them with '$sum'
+    return {f"b{i}": int(count) for i, count in enumerate(counts) if count > 0}
+
+
+def compact_snapshots(documents, slot_start, granularity="half_hour"):
+    """ Compact the snapshots of a slot into one document with the partial aggregates of each edge
+    Args:
+        documents: The snapshots of the slot (as saved in the 'graphs' collection)
+        slot_start: The datetime of the start of the slot (the first day of the month for 'weekday_slot')
+        granularity: 'half_hour' or 'weekday_slot'
+    Returns:
+        The compacted document"""
+
+    links_index = {}
+    links_info = []
+    for document in documents:
+        for link in document["links"]:
+            if __get_link_key(link) not in links_index:
+                links_index[__get_link_key(link)] = len(links_info)
+                links_info.append({field: link.get(field) for field in LINK_STATIC_FIELDS})
+
+    traffic_levels = np.full((len(documents), len(links_info)), np.nan)
+    current_speeds = np.full((len(documents), len(links_info)), np.nan)
+    api_data = np.zeros((len(documents), len(links_info)), dtype=bool)
+    present = np.zeros((len(documents), len(links_info)), dtype=bool)
+
+    for i, document in enumerate(documents):
+        for link in document["links"]:
+            j = links_index[__get_link_key(link)]
+            present[i, j] = True
+            if link.get("traffic_level") is not None:
+                traffic_levels[i, j] = link["traffic_level"]
+            if link.get("current_speed") is not None:
+                current_speeds[i, j] = link["current_speed"]
+            api_data[i, j] = bool(link.get("api_data"))
+
+    count = (~np.isnan(traffic_levels)).sum(axis=0)
+    speed_count = (~np.isnan(current_speeds)).sum(axis=0)
+
+    # 'links' counts the snapshots with the link (as '$sum: 1' over the raw links) and 'count' only the ones with
+    # traffic level, used for the means
+    aggregates = {
+        "links": present.sum(axis=0),
+        "count": count,
+        "api_count": api_data.sum(axis=0),
+        "traffic_level_sum": np.nansum(traffic_levels, axis=0),
+        "traffic_level_min": np.where(count > 0, np.fmin.reduce(traffic_levels, axis=0), np.nan),
+        "traffic_level_max": np.where(count > 0, np.fmax.reduce(traffic_levels, axis=0), np.nan),
+        "current_speed_sum": np.nansum(current_speeds, axis=0),
+        "current_speed_min": np.where(speed_count > 0, np.fmin.reduce(current_speeds, axis=0), np.nan),
+        "current_speed_max": np.where(speed_count > 0, np.fmax.reduce(current_speeds, axis=0), np.nan),
+        "traffic_level_hist": __histogram(traffic_levels, TRAFFIC_LEVEL_BINS, 1 / TRAFFIC_LEVEL_BINS),
+        "current_speed_hist": __histogram(current_speeds, CURRENT_SPEED_BINS, CURRENT_SPEED_BIN_WIDTH),
+    }
+
+    links = []
+    for j, link_info in enumerate(links_info):
+        link = dict(link_info)
+        for field, values in aggregates.items():
+            value = values[j]
+            if isinstance(value, np.ndarray):
+                link[field] = __sparse_histogram(value)
+            elif np.isnan(value):
+                link[field] = None
+            else:
+                link[field] = value.item()
+        links.append(link)
+
+    # The time fields are the ones of the first snapshot rounded to the half an hour, so the dashboard queries can
+    # filter and group the compacted documents by half an hour as the raw ones
+    first_datetime = min(document["datetime"] for document in documents)
+    rounded = get_slot_start(first_datetime, 30)
+
+    return {
+        "granularity": granularity,
+        "slot_start": slot_start,
+        "datetime": first_datetime,
+        "last_datetime": max(document["datetime"] for document in documents),
+        "hour_minute_string": rounded.strftime("%H:%M"),
+        "hour_int": rounded.hour,
+        "minute_int": rounded.minute,
+        "day_of_week": first_datetime.strftime("%A"),
+        "hour_float": rounded.hour + rounded.minute / 60.0,
+        "minute_of_day": rounded.hour * 60 + rounded.minute,
+        "weekday_int": first_datetime.weekday(),
+        "snapshots": len(documents),
+        "filenames": [document["filename"] for document in documents],
+        "links": links
+    }
+
+
+def __merge_min(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def __merge_max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def merge_compacted(existing, new):
+    """ Merge two compacted documents of the same slot (e.g. when late snapshots are compacted in a later run)
+    Args:
+        existing: The compacted document already saved
+        new: The new compacted document
+    Returns:
+        The merged document"""
+
+    merged_links = {__get_link_key(link): dict(link) for link in existing["links"]}
+
+    for link in new["links"]:
+        key = __get_link_key(link)
+        if key not in merged_links:
+            merged_links[key] = dict(link)
+            continue
+
+        merged = merged_links[key]
+        # The documents compacted before 'links' existed only have the count of the links with traffic level
+        merged["links"] = merged.get("links", merged["count"]) + link.get("links", link["count"])
+        for field in ["count", "api_count", "traffic_level_sum", "current_speed_sum"]:
+            merged[field] += link[field]
+        for field in ["traffic_level_min", "current_speed_min"]:
+            merged[field] = __merge_min(merged[field], link[field])
+        for field in ["traffic_level_max", "current_speed_max"]:
+            merged[field] = __merge_max(merged[field], link[field])
+        for field in ["traffic_level_hist", "current_speed_hist"]:
+            for bin_name, count in link[field].items():
+                merged[field][bin_name] = merged[field].get(bin_name, 0) + count
+
+    document = dict(new)
+    document["datetime"] = min(existing["datetime"], new["datetime"])
+    document["last_datetime"] = max(existing["last_datetime"], new["last_datetime"])
+    document["snapshots"] = existing["snapshots"] + new["snapshots"]
+    document["filenames"] = existing["filenames"] + new["filenames"]
+    document["links"] = list(merged_links.values())
+
+    return document
+
+
+def __save_compacted_slot(db, compacted, document_ids, slot_key, granularity, collection="graphs"):
+    compacted.update(slot_key)
+
+    query = {"granularity": granularity, **slot_key}
+    existing = db["compacted_graphs"].find_one(query)
+    if existing:
+        compacted = merge_compacted(existing, compacted)
+
+    upsert_data(db["compacted_graphs"], query, compacted)
+
+    # The compact snapshots ('compact_graphs') are kept, so each old snapshot can still be shown
+    if collection == "graphs":
+        db["graphs"].delete_many({"_id": {"$in": document_ids}})
+
+        # The dates of the deleted snapshots are kept, so the dashboards still list them (with the mean of their slot)
+        db["dates"].update_many({"filename": {"$in": [filename.split(".")[0] for filename in compacted["filenames"]]}},
+                                {"$set": {"tier": "compacted"}})
+    else:
+        db[collection].update_many({"_id": {"$in": document_ids}}, {"$set": {"compacted": True}})
+
+    print(f"Compacted {len(document_ids)} snapshots of {slot_key}")
+
+
+def __get_slot_key(date, granularity):
+    if granularity == "weekday_slot":
+        return {"slot_start": get_month_start(date), "weekday": WEEKDAYS[date.weekday()],
+                "slot_of_day": (date.hour * 60 + date.minute) // 30}
+
+    return {"slot_start": get_slot_start(date, 30)}
+
+
+def __compact_documents(db, documents, granularity, collection="graphs"):
+    # The documents are in chronological order, so the slots of each 'slot_start' (half an hour or month) are complete
+    # when the next 'slot_start' begins. Each snapshot is merged into the partial aggregates of its slot when it is
+    # read, so only the aggregates of the open slots are kept in memory
+    slots = {}
+    slot_start = None
+    compacted_slots = 0
+
+    for document in documents:
+        slot_key = __get_slot_key(document["datetime"], granularity)
+
+        if slots and slot_key["slot_start"] != slot_start:
+            for key, (compacted, document_ids) in slots.items():
+                __save_compacted_slot(db, compacted, document_ids, dict(key), granularity, collection)
+            compacted_slots += len(slots)
+            slots = {}
+
+        slot_start = slot_key["slot_start"]
+        key = tuple(slot_key.items())
+        compacted = compact_snapshots([document], slot_start, granularity)
+        if key in slots:
+            slots[key][1].append(document["_id"])
+            slots[key] = (merge_compacted(slots[key][0], compacted), slots[key][1])
+        else:
+            slots[key] = (compacted, [document["_id"]])
+
+    for key, (compacted, document_ids) in slots.items():
+        __save_compacted_slot(db, compacted, document_ids, dict(key), granularity, collection)
+
+    return compacted_slots + len(slots)
+
+
+def __compact_graphs(db, boundary, granularity):
+    # The snapshots are read in chronological order with a single query, so the snapshots of each half an hour (or of
+    # each month, for 'weekday_slot') are consecutive
+    return __compact_documents(db, db["graphs"].find({"datetime": {"$lt": boundary}}).sort("datetime", 1),
+                               granularity)
+
+
+def __read_compact_graphs(db, boundary):
+    # Compact snapshots older than the boundary that are not in 'compacted_graphs' yet, with their links decoded
+    compacted_filenames = set(db["compacted_graphs"].distinct("filenames"))
+    edge_orders = {}
+    quantized_by_keyframe = {}
+
+    for compact_document in db["compact_graphs"].find({"datetime": {"$lt": boundary}, "compacted": {"$ne": True}}) \
+            .sort("datetime", 1):
+        # The chain of the first snapshot is decoded from its keyframe
+        keyframe_filename = compact_document["keyframe_filename"]
+        if not compact_document["keyframe"] and keyframe_filename not in quantized_by_keyframe:
+            chain = db["compact_graphs"].find({"keyframe_filename": keyframe_filename,
+                                               "chain_index": {"$lt": compact_document["chain_index"]}}) \
+                .sort("chain_index", 1)
+            for chain_document in chain:
+                quantized_by_keyframe[keyframe_filename] = decode_traffic_levels(
+                    chain_document, quantized_by_keyframe.get(keyframe_filename))
+
+        quantized = decode_traffic_levels(compact_document, quantized_by_keyframe.get(keyframe_filename))
+        quantized_by_keyframe[keyframe_filename] = quantized
+
+        # The copies of snapshots of 'graphs' were already compacted with them
+        if compact_document["filename"] in compacted_filenames:
+            db["compact_graphs"].update_one({"_id": compact_document["_id"]}, {"$set": {"compacted": True}})
+            continue
+
+        if compact_document["edge_order"] not in edge_orders:
+            edge_orders[compact_document["edge_order"]] = db["edge_orders"].find_one(
+                {"_id": compact_document["edge_order"]})
+
+        yield {**compact_document,
+               "links": decode_links(edge_orders[compact_document["edge_order"]], compact_document, quantized)}
+
+
+def run_retention(db, retention_days=30, granularity="half_hour", now=None):
+    """ Compact the snapshots of the 'graphs' collection older than the retention window into 'compacted_graphs',
+    delete them from 'graphs' and save the new boundary between both tiers in 'retention'. The snapshots only saved in
+    'compact_graphs' are also compacted (they are kept in 'compact_graphs')
+    Args:
+        db: The database
+        retention_days: The days of raw snapshots that are kept
+        granularity: 'half_hour' (one document per half an hour of each day) or 'weekday_slot' (one document per
+            month, weekday and half an hour slot)
+        now: The current datetime (by default, datetime.now())
+    Returns:
+        The retention boundary"""
+
+    boundary = get_retention_boundary(now, retention_days, granularity)
+
+    # The boundary never moves back, the compacted snapshots can not be expanded again
+    previous = db["retention"].find_one({"_id": "graphs"})
+    if previous and previous["boundary"] > boundary:
+        boundary = previous["boundary"]
+
+    compacted_slots = __compact_graphs(db, boundary, granularity)
+    compacted_slots += __compact_documents(db, __read_compact_graphs(db, boundary), granularity, "compact_graphs")
+
+    upsert_data(db["retention"], {"_id": "graphs"},
+                {"_id": "graphs", "boundary": boundary, "granularity": granularity, "updated": datetime.now()})
+
+    instrumentation.annotate(slots=compacted_slots)
+    print(f"Retention boundary: {boundary} ({compacted_slots} slots compacted)\n\n")
+
+    return boundary
+
+
+if __name__ == "__main__":
+    if RETENTION_DAYS > 0:
+        run_retention(get_database("TFG"), retention_days=RETENTION_DAYS, granularity=RETENTION_GRANULARITY)
+    else:
+        print("The retention is disabled, set RETENTION_DAYS in the .env file")
@@ -0,0 +1,173 @@
+import json
+from datetime import datetime
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from update_data_mongo.compact import decode_traffic_levels, decode_links
+from update_data_mongo.indexes import INDEXES
+from update_data_mongo.mongo import get_database, bulk_update_data, upsert_data, insert_ingest_event
+from update_data_mongo.retention import get_slot_start, TRAFFIC_LEVEL_BINS, CURRENT_SPEED_BINS, \
+    CURRENT_SPEED_BIN_WIDTH
+
+
+def __hashable(value):
+    # Some names and highways are lists (edges merged by OSMnx)
+    return tuple(value) if isinstance(value, list) else value
+
+
+def __get_group_key(name, highway):
+    # Canonical key of the street name and highway of a rollup: a filter over the 'name' and 'highway' fields would
+    # also match the rollups whose name or highway is a list that contains the value
+    return json.dumps([name, highway], default=str)
+
+
+def __bin_index(value, bins, bin_width):
+    return int(min(max(np.floor(value / bin_width), 0), bins - 1))
+
+
+def __link_partial_aggregates(link):
+    # The compacted links (retention tier) already have their partial aggregates ('links' is the same as 'count' in
+    # the documents compacted before it existed)
+    if "count" in link:
+        return {**link, "links": link.get("links", link["count"])}
+
+    traffic_level = link.get("traffic_level")
+    current_speed = link.get("current_speed")
+
+    return {
+        "links": 1,
+        "count": 0 if traffic_level is None else 1,
+        "api_count": 1 if link.get("api_data") else 0,
+        "traffic_level_sum": traffic_level or 0,
+        "traffic_level_min": traffic_level,
+        "traffic_level_max": traffic_level,
+        "current_speed_sum": current_speed or 0,
+        "current_speed_min": current_speed,
+        "current_speed_max": current_speed,
+        "traffic_level_hist": {} if traffic_level is None else
+        {f"b{__bin_index(traffic_level, TRAFFIC_LEVEL_BINS, 1 / TRAFFIC_LEVEL_BINS)}": 1},
+        "current_speed_hist": {} if current_speed is None else
+        {f"b{__bin_index(current_speed, CURRENT_SPEED_BINS, CURRENT_SPEED_BIN_WIDTH)}": 1},
+    }
+
+
+def get_rollup_updates(document):
+    """ Get the updates of the rollups (one per street name and highway) with the links of a snapshot
+    Args:
+        document: The snapshot (as saved in the 'graphs' collection) or a compacted document of the retention tier
+    Returns:
+        The list of 'UpdateOne' operations"""
+
+    slot_start = get_slot_start(document["datetime"], 30)
+
+    groups = {}
+    for link in document["links"]:
+        key = (__hashable(link.get("name")), __hashable(link.get("highway")))
+        partial = __link_partial_aggregates(link)
+
+        if key not in groups:
+            groups[key] = {"name": link.get("name"), "highway": link.get("highway"), "inc": {}, "min": {}, "max": {}}
+        group = groups[key]
+
+        for field in ["links", "count", "api_count", "traffic_level_sum", "current_speed_sum"]:
+            group["inc"][field] = group["inc"].get(field, 0) + partial[field]
+        for field in ["traffic_level_hist", "current_speed_hist"]:
+            for bin_name, count in partial[field].items():
+                group["inc"][f"{field}.{bin_name}"] = group["inc"].get(f"{field}.{bin_name}", 0) + count
+        for field in ["traffic_level", "current_speed"]:
+            if partial[f"{field}_min"] is not None:
+                group["min"][f"{field}_min"] = min(group["min"].get(f"{field}_min", partial[f"{field}_min"]),
+                                                   partial[f"{field}_min"])
+                group["max"][f"{field}_max"] = max(group["max"].get(f"{field}_max", partial[f"{field}_max"]),
+                                                   partial[f"{field}_max"])
+
+    updates = []
+    for group in groups.values():
+        update = {
+            "$inc": group["inc"],
+            "$setOnInsert": {
+                "date": datetime(slot_start.year, slot_start.month, slot_start.day),
+                "slot_of_day": (slot_start.hour * 60 + slot_start.minute) // 30,
+                "hour_minute_string": slot_start.strftime("%H:%M"),
+                "hour_int": slot_start.hour,
+                "minute_int": slot_start.minute,
+                "day_of_week": slot_start.strftime("%A"),
+                "minute_of_day": slot_start.hour * 60 + slot_start.minute,
+                "weekday_int": slot_start.weekday(),
+                "name": group["name"],
+                "highway": group["highway"],
+            }
+        }
+        if group["min"]:
+            update["$min"] = group["min"]
+            update["$max"] = group["max"]
+
+        updates.append(UpdateOne({"datetime": slot_start, "group": __get_group_key(group["name"], group["highway"])},
+                                 update, upsert=True))
+
+    return updates
+
+
+def update_rollups(collection, document):
+    """ Add a snapshot to the rollups of its half an hour slot
+    Args:
+        collection: The collection of the rollups
+        document: The snapshot (as saved in the 'graphs' collection)"""
+
+    updates = get_rollup_updates(document)
+    if updates:
+        bulk_update_data(collection, updates)
+
+
+def create_rollups_indexes(collection):
+    for keys in INDEXES["rollups"]:
+        collection.create_index(keys)
+
+
+def rebuild_rollups(db):
+    """ Build the rollups again from every snapshot of the database ('graphs', 'compact_graphs' and
+    'compacted_graphs'), and mark them as complete so the dashboard uses them
+    Args:
+        db: The database"""
+
+    db["rollups"].drop()
+    create_rollups_indexes(db["rollups"])
+
+    for document in db["graphs"].find():
+        update_rollups(db["rollups"], document)
+        print(f"Added {document['filename']} to the rollups")
+
+    for document in db["compacted_graphs"].find():
+        update_rollups(db["rollups"], document)
+        print(f"Added the compacted snapshots of {document['datetime']} to the rollups")
+
+    # The compact snapshots saved with GRAPHS_STORAGE_MODE='compact' are only in 'compact_graphs', but older runs also
+    # saved them in 'graphs' (and 'compacted_graphs' once compacted), so only the ones that are in neither are added
+    added_filenames = set(db["graphs"].distinct("filename")) | set(db["compacted_graphs"].distinct("filenames"))
+
+    # The compact snapshots are decoded in chronological order, so each delta is applied to the previous snapshot
+    edge_orders = {}
+    quantized_by_keyframe = {}
+    for compact_document in db["compact_graphs"].find().sort("datetime", ASCENDING):
+        if compact_document["edge_order"] not in edge_orders:
+            edge_orders[compact_document["edge_order"]] = db["edge_orders"].find_one(
+                {"_id": compact_document["edge_order"]})
+
+        keyframe_filename = compact_document["keyframe_filename"]
+        quantized = decode_traffic_levels(compact_document, quantized_by_keyframe.get(keyframe_filename))
+        quantized_by_keyframe[keyframe_filename] = quantized
+        if compact_document["filename"] in added_filenames:
+            continue
+
+        links = decode_links(edge_orders[compact_document["edge_order"]], compact_document, quantized)
+        update_rollups(db["rollups"], {**compact_document, "links": links})
+        print(f"Added {compact_document['filename']} to the rollups")
+
+    upsert_data(db["rollups_status"], {"_id": "rollups"},
+                {"_id": "rollups", "complete": True, "rebuilt": datetime.now()})
+    insert_ingest_event(db, datetime.min, datetime.max, "rollups")
+
+
+if __name__ == "__main__":
+    rebuild_rollups(get_database("TFG"))
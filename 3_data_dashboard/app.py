@@ -1,25 +1,41 @@
 import json
+from urllib.parse import urlencode
 
 import dash
 import pandas as pd
-from dash import Dash
+from dash import Dash, Patch, no_update
 from dash.dependencies import Input, Output, State
-from dash.html import Ul, Li, Thead, Tr, Tbody, Td, Th, Label, Br, Button, Div, Img, H1
+from dash.html import Ul, Li, Thead, Tr, Tbody, Td, Th, Label, Br, Button, Div, Img, H1, Datalist, Option
 from dash_sylvereye import SylvereyeRoadNetwork
 import dash_bootstrap_components as dbc
 from dash import dcc
+from flask import Response, abort, request, stream_with_context
 
 from dashboardfunctions import constants
+from dashboardfunctions.aggregate_map import get_aggregate_edges
+from dashboardfunctions.cache import get_data_with_cache
+from dashboardfunctions.catalog import get_catalog_options, refresh_catalog
 from dashboardfunctions.color import color_by_attribute
-from dashboardfunctions.mongo import get_database, get_available_graphs_by_date, get_graph_by_filename, \
-    get_edges_by_filename, get_data_from_graphs_with_filters_by_name, get_data_from_graphs_with_filters_by_hours, \
-    get_data_from_graphs_with_filters_by_weekday
+from dashboardfunctions.export import EXPORT_FORMATS, get_export_formats, stream_raw_export
+from dashboardfunctions.edge_index import get_edge_index, get_edge_position
+from dashboardfunctions.filters import get_map_masks
+from dashboardfunctions.payload import MERGE_MAP_UPDATE, FILTER_MAP_UPDATE, get_static_edges, get_map_update, \
+    get_filter_index
+from dashboardfunctions.columnar import EDGE_STATISTICS, WEEKDAYS, get_data_from_columnar_engine, refresh_engine, \
+    get_edge_history
+from dashboardfunctions.mongo import get_database, get_graph_by_filename, get_data_from_graphs_with_filters
+from dashboardfunctions.session import new_session_id, get_session_state, update_session_state
+from dashboardfunctions.snapshots import get_snapshot, get_snapshot_edges
+from dashboardfunctions.tiles import get_traffic_tile
+from dashboardfunctions.viewport import get_viewport_index, get_viewport_bounds, get_viewport_mask, \
+    get_level_of_detail_band, get_level_of_detail_coords
+from dashboardfunctions.street_names import get_street_name_index, get_street_name_suggestions
 from dashboardfunctions.utils import get_node_edge_options, get_road_data_from_graph_with_dictionary, \
-    add_info_from_mongo_list, get_min_max_values_from_attribute_edges_data, \
+    get_min_max_values_from_attribute_edges_data, \
     get_marks_each_60_minutes_with_half_hour_marks, translate_float_array_to_hour_string
 
 from dashboardfunctions.graphics import create_arrows, create_horizontal_bars_by_name_graph, \
-    create_vertical_bars_by_hours_graph, create_horizontal_bars_by_weekday_graph
+    create_vertical_bars_by_hours_graph, create_horizontal_bars_by_weekday_graph, create_edge_history_graph
 
 from datetime import date, datetime
 
@@ -29,16 +45,34 @@ from datetime import date, datetime
 
 
 node_options, edge_options = get_node_edge_options()
-nodes_data, edges_data, graph = get_road_data_from_graph_with_dictionary('graph_output/base_graph.graphml')
+nodes_data, base_edges_data, graph = get_road_data_from_graph_with_dictionary('graph_output/base_graph.graphml')
 mongo_database = get_database("TFG")
-current_datetime_graph = None
-
-# SOME INFORMATION THAT WILL BE RETRIEVED FROM THE DATABASE AND WILL BE USED TO FILTER THE DATA
-# AND TO DISPLAY THE INFORMATION ON THE DASHBOARD
-
-last_data_by_street_name = []
-last_data_by_hours = []
-last_data_by_weekday = []
+# Catalog of the dates of the snapshots, used by the dropdown of the dates
+refresh_catalog(mongo_database)
+
+# Index of the street names of the base graph, used by the name filters of the map and of the statistics
+street_name_index = get_street_name_index(base_edges_data)
+static_edges_data = get_static_edges(base_edges_data)
+filter_index = get_filter_index(base_edges_data, nodes_data, street_name_index)
+# R-tree of the edges, used to only send the edges inside the map shown
+viewport_index = get_viewport_index(base_edges_data)
+
+# The traffic level, node type, name and street type controls only trigger the map callback of the server if the map is
+# not filtered in the browser (CLIENTSIDE_FILTERS in .env)
+map_filter_dependency = State if constants.CLIENTSIDE_FILTERS else Input
+# The zoom and the center of the map only trigger the map callback if the edges outside the map are not sent
+# (VIEWPORT_CULLING in .env)
+map_viewport_dependency = Input if constants.VIEWPORT_CULLING else State
+
+# The statistics are computed in memory if COLUMNAR_ENGINE (.env) is 'memory' or 'mmap', otherwise by MongoDB
+if constants.COLUMNAR_ENGINE != "none":
+    refresh_engine(mongo_database)
+    get_data_function = get_data_from_columnar_engine
+else:
+    get_data_function = get_data_from_graphs_with_filters
+
+# The base graph is shared by every session and never modified. The state of each session (snapshot shown and last
+# statistics) is kept in the session store, so the dashboard can run with several workers
 # =====================================================================================================================
 #                                    BUILD THE LAYOUT OF THE DASHBOARD
 # =====================================================================================================================
@@ -47,7 +81,8 @@ last_data_by_weekday = []
 app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
 app._favicon = "favicon"
 app.title = "Traffic Levels Data Dashboard"
-app.layout =  dbc.Container([
+server = app.server
+layout = dbc.Container([
 
         dbc.Row([
             dbc.Col([
@@ -89,15 +124,17 @@ app.layout =  dbc.Container([
                     dbc.Col([
                         dbc.Label("Names ", style={'fontWeight': 'bold'}),
                         Br(),
-                        dbc.Label("Streets can be filtered by more than one name separating them with a comma ',' ",
-                                  style={'fontSize': '14px'}),
+                        dbc.Label("Streets can be filtered by more than one name separating them with a comma ',' "
+                                  "(case and accents are ignored)", style={'fontSize': '14px'}),
                         Br(),
                         dcc.Input(
                             id='name-input',
                             type='text',
                             placeholder='Enter a name',
+                            list='name-suggestions',
                             style={'width': '90%'}
                         ),
+                        Datalist(id='name-suggestions'),
                     ], width=5),
 
                     dbc.Col([
@@ -177,6 +214,21 @@ app.layout =  dbc.Container([
                         dcc.Download(id="download-day-of-week"),
                     ], width=12, className="d-flex justify-content-center", style={'marginTop': '15px'}),
 
+                    dbc.Col([
+                        # The raw data is sent by the server while it is read ('/export/raw.<format>'), so it is a link
+                        # instead of a 'dcc.Download'
+                        dcc.Dropdown(
+                            id='export-format-dropdown',
+                            options=[{'label': {'parquet': 'Parquet', 'arrow': 'Arrow', 'csv': 'CSV (gzip)'}[name],
+                                      'value': name} for name in get_export_formats()],
+                            value=get_export_formats()[0],
+                            clearable=False,
+                            style={'width': '150px', 'marginRight': '10px'}
+                        ),
+                        dbc.Button("Download raw data by edges", id="button-download-raw", disabled=True,
+                                   external_link=True, color="success"),
+                    ], width=12, className="d-flex justify-content-center", style={'marginTop': '15px'}),
+
 
                 ], className="align-items-center", style={'marginTop': '20px'})
             ]),
@@ -227,6 +279,10 @@ app.layout =  dbc.Container([
 
                         # Render the arrows that represent the direction of the edge(s)
                         dcc.Graph(id='direction-arrows',
+                                  style={'width': '100%', 'height': '23vh', 'margin': 'auto'}),
+
+                        # Traffic level history of the edge(s) over the date range of the filters
+                        dcc.Graph(id='edge-history',
                                   style={'width': '100%', 'height': '23vh', 'margin': 'auto'})
 
                     ])
@@ -245,8 +301,9 @@ app.layout =  dbc.Container([
                             map_center=constants.SET_UP.get("MAP_CENTER"),
                             map_zoom=constants.SET_UP.get("MAP_ZOOM"),
                             map_style=constants.SET_UP.get("MAP_STYLE"),
-                            nodes_data=nodes_data,
-                            edges_data=edges_data,
+                            # Built in the browser from the static stores (see 'MERGE_MAP_UPDATE')
+                            nodes_data=[],
+                            edges_data=[],
                             tile_layer_opacity=constants.SET_UP.get("TILE_LAYER_OPACITY"),
                             node_options=node_options,
                             edge_options=edge_options
@@ -265,7 +322,36 @@ app.layout =  dbc.Container([
                             id='date-hour-dropdown',
                             placeholder="Select a date to be displayed on the map:",
                             options=[],
-                        )
+                        ),
+
+                        dbc.Label("Map mode", style={'fontWeight': 'bold', 'marginTop': '10px'}),
+                        dcc.RadioItems(
+                            id='map-mode',
+                            options=[
+                                {'label': ' Selected date', 'value': 'snapshot'},
+                                # From the snapshots in memory (COLUMNAR_ENGINE), or from the rollups without them
+                                {'label': ' Statistic of the filters', 'value': 'aggregate'},
+                            ],
+                            value='snapshot',
+                        ),
+                        dbc.Label("Statistic (date range and hours of the filters)", style={'fontSize': '14px'}),
+                        dcc.Dropdown(
+                            id='map-aggregate-statistic',
+                            options=[
+                                {'label': 'Mean', 'value': 'mean'},
+                                {'label': 'Median', 'value': 'median'},
+                                {'label': 'Percentile 90', 'value': 'p90'},
+                            ],
+                            value=EDGE_STATISTICS[0],
+                            clearable=False
+                        ),
+                        dcc.Dropdown(
+                            id='map-aggregate-weekdays',
+                            multi=True,
+                            options=[{'label': weekday, 'value': weekday} for weekday in WEEKDAYS],
+                            value=WEEKDAYS,
+                            style={'marginTop': '5px'}
+                        ),
 
                     ])
                 ], style={}),
@@ -419,6 +505,108 @@ app.layout =  dbc.Container([
     ], fluid=True, style={'backgroundColor': '#f0f0f0','paddingTop': '20px', 'paddingBottom': '20px', 'paddingLeft': '8%', 'paddingRight': '8%'})
 
 
+def serve_layout():
+    # Each page load gets a new session id
+    return Div([
+        dcc.Store(id='session-id', data=new_session_id()),
+        # The geometry of the map is sent once, the map callback only sends the compact updates
+        dcc.Store(id='map-static-edges', data=static_edges_data),
+        dcc.Store(id='map-static-nodes', data=nodes_data),
+        dcc.Store(id='map-update'),
+        # The simplified coordinates of each zoom band, sent once (see 'update_level_of_detail_coords')
+        dcc.Store(id='map-band-coords', data={}),
+        dcc.Store(id='map-bands', data=[]),
+        dcc.Store(id='map-filter-index', data=filter_index),
+        layout
+    ])
+
+
+app.layout = serve_layout
+
+if constants.CLIENTSIDE_FILTERS:
+    app.clientside_callback(
+        FILTER_MAP_UPDATE,
+        Output('sylvereye-roadnet', 'edges_data'),
+        Output('sylvereye-roadnet', 'nodes_data'),
+        Input('map-update', 'data'),
+        Input('range-slider-traffic-level', 'value'),
+        Input('node-type-show', 'value'),
+        Input('name-input', 'value'),
+        Input('street-type-checklist', 'value'),
+        Input('map-band-coords', 'data'),
+        State('map-static-edges', 'data'),
+        State('map-static-nodes', 'data'),
+        State('map-filter-index', 'data'),
+    )
+else:
+    app.clientside_callback(
+        MERGE_MAP_UPDATE,
+        Output('sylvereye-roadnet', 'edges_data'),
+        Output('sylvereye-roadnet', 'nodes_data'),
+        Input('map-update', 'data'),
+        Input('map-band-coords', 'data'),
+        State('map-static-edges', 'data'),
+        State('map-static-nodes', 'data'),
+    )
+
+
+def get_displayed_edges(session_id):
+    """ Get the edges shown in the map of a session: the ones with the statistic of the aggregate mode, or the ones of
+    the snapshot of the session
+    Args:
+        session_id: The id of the session
+    Returns:
+        The edges (shared by every session, they must not be modified) and the key of their data"""
+
+    state = get_session_state(session_id)
+
+    map_aggregate = state.get("map_aggregate")
+    if map_aggregate is not None:
+        aggregate_edges = get_aggregate_edges(mongo_database, base_edges_data, *map_aggregate)
+        if aggregate_edges is not None:
+            return aggregate_edges, ("aggregate",) + map_aggregate
+        print("No snapshots in memory or rollups for the statistic of the map.")
+
+    datetime_graph = state.get("datetime_graph")
+    return get_snapshot_edges(mongo_database, datetime_graph, base_edges_data), ("date", datetime_graph)
+
+
+@server.route("/tiles/<snapshot>/<int:z>/<int:x>/<int:y>.pbf")
+def serve_traffic_tile(snapshot, z, x, y):
+    # Vector tiles of the edges with the traffic of a snapshot ('base' for the base graph)
+    tile = get_traffic_tile(mongo_database, None if snapshot == "base" else snapshot, z, x, y, base_edges_data)
+    if tile is None:
+        abort(404)
+
+    return Response(tile, mimetype="application/vnd.mapbox-vector-tile")
+
+
+@server.route("/export/raw.<export_format>")
+def serve_raw_export(export_format):
+    # Traffic of each edge in each snapshot that matches the filters of the statistics, sent while it is read
+    if export_format not in get_export_formats():
+        abort(404)
+
+    try:
+        start_datetime = datetime.combine(date.fromisoformat(request.args["start_date"]), datetime.min.time())
+        end_datetime = datetime.combine(date.fromisoformat(request.args["end_date"]), datetime.min.time()) \
+            .replace(hour=23, minute=59)
+    except (KeyError, ValueError):
+        abort(400)
+
+    list_names = [name.lower().strip() for name in request.args.get("names", "").split(",") if name.strip()]
+    street_types = [street_type for street_type in request.args.get("street_types", "").split(",") if street_type]
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"data_raw_{start_datetime:%Y_%m_%d}_{end_datetime:%Y_%m_%d}{extension}"
+
+    return Response(stream_with_context(stream_raw_export(mongo_database, export_format, start_datetime, end_datetime,
+                                                          list_names, street_types,
+                                                          request.args.get("start_hour", "00:00"),
+                                                          request.args.get("end_hour", "24:00"))),
+                    mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
 # =====================================================================================================================
 #                                CONTROL THE INTERACTIONS BETWEEN THE COMPONENTS
 # =====================================================================================================================
@@ -442,21 +630,10 @@ def update_available_dates_dropdown(start_date, end_date, hours_range_slider):
         # Add 23 hours and 59 minutes to the end date
         end_datetime = end_datetime.replace(hour=23, minute=59)
 
-        available_dates = get_available_graphs_by_date(mongo_database, start_datetime, end_datetime)
-
+        # The dates are found in the catalog of the snapshots (sorted in memory), without a query
         start_hour_minutes_string, end_hour_minutes_string = translate_float_array_to_hour_string(hours_range_slider)
-        available_dates = [date for date in available_dates if
-                           start_hour_minutes_string <= date.get("datetime").strftime(
-                               "%H:%M") <= end_hour_minutes_string]
-
-        dates_list = []
-        for i in available_dates:
-            object_date = i.get("datetime")
-            object_string = object_date.strftime("%Y/%m/%d - ") + i.get("day_of_week") + object_date.strftime(
-                " - %H:%M  ")
-            dates_list.append({'label': object_string, 'value': i.get("filename_extensions")})
-
-        return dates_list
+        return get_catalog_options(mongo_database, start_datetime, end_datetime, start_hour_minutes_string,
+                                   end_hour_minutes_string)
 
 
 @app.callback(
@@ -493,16 +670,19 @@ def update_node_data(clicked_node):
      Output('edge-current-speed', 'children'),
      Output('edge-lanes', 'children'),
      Output('edge-osmid', 'children'),
-     Output('direction-arrows', 'figure')
+     Output('direction-arrows', 'figure'),
+     Output('edge-history', 'figure')
      ],
     Input('sylvereye-roadnet', 'clicked_edge'),
     Input('edge-color-by', 'value'),
-
+    State('date-picker-range', 'start_date'),
+    State('date-picker-range', 'end_date'),
+    State('session-id', 'data'),
 )
-def update_edge_data(clicked_edge, edge_color_by):
+def update_edge_data(clicked_edge, edge_color_by, start_date, end_date, session_id):
     print("Updating edge data")
     if clicked_edge and edge_color_by is not None:
-        global edges_data
+        edges_data, data_key = get_displayed_edges(session_id)
 
         edge_data = clicked_edge["data"]["data"]
         edge_bearing = edge_data.get("bearing")
@@ -516,11 +696,12 @@ def update_edge_data(clicked_edge, edge_color_by):
         target_node = edge_data.get("target_osmid")
 
         if not edge_data.get("oneway"):
-            opposite_edge_data = [edge for edge in edges_data if
-                                  edge["data"]["source_osmid"] == target_node and edge["data"][
-                                      "target_osmid"] == source_node][0]
+            # The opposite edge is found with the index of the edges, without going through all of them
+            opposite_position = get_edge_position(get_edge_index(edges_data), target_node, source_node)
+            opposite_edge_data = edges_data[opposite_position] if opposite_position is not None else None
 
-            if opposite_edge_data["data"][edge_color_by] is None or opposite_edge_data["data"][edge_color_by] == "None":
+            if (opposite_edge_data is None or opposite_edge_data["data"][edge_color_by] is None
+                    or opposite_edge_data["data"][edge_color_by] == "None"):
                 opposite_edge_color_value = None
             else:
                 opposite_edge_color_value = float(opposite_edge_data["data"][edge_color_by])
@@ -529,11 +710,24 @@ def update_edge_data(clicked_edge, edge_color_by):
             opposite_edge_color_value = -1
 
         if edge_color_by != "traffic_level":
-            min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by)
+            min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by,
+                                                                            data_key=data_key)
             print(min_val, max_val)
         else:
             min_val, max_val = 0, 1
 
+        # History of the traffic level of the edge (and of the opposite edge) over the date range of the filters, read
+        # from the column of the edge in the snapshots in memory (or only its link from MongoDB without the engine)
+        edge_history, opposite_edge_history = None, None
+        if start_date is not None and end_date is not None:
+            start_datetime = datetime.combine(date.fromisoformat(start_date), datetime.min.time())
+            end_datetime = datetime.combine(date.fromisoformat(end_date), datetime.min.time()).replace(hour=23,
+                                                                                                       minute=59)
+            edge_history = get_edge_history(mongo_database, start_datetime, end_datetime, source_node, target_node)
+            if not edge_data.get("oneway"):
+                opposite_edge_history = get_edge_history(mongo_database, start_datetime, end_datetime, target_node,
+                                                         source_node)
+
         return [
             edge_data.get("name", "N/A") if edge_data.get("name") != "" else "N/A",
             edge_data.get("maxspeed", "N/A") if edge_data.get("maxspeed") != "" else "N/A",
@@ -548,101 +742,121 @@ def update_edge_data(clicked_edge, edge_color_by):
             edge_data.get("osmid", "N/A") if edge_data.get("osmid") != "" else "N/A",
             create_arrows(edge_bearing, tl_1=edge_color_value, tl_2=opposite_edge_color_value, min_val=min_val,
                           max_val=max_val) if not edge_data.get(
-                "oneway") else create_arrows(edge_bearing, tl_1=edge_color_value, min_val=min_val, max_val=max_val)
+                "oneway") else create_arrows(edge_bearing, tl_1=edge_color_value, min_val=min_val, max_val=max_val),
+            create_edge_history_graph(edge_history, opposite_edge_history)
         ]
-    return ["N/A"] * 7 + [create_arrows(0, tl_1=-1, tl_2=-1)]
+    return ["N/A"] * 7 + [create_arrows(0, tl_1=-1, tl_2=-1), create_edge_history_graph(None)]
 
 
 @app.callback(
-    Output('sylvereye-roadnet', 'edges_data'),
-    Output('sylvereye-roadnet', 'nodes_data'),
-    Input('range-slider-traffic-level', 'value'),
-    Input('node-type-show', 'value'),
+    Output('map-update', 'data'),
+    map_filter_dependency('range-slider-traffic-level', 'value'),
+    map_filter_dependency('node-type-show', 'value'),
     Input('date-hour-dropdown', 'value'),
     Input('edge-color-by', 'value'),
     Input('edge-api-data', 'value'),
 
-    Input('name-input', 'value'),
-    Input('street-type-checklist', 'value'),
+    map_filter_dependency('name-input', 'value'),
+    map_filter_dependency('street-type-checklist', 'value'),
+    map_viewport_dependency('sylvereye-roadnet', 'map_zoom'),
+    map_viewport_dependency('sylvereye-roadnet', 'map_center'),
+    Input('map-mode', 'value'),
+    Input('map-aggregate-statistic', 'value'),
+    Input('map-aggregate-weekdays', 'value'),
+    Input('date-picker-range', 'start_date'),
+    Input('date-picker-range', 'end_date'),
+    Input('hours-range-slider', 'value'),
+    State('session-id', 'data'),
 )
 def update_graph_displayed_map(range_slider_traffic_level, node_type_show, date_hour_dropdown, edge_color_by,
-                               edge_api_data, name_input, street_type_checklist):
+                               edge_api_data, name_input, street_type_checklist, map_zoom, map_center, map_mode,
+                               map_aggregate_statistic, map_aggregate_weekdays, start_date, end_date,
+                               hours_range_slider, session_id):
     print("Loading different graph")
-    global nodes_data, edges_data, current_datetime_graph
+    datetime_graph = get_session_state(session_id).get("datetime_graph")
 
     # Reload the base graph to a new graph with the selected date and hour
-    if date_hour_dropdown is not None and current_datetime_graph != date_hour_dropdown:
-        edges_list_from_date_hour = get_edges_by_filename(mongo_database, date_hour_dropdown)
-
-        if edges_list_from_date_hour is not None and len(edges_list_from_date_hour) > 0:
-            edges_data = add_info_from_mongo_list(edges_list_from_date_hour, edges_data)
-            current_datetime_graph = date_hour_dropdown
+    if date_hour_dropdown is not None and datetime_graph != date_hour_dropdown:
+        # The snapshot is usually in the cache, as the previous and next ones are loaded in the background
+        if get_snapshot(mongo_database, date_hour_dropdown, base_edges_data) is not None:
+            datetime_graph = date_hour_dropdown
+            update_session_state(session_id, datetime_graph=datetime_graph)
         else:
             print("No data found for the selected date and hour.")
 
+    # The aggregate mode shows a statistic of each edge over the date range, hours and weekdays of the filters (computed
+    # from the snapshots in memory with the columnar engine, or from the rollups of its street otherwise)
+    map_aggregate = None
+    if map_mode == "aggregate" and start_date is not None and end_date is not None:
+        start_datetime = datetime.combine(date.fromisoformat(start_date), datetime.min.time())
+        end_datetime = datetime.combine(date.fromisoformat(end_date), datetime.min.time()).replace(hour=23, minute=59)
+        start_hour, end_hour = translate_float_array_to_hour_string(hours_range_slider)
+        map_aggregate = (start_datetime, end_datetime, start_hour, end_hour, tuple(map_aggregate_weekdays or []),
+                         map_aggregate_statistic)
+    update_session_state(session_id, map_aggregate=map_aggregate)
+
+    # The edges shown are shared by the sessions, so only copies of them are colored
+    displayed_edges, data_key = get_displayed_edges(session_id)
+    edges_data = [dict(edge) for edge in displayed_edges]
+
     # Color by attribute
     if edge_color_by is not None:
-        min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by)
+        min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by,
+                                                                        data_key=data_key)
         color_by_attribute(edges_data, attribute=edge_color_by, min_val=min_val, max_val=max_val)
 
-    # Filter by traffic level
-    edges_data_filtered = [edge for edge in edges_data if edge["data"]["traffic_level"] is None or
-                           range_slider_traffic_level[0] <= edge["data"]["traffic_level"] <= range_slider_traffic_level[
-                               1]]
+    if constants.CLIENTSIDE_FILTERS:
+        # These filters are applied in the browser (see 'FILTER_MAP_UPDATE')
+        range_slider_traffic_level = node_type_show = name_input = street_type_checklist = None
 
-    # Filter by API data
-    if edge_api_data is not None and len(edge_api_data) > 0:
-        edges_data_filtered = [edge for edge in edges_data_filtered
-                               if 'api_data' in edge["data"] and
-                               (edge["data"]["api_data"] is None
-                                or
-                                str(edge["data"]["api_data"]) in edge_api_data)]
+    # Only the edges inside the map shown are sent, simplified at low zoom
+    viewport_mask, band = None, None
+    if constants.VIEWPORT_CULLING and map_zoom is not None and map_center is not None:
+        viewport_mask = get_viewport_mask(viewport_index, get_viewport_bounds(map_center, map_zoom))
+        band = get_level_of_detail_band(map_zoom)
 
-    # Filter by name
-    if name_input is not None and len(name_input) > 0:
-        list_names = name_input.split(",")
-        list_names = [name.lower().strip() for name in list_names if
-                      name.strip()]  # Strip whitespace, convert to lower case, and exclude empty strings
-        edges_data_filtered = [
-            edge for edge in edges_data_filtered
-            if 'name' in edge["data"] and edge["data"]["name"] is not None
-               and any(partial_name in edge["data"]["name"].lower() for partial_name in list_names)
-        ]
-    # Filter by street type
-    if street_type_checklist is not None and len(street_type_checklist) > 0:
-        edges_data_filtered = [edge for edge in edges_data_filtered if edge["data"]["highway"] in street_type_checklist]
+    # Filter the edges and nodes with the masks of each control
+    edges_mask, nodes_mask = get_map_masks(edges_data, nodes_data, data_key, range_slider_traffic_level,
+                                           node_type_show, api_data=edge_api_data, name_input=name_input,
+                                           street_types=street_type_checklist, viewport_mask=viewport_mask)
 
-    # Don't show nodes that are not connected to any edge
-    nodes_connected_to_edges = []
-    for edge in edges_data_filtered:
-        if edge["data"]["source_osmid"] not in nodes_connected_to_edges:
-            nodes_connected_to_edges.append(edge["data"]["source_osmid"])
-        if edge["data"]["target_osmid"] not in nodes_connected_to_edges:
-            nodes_connected_to_edges.append(edge["data"]["target_osmid"])
+    return get_map_update(edges_data, edges_mask, nodes_mask, band=band)
 
-    # Filter by node type
-    show_nodes_osmids = []
-    for node in nodes_data:
-        print(node)
-        # Get node type (highway) and traffic light status
-        node_type = str(node["data"].get("highway", ""))  # Default to empty string if not present
-        node_tl = node["data"].get("traffic_light", False)  # Default to False if not present
 
-        # Check if node type or traffic light should be shown, based on node_type_show
-        should_show = False
+if constants.VIEWPORT_CULLING:
+    @app.callback(
+        Output('map-band-coords', 'data'),
+        Output('map-bands', 'data'),
+        Input('sylvereye-roadnet', 'map_zoom'),
+        State('map-bands', 'data'),
+    )
+    def update_level_of_detail_coords(map_zoom, map_bands):
+        # The simplified coordinates of each zoom band are only added once to the store of the browser (the map updates
+        # only name their band)
+        band = get_level_of_detail_band(map_zoom) if map_zoom is not None else None
+        if band is None or band in map_bands:
+            return no_update, no_update
 
-        if node_type and node_type in node_type_show:
-            should_show = True  # Node type (highway) matches
-        elif node_tl and "traffic_light" in node_type_show:
-            should_show = True  # Traffic light node is selected
+        band_coords = Patch()
+        band_coords[band] = get_level_of_detail_coords(viewport_index, base_edges_data, band)
+        return band_coords, map_bands + [band]
 
-        # Only include nodes that should be shown and are connected to edges
-        if should_show and node["data"]["osmid"] in nodes_connected_to_edges:
-            show_nodes_osmids.append(node["data"]["osmid"])
 
-    nodes_data_filtered = [node for node in nodes_data if node["data"]["osmid"] in show_nodes_osmids]
+@app.callback(
+    Output('name-suggestions', 'children'),
+    Input('name-input', 'value'),
+)
+def update_name_suggestions(name_input):
+    # Suggest the street names for the last name written (the previous ones are kept in each suggestion)
+    if name_input is None:
+        return []
 
-    return edges_data_filtered, nodes_data_filtered
+    previous_names, _, text = name_input.rpartition(",")
+    if len(text.strip()) < 2:
+        return []
+
+    prefix = previous_names + ", " if previous_names else ""
+    return [Option(value=prefix + name) for name in get_street_name_suggestions(street_name_index, text)]
 
 
 @app.callback(
@@ -684,12 +898,12 @@ def update_display(node_size, node_transparency, edge_width, edge_transparency):
     State("hours-range-slider", "value"),
     State('name-input', 'value'),
     State('category-graphs-dropdown', 'value'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
 def update_data_selection_output(n_clicks, start_date, end_date, street_type_checklist, hours_range_slider, name_input,
-                                 selected_category):
+                                 selected_category, session_id):
     print("Updating data selection")
-    global last_data_by_street_name, last_data_by_hours, last_data_by_weekday
 
     if n_clicks == 0:
         return (create_horizontal_bars_by_name_graph([], selected_category),
@@ -718,38 +932,19 @@ def update_data_selection_output(n_clicks, start_date, end_date, street_type_che
 
     import time
 
-    # Timer for fetching data by name
+    # Timer for fetching data by name, by hours and by day of the week (a single aggregation)
     start_time = time.time()
-    mongo_data_cursor = get_data_from_graphs_with_filters_by_name(mongo_database, start_datetime, end_datetime,
-                                                                  list_names, street_type_checklist, start_hour,
-                                                                  end_hour)
-    last_data_by_street_name = list(mongo_data_cursor)
+    last_data_by_street_name, last_data_by_hours, last_data_by_weekday = get_data_with_cache(
+        mongo_database, get_data_function, start_datetime, end_datetime, list_names,
+        street_type_checklist, start_hour, end_hour)
     end_time = time.time()
-    time_taken_by_name = end_time - start_time
     print(last_data_by_street_name)
-    print(f"Time taken to fetch data by name: {time_taken_by_name:.2f} seconds")
-
-    # Timer for fetching data by hours
-    start_time = time.time()
-    mongo_data_cursor = get_data_from_graphs_with_filters_by_hours(mongo_database, start_datetime, end_datetime,
-                                                                   list_names, street_type_checklist, start_hour,
-                                                                   end_hour)
-    last_data_by_hours = list(mongo_data_cursor)
-    end_time = time.time()
-    time_taken_by_hours = end_time - start_time
     print(last_data_by_hours)
-    print(f"Time taken to fetch data by hours: {time_taken_by_hours:.2f} seconds")
-
-    # Timer for fetching data by day of the week
-    start_time = time.time()
-    mongo_data_cursor = get_data_from_graphs_with_filters_by_weekday(mongo_database, start_datetime, end_datetime,
-                                                                     list_names, street_type_checklist, start_hour,
-                                                                     end_hour)
-    last_data_by_weekday = list(mongo_data_cursor)
-    end_time = time.time()
-    time_taken_by_weekday = end_time - start_time
     print(last_data_by_weekday)
-    print(f"Time taken to fetch data by weekday: {time_taken_by_weekday:.2f} seconds")
+    print(f"Time taken to fetch data by name, hours and weekday: {end_time - start_time:.2f} seconds")
+
+    update_session_state(session_id, last_data_by_street_name=last_data_by_street_name,
+                         last_data_by_hours=last_data_by_hours, last_data_by_weekday=last_data_by_weekday)
 
     return (create_horizontal_bars_by_name_graph(last_data_by_street_name, selected_category),
             create_vertical_bars_by_hours_graph(last_data_by_hours, selected_category),
@@ -765,26 +960,52 @@ def update_data_selection_output(n_clicks, start_date, end_date, street_type_che
     Output('verticals-bars-graph-by-hours', 'figure'),
     Output('vertical-bars-graph-by-weekday', 'figure'),
 
-    Input('category-graphs-dropdown', 'value')
+    Input('category-graphs-dropdown', 'value'),
+    State('session-id', 'data'),
 )
-def update_graphs(selected_category):
+def update_graphs(selected_category, session_id):
     print("Updating graphs category: " + selected_category)
-    return (create_horizontal_bars_by_name_graph(last_data_by_street_name, selected_category),
-            create_vertical_bars_by_hours_graph(last_data_by_hours, selected_category),
-            create_horizontal_bars_by_weekday_graph(last_data_by_weekday, selected_category)
+    state = get_session_state(session_id)
+    return (create_horizontal_bars_by_name_graph(state.get("last_data_by_street_name", []), selected_category),
+            create_vertical_bars_by_hours_graph(state.get("last_data_by_hours", []), selected_category),
+            create_horizontal_bars_by_weekday_graph(state.get("last_data_by_weekday", []), selected_category)
             )
 
 
+@app.callback(
+    Output("button-download-raw", "href"),
+    Output("button-download-raw", "disabled"),
+    Input("button-submit-filter", "n_clicks"),
+    Input("export-format-dropdown", "value"),
+    State("date-picker-range", "start_date"),
+    State("date-picker-range", "end_date"),
+    State('street-type-checklist', 'value'),
+    State("hours-range-slider", "value"),
+    State('name-input', 'value'),
+)
+def update_download_raw_link(n_clicks, export_format, start_date, end_date, street_type_checklist, hours_range_slider,
+                             name_input):
+    # The link downloads the raw data with the filters of the last processed data
+    if n_clicks is None or n_clicks == 0 or start_date is None or end_date is None:
+        return None, True
+
+    start_hour, end_hour = translate_float_array_to_hour_string(hours_range_slider)
+    query = urlencode({"start_date": start_date[:10], "end_date": end_date[:10], "start_hour": start_hour,
+                       "end_hour": end_hour, "names": name_input or "",
+                       "street_types": ",".join(street_type_checklist or [])})
+
+    return f"/export/raw.{export_format}?{query}", False
+
+
 @app.callback(
     Output("download-street", "data"),
-    Input("button-download-street", "n_clicks"))
-def download_data_by_street(n_clicks):
+    Input("button-download-street", "n_clicks"),
+    State('session-id', 'data'))
+def download_data_by_street(n_clicks, session_id):
     if n_clicks is None or n_clicks == 0:
         return dash.no_update
 
-    global last_data_by_street_name
-
-    df = pd.DataFrame(last_data_by_street_name)
+    df = pd.DataFrame(get_session_state(session_id).get("last_data_by_street_name", []))
     csv = df.to_csv()
 
     return dict(content=csv, filename="data_street.csv")
@@ -792,14 +1013,13 @@ def download_data_by_street(n_clicks):
 
 @app.callback(
     Output("download-hour", "data"),
-    Input("button-download-hour", "n_clicks"))
-def download_data_by_hour(n_clicks):
+    Input("button-download-hour", "n_clicks"),
+    State('session-id', 'data'))
+def download_data_by_hour(n_clicks, session_id):
     if n_clicks is None or n_clicks == 0:
         return dash.no_update
 
-    global last_data_by_hours
-
-    df = pd.DataFrame(last_data_by_hours)
+    df = pd.DataFrame(get_session_state(session_id).get("last_data_by_hours", []))
     csv = df.to_csv()
 
     return dict(content=csv, filename="data_hour.csv")
@@ -807,14 +1027,13 @@ def download_data_by_hour(n_clicks):
 
 @app.callback(
     Output("download-day-of-week", "data"),
-    Input("button-download-day-of-week", "n_clicks"))
-def download_data_by_day_of_week(n_clicks):
+    Input("button-download-day-of-week", "n_clicks"),
+    State('session-id', 'data'))
+def download_data_by_day_of_week(n_clicks, session_id):
     if n_clicks is None or n_clicks == 0:
         return dash.no_update
 
-    global last_data_by_weekday
-
-    df = pd.DataFrame(last_data_by_weekday)
+    df = pd.DataFrame(get_session_state(session_id).get("last_data_by_weekday", []))
     csv = df.to_csv()
 
     return dict(content=csv, filename="data_day_of_week.csv")
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+from dashboardfunctions import constants
+from dashboardfunctions.columnar import engine, get_edge_statistics_from_columnar_engine, refresh_engine, WEEKDAYS
+from dashboardfunctions.edge_index import get_edge_index, new_edge_attributes, set_attributes_from_links, \
+    set_attributes_to_edges
+from dashboardfunctions.rollups import get_edge_statistics_from_rollups
+from dashboardfunctions.snapshots import copy_edges
+
+# Edges of the map with the statistics of the last filters used, shared by every session of the process (they must not
+# be modified). The snapshots in memory (or the last ingest, for the rollups) are part of the key, so new snapshots
+# compute the statistics again
+AGGREGATE_EDGES_CACHE_SIZE = 8
+aggregate_edges_cache = OrderedDict()
+aggregate_edges_lock = threading.Lock()
+
+
+def __get_statistics_version(db):
+    if constants.COLUMNAR_ENGINE == "none":
+        # The rollups change with each run of the pipeline, which saves an ingest event
+        last_event = db["ingest_events"].find_one({}, sort=[("ingested", -1)])
+        return ("rollups", last_event["ingested"] if last_event else None)
+
+    refresh_engine(db)
+    return engine["last_datetime"], engine["manifest_mtime"]
+
+
+def get_aggregate_edges(db, base_edges, from_date, to_date, start_hour_minute, end_hour_minute, weekdays, statistic):
+    """ Get the edges of the map with a statistic of their traffic level and current speed over the snapshots that
+    match the filters (from the snapshots in memory of the columnar engine, or from the rollups if the engine is off)
+    Args:
+        db: The database
+        base_edges: The edges of the base graph (Sylvereye edges data)
+        from_date: The first datetime
+        to_date: The last datetime
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        weekdays: The days of the week
+        statistic: The statistic ('mean', 'median' or 'p90')
+    Returns:
+        The edges with the statistic as 'traffic_level' and 'current_speed', or None if there are no snapshots in
+        memory (or the rollups are not complete)"""
+
+    key = (from_date, to_date, start_hour_minute, end_hour_minute, tuple(weekdays), statistic,
+           *__get_statistics_version(db))
+
+    with aggregate_edges_lock:
+        edges = aggregate_edges_cache.get(key)
+        if edges is not None:
+            aggregate_edges_cache.move_to_end(key)
+            return edges
+
+    if constants.COLUMNAR_ENGINE == "none":
+        links = get_edge_statistics_from_rollups(db, base_edges, from_date, to_date, start_hour_minute,
+                                                 end_hour_minute, [WEEKDAYS.index(weekday) for weekday in weekdays],
+                                                 statistic)
+    else:
+        links = get_edge_statistics_from_columnar_engine(db, from_date, to_date, start_hour_minute, end_hour_minute,
+                                                         weekdays, statistic)
+    if links is None:
+        return None
+
+    # The edges without values in the filters have no data (instead of the values of the base graph)
+    edges = copy_edges(base_edges)
+    for edge in edges:
+        edge["data"]["traffic_level"] = None
+        edge["data"]["current_speed"] = None
+
+    index = get_edge_index(edges)
+    set_attributes_to_edges(set_attributes_from_links(index, new_edge_attributes(index), links), edges)
+
+    with aggregate_edges_lock:
+        aggregate_edges_cache[key] = edges
+        while len(aggregate_edges_cache) > AGGREGATE_EDGES_CACHE_SIZE:
+            aggregate_edges_cache.popitem(last=False)
+
+    return edges
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+from datetime import datetime
+
+from dashboardfunctions import constants
+
+KEY_PREFIX = "dashboard_results:"
+REDIS_LRU_KEY = KEY_PREFIX + "lru"
+
+# Backend of the cache ('disk' or 'redis', and its client), created on first use
+results_cache = None
+
+
+def __get_results_cache():
+    global results_cache
+
+    if results_cache is None:
+        if constants.RESULTS_CACHE == "redis":
+            import redis
+
+            results_cache = ("redis", redis.Redis.from_url(constants.RESULTS_CACHE_REDIS_URL))
+        else:
+            import diskcache
+
+            # The folder can be shared by every process of the dashboard (SQLite handles the concurrent access)
+            results_cache = ("disk", diskcache.Cache(constants.RESULTS_CACHE_FOLDER,
+                                                     size_limit=constants.RESULTS_CACHE_SIZE_MB * 1024 * 1024,
+                                                     eviction_policy="least-recently-used"))
+
+    return results_cache
+
+
+def __cache_get(key):
+    backend, client = __get_results_cache()
+
+    if backend == "disk":
+        return client.get(key)
+
+    value = client.get(key)
+    if value is None:
+        return None
+
+    # Mark the entry as recently used
+    client.zadd(REDIS_LRU_KEY, {key: time.time()})
+    return pickle.loads(value)
+
+
+def __cache_set(key, entry):
+    backend, client = __get_results_cache()
+
+    if backend == "disk":
+        client.set(key, entry, expire=constants.RESULTS_CACHE_TTL_SECONDS)
+        return
+
+    client.set(key, pickle.dumps(entry), ex=constants.RESULTS_CACHE_TTL_SECONDS)
+    client.zadd(REDIS_LRU_KEY, {key: time.time()})
+
+    # Evict the least recently used entries over the limit
+    excess = client.zcard(REDIS_LRU_KEY) - constants.RESULTS_CACHE_MAX_ENTRIES
+    if excess > 0:
+        evicted = [member for member, score in client.zpopmin(REDIS_LRU_KEY, excess)]
+        client.delete(*evicted)
+
+
+def __cache_delete(key):
+    backend, client = __get_results_cache()
+
+    if backend == "disk":
+        client.delete(key)
+    else:
+        client.delete(key)
+        client.zrem(REDIS_LRU_KEY, key)
+
+
+def get_filters_key(function_name, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                    end_hour_minute, engine_version=None):
+    """ Get the key of the cache for a combination of filters (the order, case and repetitions of the names and highway
+    types do not change the key)
+    Args:
+        function_name: The name of the function that gets the data
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        engine_version: The version of the data of the statistics engine (None if it reads MongoDB)
+    Returns:
+        The key of the cache"""
+
+    filters = [function_name, from_date.isoformat(), to_date.isoformat(),
+               sorted({name.lower().strip() for name in names_pattern}), sorted(set(highway_types)),
+               start_hour_minute, end_hour_minute, engine_version]
+
+    return KEY_PREFIX + hashlib.sha1(json.dumps(filters).encode()).hexdigest()
+
+
+def __get_engine_version():
+    # With COLUMNAR_ENGINE='mmap' the statistics only change when the files are built again (not when the snapshots are
+    # ingested), so the results of each version of the files have their own key
+    manifest_path = os.path.join(constants.COLUMNAR_FOLDER, "manifest.json")
+    if constants.COLUMNAR_ENGINE == "mmap" and os.path.exists(manifest_path):
+        return os.path.getmtime(manifest_path)
+    return None
+
+
+def __get_last_ingest(db):
+    last_event = db["ingest_events"].find_one({}, sort=[("ingested", -1)])
+    return last_event["ingested"] if last_event else datetime.min
+
+
+def __is_outdated(db, entry):
+    # The entry is outdated if new snapshots of its date range were ingested (or compacted) after it was computed
+    return db["ingest_events"].find_one({
+        "ingested": {"$gt": entry["last_ingest"]},
+        "from_date": {"$lte": entry["to_date"]},
+        "to_date": {"$gte": entry["from_date"]}
+    }) is not None
+
+
+def get_data_with_cache(db, function, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                        end_hour_minute):
+    """ Get the results of a function of 'mongo.py' from the cache, or run it and save its results
+    Args:
+        db: The database
+        function: The function that gets the data (with the same arguments as this one, without 'function')
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+    Returns:
+        The results of the function"""
+
+    if constants.RESULTS_CACHE == "none":
+        return function(db, from_date, to_date, names_pattern, highway_types, start_hour_minute, end_hour_minute)
+
+    key = get_filters_key(function.__name__, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                          end_hour_minute, __get_engine_version())
+
+    entry = __cache_get(key)
+    if entry is not None and not __is_outdated(db, entry):
+        print("Results taken from the cache")
+        return entry["results"]
+
+    # The last ingest event is read before the data, so the snapshots ingested meanwhile outdate the entry
+    last_ingest = __get_last_ingest(db)
+    results = function(db, from_date, to_date, names_pattern, highway_types, start_hour_minute, end_hour_minute)
+
+    if entry is not None:
+        __cache_delete(key)
+    __cache_set(key, {"from_date": from_date, "to_date": to_date, "last_ingest": last_ingest, "results": results})
+
+    return results
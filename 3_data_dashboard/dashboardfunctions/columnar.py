@@ -0,0 +1,647 @@
+import json
+import os
+import re
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+from dashboardfunctions import constants
+from dashboardfunctions.compact import decode_traffic_levels, dequantize, get_edge_order
+from dashboardfunctions.mongo import get_database, get_data_from_graphs_with_filters, \
+    get_edge_traffic_levels_from_graphs
+from dashboardfunctions.retention import get_retention_boundary
+from dashboardfunctions.street_names import street_name_index, split_street_name_patterns
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Columns of each chunk of snapshots (the matrices are snapshots x edges, in the order of 'edges'). 'present' marks
+# the edges that are in each snapshot, even without traffic level (NaN)
+CHUNK_ARRAYS = ["datetime", "minute_of_day", "weekday", "traffic_level", "current_speed", "api_data", "present"]
+
+# Statistics of each edge for the aggregate mode of the map
+EDGE_STATISTICS = ["mean", "median", "p90"]
+
+LINKS_PROJECTION = {"datetime": 1, "filename": 1, "links.source": 1, "links.target": 1, "links.key": 1,
+                    "links.name": 1, "links.highway": 1, "links.traffic_level": 1, "links.current_speed": 1,
+                    "links.api_data": 1}
+
+# State of the engine: the static information of the edges and the chunks of snapshots (in chronological order)
+engine = {
+    "edges": None,
+    "edges_index": None,
+    "name_values": None,
+    "name_codes": None,
+    "highway_values": None,
+    "highway_codes": None,
+    "chunks": [],
+    "last_datetime": None,
+    "last_ingest": None,
+    "manifest_mtime": None,
+}
+
+
+def __hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+def __factorize(values):
+    # Codes of each value and the list of unique values (lists are kept as lists, as MongoDB groups them)
+    unique = {}
+    unique_values = []
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        key = __hashable(value)
+        if key not in unique:
+            unique[key] = len(unique_values)
+            unique_values.append(value)
+        codes[i] = unique[key]
+
+    return codes, unique_values
+
+
+def __set_edges(edges):
+    engine["edges"] = edges
+    engine["edges_index"] = {(edge["source"], edge["target"], edge.get("key", 0)): i for i, edge in enumerate(edges)}
+    engine["name_codes"], engine["name_values"] = __factorize([edge.get("name") for edge in edges])
+    engine["highway_codes"], engine["highway_values"] = __factorize([edge.get("highway") for edge in edges])
+
+
+def __empty_row(edges_count):
+    return (np.full(edges_count, np.nan, dtype=np.float32), np.full(edges_count, np.nan, dtype=np.float32),
+            np.zeros(edges_count, dtype=bool), np.zeros(edges_count, dtype=bool))
+
+
+def __read_graphs(db, after):
+    query = {"datetime": {"$gt": after}} if after is not None else {}
+
+    for document in db["graphs"].find(query, LINKS_PROJECTION).sort("datetime", 1):
+        if engine["edges"] is None:
+            __set_edges([{field: link.get(field) for field in ["source", "target", "key", "name", "highway"]}
+                         for link in document["links"]])
+
+        traffic_level, current_speed, api_data, present = __empty_row(len(engine["edges"]))
+        for link in document["links"]:
+            # The edges that are not in the order of the engine (a different graph) are skipped
+            position = engine["edges_index"].get((link["source"], link["target"], link.get("key", 0)))
+            if position is None:
+                continue
+            if link.get("traffic_level") is not None:
+                traffic_level[position] = link["traffic_level"]
+            if link.get("current_speed") is not None:
+                current_speed[position] = link["current_speed"]
+            api_data[position] = bool(link.get("api_data"))
+            present[position] = True
+
+        yield document["datetime"], traffic_level, current_speed, api_data, present
+
+
+def __read_compact_graphs(db, after):
+    query = {"datetime": {"$gt": after}} if after is not None else {}
+    quantized_by_keyframe = {}
+
+    for compact_document in db["compact_graphs"].find(query).sort("datetime", 1):
+        edge_order = get_edge_order(db, compact_document["edge_order"])
+        if engine["edges"] is None:
+            __set_edges(edge_order["links"])
+
+        # The chain of the first snapshot (or of a chain saved in another run) is decoded from its keyframe
+        keyframe_filename = compact_document["keyframe_filename"]
+        if not compact_document["keyframe"] and keyframe_filename not in quantized_by_keyframe:
+            chain = db["compact_graphs"].find({"keyframe_filename": keyframe_filename,
+                                               "chain_index": {"$lt": compact_document["chain_index"]}}) \
+                .sort("chain_index", 1)
+            for chain_document in chain:
+                quantized_by_keyframe[keyframe_filename] = decode_traffic_levels(
+                    chain_document, quantized_by_keyframe.get(keyframe_filename))
+
+        quantized = decode_traffic_levels(compact_document, quantized_by_keyframe.get(keyframe_filename))
+        quantized_by_keyframe[keyframe_filename] = quantized
+
+        values = dequantize(quantized, compact_document["dtype"])
+        api_values = np.unpackbits(np.frombuffer(compact_document["api_data"], dtype=np.uint8),
+                                   count=len(edge_order["links"])).astype(bool)
+
+        traffic_level, current_speed, api_data, present = __empty_row(len(engine["edges"]))
+        for i, link in enumerate(edge_order["links"]):
+            position = engine["edges_index"].get((link["source"], link["target"], link.get("key", 0)))
+            if position is not None:
+                traffic_level[position] = values[i]
+                current_speed[position] = values[i] * edge_order["maxspeeds"][i]
+                api_data[position] = api_values[i]
+                present[position] = True
+
+        yield compact_document["datetime"], traffic_level, current_speed, api_data, present
+
+
+def load_new_snapshots(db):
+    """ Read from MongoDB the snapshots saved after the last one of the engine ('graphs' and 'compact_graphs')
+    Args:
+        db: The database
+    Returns:
+        The chunk with the new snapshots (None if there are none)"""
+
+    rows = list(__read_compact_graphs(db, engine["last_datetime"]))
+
+    # The snapshots saved with GRAPHS_STORAGE_MODE='compact' are only in 'compact_graphs', the ones of 'graphs' (default
+    # mode, or older runs that saved both) are only added when there is no compact copy
+    compact_datetimes = {row[0] for row in rows}
+    rows += [row for row in __read_graphs(db, engine["last_datetime"]) if row[0] not in compact_datetimes]
+    if not rows:
+        return None
+
+    rows.sort(key=lambda row: row[0])
+    datetimes = [row[0] for row in rows]
+    engine["last_datetime"] = datetimes[-1]
+
+    return {
+        "datetime": np.array(datetimes, dtype="datetime64[ms]"),
+        "minute_of_day": np.array([date.hour * 60 + date.minute for date in datetimes], dtype=np.int16),
+        "weekday": np.array([date.weekday() for date in datetimes], dtype=np.int8),
+        "traffic_level": np.vstack([row[1] for row in rows]),
+        "current_speed": np.vstack([row[2] for row in rows]),
+        "api_data": np.vstack([row[3] for row in rows]),
+        "present": np.vstack([row[4] for row in rows]),
+    }
+
+
+def __get_last_ingest(db):
+    last_event = db["ingest_events"].find_one({}, sort=[("ingested", -1)])
+    return last_event["ingested"] if last_event else None
+
+
+def build_columnar_files(db, folder):
+    """ Save the new snapshots of MongoDB as a new chunk of '.npy' files (the first time, every snapshot), so the
+    workers of the dashboard can memory-map them
+    Args:
+        db: The database
+        folder: The folder of the files
+    Returns:
+        The amount of new snapshots"""
+
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, "manifest.json")
+
+    manifest = {"chunks": [], "last_datetime": None}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        with open(os.path.join(folder, "edges.json")) as file:
+            __set_edges(json.load(file))
+        engine["last_datetime"] = datetime.fromisoformat(manifest["last_datetime"])
+
+    chunk = load_new_snapshots(db)
+    if chunk is None:
+        return 0
+
+    if not manifest["chunks"]:
+        with open(os.path.join(folder, "edges.json"), "w") as file:
+            json.dump(engine["edges"], file, default=str)
+
+    chunk_name = f"chunk_{len(manifest['chunks'])}"
+    for array_name in CHUNK_ARRAYS:
+        np.save(os.path.join(folder, f"{chunk_name}_{array_name}.npy"), chunk[array_name])
+
+    manifest["chunks"].append(chunk_name)
+    manifest["last_datetime"] = engine["last_datetime"].isoformat()
+
+    # The manifest is replaced at the end, so the workers never open a chunk that is not completely written
+    with open(manifest_path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return len(chunk["datetime"])
+
+
+def __open_columnar_files(folder):
+    manifest_path = os.path.join(folder, "manifest.json")
+    manifest_mtime = os.path.getmtime(manifest_path)
+    if manifest_mtime == engine["manifest_mtime"]:
+        return
+
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    with open(os.path.join(folder, "edges.json")) as file:
+        __set_edges(json.load(file))
+
+    # Read-only memory maps, the pages are shared by every process that opens the same files
+    engine["chunks"] = []
+    for chunk_name in manifest["chunks"]:
+        chunk = {}
+        for array_name in CHUNK_ARRAYS:
+            path = os.path.join(folder, f"{chunk_name}_{array_name}.npy")
+            if os.path.exists(path):
+                chunk[array_name] = np.load(path, mmap_mode="r")
+
+        # The chunks saved before 'present' existed only know the edges with traffic level
+        if "present" not in chunk:
+            chunk["present"] = ~np.isnan(chunk["traffic_level"])
+        engine["chunks"].append(chunk)
+    engine["manifest_mtime"] = manifest_mtime
+
+
+def __has_earlier_ingest(db, after, last_datetime):
+    query = {"from_date": {"$lte": last_datetime}}
+    if after is not None:
+        query["ingested"] = {"$gt": after}
+
+    return db["ingest_events"].find_one(query) is not None
+
+
+def refresh_engine(db):
+    # 'mmap' opens the files again when they change, 'memory' reads the snapshots of the new ingest events and 'none'
+    # never loads the snapshots
+    if constants.COLUMNAR_ENGINE == "none":
+        return
+
+    if constants.COLUMNAR_ENGINE == "mmap":
+        if os.path.exists(os.path.join(constants.COLUMNAR_FOLDER, "manifest.json")):
+            __open_columnar_files(constants.COLUMNAR_FOLDER)
+        return
+
+    last_ingest = __get_last_ingest(db)
+    if engine["chunks"] and last_ingest == engine["last_ingest"]:
+        return
+
+    # The new snapshots are only appended after the last one, so if an ingest event covers earlier dates (late
+    # snapshots, or the retention) every snapshot is read again
+    if engine["chunks"] and __has_earlier_ingest(db, engine["last_ingest"], engine["last_datetime"]):
+        engine["chunks"] = []
+        engine["last_datetime"] = None
+
+    chunk = load_new_snapshots(db)
+    if chunk is not None:
+        engine["chunks"].append(chunk)
+    engine["last_ingest"] = last_ingest
+
+
+def __matches_any(value, condition):
+    # Values that are lists (edges merged by OSMnx) match if any of their elements match, as in MongoDB
+    if isinstance(value, list):
+        return any(condition(element) for element in value)
+    return value is not None and condition(value)
+
+
+def __get_edges_mask(names_pattern, highway_types):
+    highway_types = set(highway_types)
+    highway_matches = np.array([__matches_any(value, lambda element: element in highway_types)
+                                for value in engine["highway_values"]], dtype=bool)
+    mask = highway_matches[engine["highway_codes"]]
+
+    if len(names_pattern) > 0:
+        # The same street names and regex patterns as the MongoDB queries (see 'split_street_name_patterns')
+        street_names, regex_patterns = split_street_name_patterns(street_name_index, names_pattern)
+        street_names = set(street_names)
+        regexes = [re.compile(pattern, re.IGNORECASE) for pattern in regex_patterns]
+        name_condition = lambda element: element in street_names or (isinstance(element, str) and
+                                                                      any(regex.search(element) for regex in regexes))
+
+        name_matches = np.array([__matches_any(value, name_condition) for value in engine["name_values"]], dtype=bool)
+        mask &= name_matches[engine["name_codes"]]
+
+    return mask
+
+
+def __select(from_date, to_date, start_minute, end_minute, edges_mask):
+    # Rows (snapshots) and columns (edges) of every chunk that match the filters, as flat arrays
+    selected = {name: [] for name in ["traffic_level", "current_speed", "api_data", "present", "minute_of_day",
+                                      "weekday"]}
+    columns = np.flatnonzero(edges_mask)
+
+    for chunk in engine["chunks"]:
+        rows = np.flatnonzero((chunk["datetime"] >= np.datetime64(from_date, "ms")) &
+                              (chunk["datetime"] <= np.datetime64(to_date, "ms")) &
+                              (chunk["minute_of_day"] >= start_minute) & (chunk["minute_of_day"] <= end_minute))
+        if len(rows) == 0 or len(columns) == 0:
+            continue
+
+        for name in ["traffic_level", "current_speed", "api_data", "present"]:
+            selected[name].append(np.asarray(chunk[name][rows][:, columns]))
+        selected["minute_of_day"].append(np.asarray(chunk["minute_of_day"][rows]))
+        selected["weekday"].append(np.asarray(chunk["weekday"][rows]))
+
+    if not selected["traffic_level"]:
+        return None, columns
+
+    return {name: np.concatenate(arrays) for name, arrays in selected.items()}, columns
+
+
+def __group_statistics(values, groups, groups_count):
+    """ Count, minimum, maximum, mean and median of the values of each group (NaN values are not used, as the null
+    values in MongoDB)
+    Args:
+        values: The flat array of values
+        groups: The code of the group of each value
+        groups_count: The amount of groups
+    Returns:
+        A dictionary with an array of each statistic (NaN for the groups without values)"""
+
+    valid = ~np.isnan(values)
+    values = values[valid].astype(np.float64)
+    groups = groups[valid]
+
+    order = np.lexsort((values, groups))
+    values = values[order]
+    groups = groups[order]
+
+    starts = np.searchsorted(groups, np.arange(groups_count), side="left")
+    ends = np.searchsorted(groups, np.arange(groups_count), side="right")
+    count = ends - starts
+    has_values = count > 0
+
+    statistics = {name: np.full(groups_count, np.nan) for name in ["min", "max", "avg", "median"]}
+    if len(values) == 0:
+        return statistics
+
+    sums = np.bincount(groups, weights=values, minlength=groups_count)
+    lower = starts + (count - 1) // 2
+    upper = starts + count // 2
+
+    statistics["min"][has_values] = values[starts[has_values]]
+    statistics["max"][has_values] = values[ends[has_values] - 1]
+    statistics["avg"][has_values] = sums[has_values] / count[has_values]
+    statistics["median"][has_values] = (values[lower[has_values]] + values[upper[has_values]]) / 2
+
+    return statistics
+
+
+def __to_value(value):
+    return None if np.isnan(value) else float(value)
+
+
+def __group_rows(selected, groups, groups_count, ids, with_interpolated=True, time_sorts=None):
+    # As '$sum: 1' in MongoDB, every link of a snapshot is counted (even without traffic level), but not the edges that
+    # are not in the snapshot
+    present = selected["present"].ravel()
+    amount_of_data = np.bincount(groups.ravel(), weights=present, minlength=groups_count).astype(np.int64)
+    interpolated = np.bincount(groups.ravel(), weights=present & ~selected["api_data"].ravel(),
+                               minlength=groups_count)
+    traffic_level = __group_statistics(selected["traffic_level"].ravel(), groups.ravel(), groups_count)
+    current_speed = __group_statistics(selected["current_speed"].ravel(), groups.ravel(), groups_count)
+
+    rows = []
+    for code in np.flatnonzero(amount_of_data):
+        row = {"_id": ids[code]}
+        for name, statistics in [("TrafficLevel", traffic_level), ("CurrentSpeed", current_speed)]:
+            for statistic in ["min", "max", "avg", "median"]:
+                row[f"{statistic}{name}"] = __to_value(statistics[statistic][code])
+        row["amountOfData"] = int(amount_of_data[code])
+        if with_interpolated:
+            row["amountOfTimesInterpolated"] = int(interpolated[code])
+        if time_sorts is not None:
+            row["timeSort"] = time_sorts[code]
+        rows.append(row)
+
+    return rows
+
+
+def __get_half_hour_labels(slot_of_day):
+    # Same '_id' and 'timeSort' as the aggregation of 'get_data_from_graphs_with_filters_by_hours'
+    hour, half_hour = slot_of_day // 2, "30" if slot_of_day % 2 else "00"
+    next_hour = hour + (1 if half_hour == "30" else 0)
+
+    time_sort = f"{'0' if hour < 10 else ''}{hour}{'0' if half_hour < '30' else ''}{half_hour}"
+    label = f"{'0' if hour < 10 else ''}{hour}:{half_hour}-{'0' if next_hour < 10 else ''}{next_hour % 24}:" \
+            f"{'30' if half_hour == '00' else '00'}"
+
+    return label, time_sort
+
+
+def get_data_from_columnar_engine(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                  end_hour_minute):
+    """ Get the data grouped by street name, by half an hour and by day of the week from the snapshots in memory, with
+    the same results as 'get_data_from_graphs_with_filters'
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names (empty for every street)
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+    Returns:
+        The groups by street name, by half an hour and by day of the week"""
+
+    # The compacted snapshots (before the retention boundary) are not in the engine
+    boundary = get_retention_boundary(db)
+    if boundary is not None and from_date < boundary:
+        return get_data_from_graphs_with_filters(db, from_date, to_date, names_pattern, highway_types,
+                                                 start_hour_minute, end_hour_minute)
+
+    refresh_engine(db)
+    if engine["edges"] is None:
+        return get_data_from_graphs_with_filters(db, from_date, to_date, names_pattern, highway_types,
+                                                 start_hour_minute, end_hour_minute)
+
+    start_hour, start_minute = [int(part) for part in start_hour_minute.split(":")]
+    end_hour, end_minute = [int(part) for part in end_hour_minute.split(":")]
+
+    selected, columns = __select(from_date, to_date, start_hour * 60 + start_minute, end_hour * 60 + end_minute,
+                                 __get_edges_mask(names_pattern, highway_types))
+    if selected is None:
+        return [], [], []
+
+    shape = selected["traffic_level"].shape
+
+    # Group by street name (the codes of the columns), by half an hour and by weekday (the codes of the rows)
+    name_groups = np.broadcast_to(engine["name_codes"][columns], shape)
+    data_by_name = __group_rows(selected, name_groups, len(engine["name_values"]), engine["name_values"])
+
+    hour_groups = np.broadcast_to((selected["minute_of_day"] // 30).astype(np.int64)[:, None], shape)
+    labels = [__get_half_hour_labels(slot_of_day) for slot_of_day in range(48)]
+    data_by_hours = __group_rows(selected, hour_groups, 48, [label for label, time_sort in labels],
+                                 time_sorts=[time_sort for label, time_sort in labels])
+    data_by_hours.sort(key=lambda row: row["timeSort"])
+
+    weekday_groups = np.broadcast_to(selected["weekday"].astype(np.int64)[:, None], shape)
+    data_by_weekday = __group_rows(selected, weekday_groups, 7, WEEKDAYS, with_interpolated=False)
+
+    return data_by_name, data_by_hours, data_by_weekday
+
+
+def __edge_statistic(values, statistic):
+    # The NaN values (no data) are not used, and the edges without values are NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if statistic == "mean":
+            return np.nanmean(values, axis=0)
+        if statistic == "median":
+            return np.nanmedian(values, axis=0)
+        return np.nanpercentile(values, 90, axis=0)
+
+
+def get_edge_statistics_from_columnar_engine(db, from_date, to_date, start_hour_minute, end_hour_minute, weekdays,
+                                             statistic):
+    """ Get a statistic of the traffic level and of the current speed of each edge over the snapshots in memory
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        weekdays: The days of the week (names of 'WEEKDAYS')
+        statistic: The statistic ('mean', 'median' or 'p90')
+    Returns:
+        The links (source, target and key) with the statistic as 'traffic_level' and 'current_speed' (None without
+        data), and 'api_data' if any of their values came from the API, or None if there are no snapshots in memory"""
+
+    refresh_engine(db)
+    if engine["edges"] is None:
+        return None
+
+    start_hour, start_minute = [int(part) for part in start_hour_minute.split(":")]
+    end_hour, end_minute = [int(part) for part in end_hour_minute.split(":")]
+
+    selected, columns = __select(from_date, to_date, start_hour * 60 + start_minute, end_hour * 60 + end_minute,
+                                 np.ones(len(engine["edges"]), dtype=bool))
+
+    traffic_level = np.full(len(engine["edges"]), np.nan)
+    current_speed = np.full(len(engine["edges"]), np.nan)
+    api_data = np.zeros(len(engine["edges"]), dtype=bool)
+    if selected is not None:
+        rows = np.isin(selected["weekday"], [WEEKDAYS.index(weekday) for weekday in weekdays])
+        if rows.any():
+            traffic_level = __edge_statistic(selected["traffic_level"][rows], statistic)
+            current_speed = __edge_statistic(selected["current_speed"][rows], statistic)
+            api_data = selected["api_data"][rows].any(axis=0)
+
+    return [
+        {"source": edge["source"], "target": edge["target"], "key": edge.get("key", 0),
+         "traffic_level": __to_value(traffic_level[i]), "current_speed": __to_value(current_speed[i]),
+         "api_data": bool(api_data[i])}
+        for i, edge in enumerate(engine["edges"])
+    ]
+
+
+def __get_edge_traffic_levels(db, from_date, to_date, source, target, key):
+    refresh_engine(db)
+    if engine["edges"] is None:
+        return None
+
+    column = engine["edges_index"].get((source, target, key))
+    if column is None:
+        return None
+
+    datetimes = [np.array([], dtype="datetime64[ms]")]
+    traffic_level = [np.array([], dtype=np.float32)]
+    for chunk in engine["chunks"]:
+        rows = np.flatnonzero((chunk["datetime"] >= np.datetime64(from_date, "ms")) &
+                              (chunk["datetime"] <= np.datetime64(to_date, "ms")))
+        datetimes.append(np.asarray(chunk["datetime"][rows]))
+        traffic_level.append(np.asarray(chunk["traffic_level"][rows, column]))
+
+    return np.concatenate(datetimes), np.concatenate(traffic_level)
+
+
+def get_edge_history(db, from_date, to_date, source, target, key=0):
+    """ Get the traffic level of an edge in the snapshots in memory (only its column is read), and its percentiles by
+    hour of the day. Without the columnar engine, the snapshots of the date range are read from MongoDB with only the
+    link of the edge
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        source: The OSM id of the source node of the edge
+        target: The OSM id of the target node of the edge
+        key: The key of the edge (parallel edges)
+    Returns:
+        A dictionary with the arrays 'datetime', 'hour' and 'traffic_level' of each snapshot, and the 10th, 50th and
+        90th percentiles of each hour of the day ('p10', 'p50' and 'p90', NaN without values), or None if the edge is
+        not in the snapshots in memory"""
+
+    if constants.COLUMNAR_ENGINE == "none":
+        datetimes, traffic_levels = get_edge_traffic_levels_from_graphs(db, from_date, to_date, source, target, key)
+        datetimes = np.array(datetimes, dtype="datetime64[ms]")
+        # The links without traffic level (None or "None") are NaN
+        traffic_level = np.array([value if isinstance(value, (int, float)) else np.nan for value in traffic_levels],
+                                 dtype=np.float32)
+    else:
+        columns = __get_edge_traffic_levels(db, from_date, to_date, source, target, key)
+        if columns is None:
+            return None
+        datetimes, traffic_level = columns
+
+    history = {"datetime": datetimes, "traffic_level": traffic_level}
+    history["hour"] = history["datetime"].astype("datetime64[h]").astype(np.int64) % 24
+
+    percentiles = np.full((3, 24), np.nan)
+    valid = ~np.isnan(history["traffic_level"])
+    for hour in range(24):
+        values = history["traffic_level"][valid & (history["hour"] == hour)]
+        if len(values) > 0:
+            percentiles[:, hour] = np.percentile(values, [10, 50, 90])
+    history["p10"], history["p50"], history["p90"] = percentiles
+
+    return history
+
+
+def to_text(value):
+    """ Get the text of a street name or highway type of an edge (the ones of the edges merged by OSMnx are lists)
+    Args:
+        value: The name or highway type
+    Returns:
+        The elements of the list separated by commas, or the value itself if it is not a list"""
+
+    if isinstance(value, list):
+        return ", ".join(str(element) for element in value)
+    return value
+
+
+def get_raw_batches_from_columnar_engine(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                         end_hour_minute, batch_rows=100000):
+    """ Get the traffic of each edge in each snapshot in memory that matches the filters, in batches of about
+    'batch_rows' rows (only the snapshots of each batch are read from the chunks)
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names (empty for every street)
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        batch_rows: The amount of rows of each batch
+    Returns:
+        A generator of dictionaries with an array for each column (datetime, source, target, key, name, highway,
+        traffic_level, current_speed and api_data), in chronological order"""
+
+    refresh_engine(db)
+    if engine["edges"] is None:
+        return
+
+    start_hour, start_minute = [int(part) for part in start_hour_minute.split(":")]
+    end_hour, end_minute = [int(part) for part in end_hour_minute.split(":")]
+
+    columns = np.flatnonzero(__get_edges_mask(names_pattern, highway_types))
+    if len(columns) == 0:
+        return
+
+    # The static columns are the same in every snapshot
+    edges = [engine["edges"][column] for column in columns]
+    static_columns = {
+        "source": np.array([edge["source"] for edge in edges], dtype=np.int64),
+        "target": np.array([edge["target"] for edge in edges], dtype=np.int64),
+        "key": np.array([edge.get("key") or 0 for edge in edges], dtype=np.int64),
+        "name": np.array([to_text(edge.get("name")) for edge in edges], dtype=object),
+        "highway": np.array([to_text(edge.get("highway")) for edge in edges], dtype=object),
+    }
+    snapshots_by_batch = max(1, batch_rows // len(columns))
+
+    for chunk in engine["chunks"]:
+        rows = np.flatnonzero((chunk["datetime"] >= np.datetime64(from_date, "ms")) &
+                              (chunk["datetime"] <= np.datetime64(to_date, "ms")) &
+                              (chunk["minute_of_day"] >= start_hour * 60 + start_minute) &
+                              (chunk["minute_of_day"] <= end_hour * 60 + end_minute))
+
+        for first in range(0, len(rows), snapshots_by_batch):
+            batch = rows[first:first + snapshots_by_batch]
+            yield {
+                "datetime": np.repeat(np.asarray(chunk["datetime"][batch]), len(columns)),
+                **{name: np.tile(values, len(batch)) for name, values in static_columns.items()},
+                **{name: np.asarray(chunk[name][batch][:, columns]).ravel()
+                   for name in ["traffic_level", "current_speed", "api_data"]},
+            }
+
+
+if __name__ == "__main__":
+    new_snapshots = build_columnar_files(get_database("TFG"), constants.COLUMNAR_FOLDER)
+    print(f"Saved {new_snapshots} new snapshots in '{constants.COLUMNAR_FOLDER}'")
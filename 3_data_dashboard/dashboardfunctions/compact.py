@@ -0,0 +1,81 @@
+import numpy as np
+
+# Edge orders already read from MongoDB (they never change once saved)
+edge_orders_cache = {}
+
+
+def get_quantization_scale(dtype="uint8"):
+    # The maximum value of the type is reserved for the edges without traffic level
+    return int(np.iinfo(dtype).max) - 1
+
+
+def dequantize(quantized, dtype="uint8"):
+    scale = get_quantization_scale(dtype)
+    values = quantized.astype(np.float64) / scale
+    values[quantized == scale + 1] = np.nan
+
+    return values
+
+
+def decode_traffic_levels(compact_document, previous_quantized=None):
+    dtype = compact_document["dtype"]
+
+    if compact_document["keyframe"]:
+        return np.frombuffer(compact_document["traffic_level"], dtype=dtype).copy()
+
+    quantized = previous_quantized.copy()
+    changed_indexes = np.frombuffer(compact_document["changed_indexes"], dtype=np.uint32)
+    quantized[changed_indexes] = np.frombuffer(compact_document["changed_values"], dtype=dtype)
+
+    return quantized
+
+
+def decode_links(edge_order, compact_document, quantized):
+    traffic_levels = dequantize(quantized, compact_document["dtype"])
+    current_speeds = traffic_levels * np.array(edge_order["maxspeeds"])
+    api_data = np.unpackbits(np.frombuffer(compact_document["api_data"], dtype=np.uint8),
+                             count=len(edge_order["links"])).astype(bool)
+
+    empty = np.isnan(traffic_levels)
+    traffic_levels = traffic_levels.tolist()
+    current_speeds = current_speeds.tolist()
+    api_data = api_data.tolist()
+
+    return [
+        {
+            **link,
+            "traffic_level": None if empty[i] else traffic_levels[i],
+            "api_data": api_data[i],
+            "current_speed": None if empty[i] else current_speeds[i]
+        }
+        for i, link in enumerate(edge_order["links"])
+    ]
+
+
+def get_edge_order(db, edge_order_id):
+    if edge_order_id not in edge_orders_cache:
+        edge_orders_cache[edge_order_id] = db["edge_orders"].find_one({"_id": edge_order_id})
+
+    return edge_orders_cache[edge_order_id]
+
+
+def __get_quantized_by_compact_document(db, compact_document):
+    # Apply every delta of the chain, from the keyframe to the given snapshot
+    chain = db["compact_graphs"].find({"keyframe_filename": compact_document["keyframe_filename"],
+                                       "chain_index": {"$lte": compact_document["chain_index"]}}) \
+        .sort("chain_index", 1)
+
+    quantized = None
+    for chain_document in chain:
+        quantized = decode_traffic_levels(chain_document, quantized)
+
+    return quantized
+
+
+def get_compact_edges_by_filename(db, filename):
+    compact_document = db["compact_graphs"].find_one({"filename": filename})
+    if not compact_document:
+        return None
+
+    quantized = __get_quantized_by_compact_document(db, compact_document)
+    return decode_links(get_edge_order(db, compact_document["edge_order"]), compact_document, quantized)
@@ -20,3 +20,51 @@ SET_UP = {
 HIGHWAY_TYPES = ['secondary', 'motorway', 'motorway_link', 'primary', 'tertiary', 'residential', 'primary_link', 'tertiary_link', 'secondary_link', 'unclassified', 'living_street']
 
 MONGO_TOKEN = os.getenv("MONGO_URI")
+
+# Cache of the results of the street, hour and weekday statistics, shared by every worker of the dashboard.
+# RESULTS_CACHE is 'disk' (RESULTS_CACHE_FOLDER), 'redis' (RESULTS_CACHE_REDIS_URL) or 'none'
+RESULTS_CACHE = os.getenv("RESULTS_CACHE", "disk")
+RESULTS_CACHE_FOLDER = os.getenv("RESULTS_CACHE_FOLDER", "cache/results")
+RESULTS_CACHE_REDIS_URL = os.getenv("RESULTS_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESULTS_CACHE_TTL_SECONDS = int(os.getenv("RESULTS_CACHE_TTL_SECONDS", 3600))
+RESULTS_CACHE_SIZE_MB = int(os.getenv("RESULTS_CACHE_SIZE_MB", 256))
+RESULTS_CACHE_MAX_ENTRIES = int(os.getenv("RESULTS_CACHE_MAX_ENTRIES", 512))
+
+# Optional in-memory engine for the street, hour and weekday statistics: 'none' (MongoDB aggregations), 'memory' (the
+# snapshots are loaded from MongoDB by each worker) or 'mmap' (the files of COLUMNAR_FOLDER, built with
+# 'python -m dashboardfunctions.columnar', are shared read-only by every worker)
+COLUMNAR_ENGINE = os.getenv("COLUMNAR_ENGINE", "none")
+COLUMNAR_FOLDER = os.getenv("COLUMNAR_FOLDER", "cache/columnar")
+
+# Snapshots of the map kept in memory (as arrays in the order of the edges), and amount of previous and next snapshots
+# loaded in the background when a snapshot is shown
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", 96))
+SNAPSHOT_PREFETCH = int(os.getenv("SNAPSHOT_PREFETCH", 3))
+
+# State of each session of the dashboard (snapshot shown, last statistics...), shared by every worker so the dashboard
+# can run with several processes. SESSION_STORE is 'disk' (SESSION_STORE_FOLDER) or 'redis' (SESSION_STORE_REDIS_URL)
+SESSION_STORE = os.getenv("SESSION_STORE", "disk")
+SESSION_STORE_FOLDER = os.getenv("SESSION_STORE_FOLDER", "cache/sessions")
+SESSION_STORE_REDIS_URL = os.getenv("SESSION_STORE_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 86400))
+SESSION_STORE_SIZE_MB = int(os.getenv("SESSION_STORE_SIZE_MB", 256))
+
+# Apply the traffic level, node type, street name and street type filters of the map in the browser, without going back
+# to the server ('false' to filter the map in the server)
+CLIENTSIDE_FILTERS = os.getenv("CLIENTSIDE_FILTERS", "true").lower() == "true"
+
+# Only send the edges inside the map shown (the size of the map in pixels is VIEWPORT_WIDTH x VIEWPORT_HEIGHT, and a
+# margin of VIEWPORT_MARGIN times the size is added on each side), simplified at low zoom ('false' to send every edge)
+VIEWPORT_CULLING = os.getenv("VIEWPORT_CULLING", "true").lower() == "true"
+VIEWPORT_WIDTH = int(os.getenv("VIEWPORT_WIDTH", 1920))
+VIEWPORT_HEIGHT = int(os.getenv("VIEWPORT_HEIGHT", 1080))
+VIEWPORT_MARGIN = float(os.getenv("VIEWPORT_MARGIN", 0.5))
+
+# Vector tiles of the edges with the traffic of each snapshot ('/tiles/<snapshot>/<z>/<x>/<y>.pbf') kept in memory
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", 4096))
+
+# Seconds between two reads of the new snapshots of the catalog of the dates (the dropdowns of the dates use the catalog)
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", 60))
+
+# Rows of each batch of the raw export ('/export/raw.<format>'), the file is encoded and sent batch by batch
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 100000))
@@ -0,0 +1,176 @@
+import math
+
+import numpy as np
+
+# Index of the edges of the map. Every copy of the edges data (Sylvereye edges) has the same order, so the index is
+# only computed again if the amount of edges changes
+index_cache = {}
+
+
+def get_edge_index(edges):
+    """ Get the index of the positions of the edges of the map by their source and target
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        A dictionary with the sorted keys of the edges and their positions, and the positions of the parallel edges
+        (same source and target) with the position of the first of them"""
+
+    if index_cache.get("size") == len(edges):
+        return index_cache
+
+    sources = np.fromiter((edge["data"]["source_osmid"] for edge in edges), dtype=np.int64, count=len(edges))
+    targets = np.fromiter((edge["data"]["target_osmid"] for edge in edges), dtype=np.int64, count=len(edges))
+
+    # The OSM ids are replaced by their position in the sorted nodes, so each (source, target) fits in one integer
+    nodes = np.unique(np.concatenate([sources, targets]))
+    keys = np.searchsorted(nodes, sources) * len(nodes) + np.searchsorted(nodes, targets)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    first = np.searchsorted(sorted_keys, sorted_keys)
+    parallel = first != np.arange(len(sorted_keys))
+
+    index_cache.clear()
+    index_cache.update({
+        "size": len(edges),
+        "nodes": nodes,
+        "sorted_keys": sorted_keys,
+        "order": order,
+        "parallel_positions": order[parallel],
+        "parallel_first_positions": order[first[parallel]],
+        "mesa_keys": [(edge["data"]["source_osmid"], edge["data"]["target_osmid"], 0) for edge in edges],
+        # Position of the first edge of each (source, target), for the lookups of a single edge (clicked edges)
+        "pair_positions": {(edge["data"]["source_osmid"], edge["data"]["target_osmid"]): i
+                           for i, edge in reversed(list(enumerate(edges)))},
+    })
+
+    return index_cache
+
+
+def get_positions(index, sources, targets):
+    """ Get the positions in the edges of the map of some links
+    Args:
+        index: The index of the edges (see 'get_edge_index')
+        sources: The array with the source of each link
+        targets: The array with the target of each link
+    Returns:
+        The array with the position of each link (-1 if it is not in the map)"""
+
+    nodes = index["nodes"]
+    sorted_keys = index["sorted_keys"]
+    if len(sorted_keys) == 0:
+        return np.full(len(sources), -1, dtype=np.int64)
+
+    source_nodes = np.searchsorted(nodes, sources).clip(max=len(nodes) - 1)
+    target_nodes = np.searchsorted(nodes, targets).clip(max=len(nodes) - 1)
+    keys = source_nodes * len(nodes) + target_nodes
+
+    # The first edge with the same key is found (the parallel edges are copied later)
+    key_positions = np.searchsorted(sorted_keys, keys).clip(max=len(sorted_keys) - 1)
+    found = (nodes[source_nodes] == sources) & (nodes[target_nodes] == targets) & (sorted_keys[key_positions] == keys)
+
+    return np.where(found, index["order"][key_positions], -1)
+
+
+def get_edge_position(index, source, target):
+    """ Get the position in the edges of the map of the edge from a source to a target
+    Args:
+        index: The index of the edges (see 'get_edge_index')
+        source: The OSM id of the source node
+        target: The OSM id of the target node
+    Returns:
+        The position of the edge, or None if it is not in the map"""
+
+    return index["pair_positions"].get((source, target))
+
+
+def new_edge_attributes(index):
+    """ Create the arrays of the attributes of the edges, without data
+    Args:
+        index: The index of the edges (see 'get_edge_index')
+    Returns:
+        A dictionary with the arrays 'traffic_level', 'current_speed' (NaN without data) and 'api_data' (-1 without
+        data)"""
+
+    return {
+        "traffic_level": np.full(index["size"], np.nan),
+        "current_speed": np.full(index["size"], np.nan),
+        "api_data": np.full(index["size"], -1, dtype=np.int8),
+    }
+
+
+def __copy_to_parallel_edges(index, attributes):
+    for values in attributes.values():
+        values[index["parallel_positions"]] = values[index["parallel_first_positions"]]
+
+    return attributes
+
+
+def set_attributes_from_links(index, attributes, links):
+    """ Set the traffic level, current speed and API data of some links (from MongoDB) to the arrays of the attributes
+    Args:
+        index: The index of the edges (see 'get_edge_index')
+        attributes: The arrays of the attributes (see 'new_edge_attributes')
+        links: The links with 'source', 'target', 'traffic_level', 'current_speed' and 'api_data'
+    Returns:
+        The arrays of the attributes"""
+
+    sources = np.fromiter((link["source"] for link in links), dtype=np.int64, count=len(links))
+    targets = np.fromiter((link["target"] for link in links), dtype=np.int64, count=len(links))
+    positions = get_positions(index, sources, targets)
+    found = positions >= 0
+
+    # None is converted to NaN, so the links without data don't overwrite the values
+    for attribute in ["traffic_level", "current_speed"]:
+        values = np.array([link.get(attribute) for link in links], dtype=np.float64)
+        with_data = found & ~np.isnan(values)
+        attributes[attribute][positions[with_data]] = values[with_data]
+
+    api_data = np.array([-1 if link.get("api_data") is None else bool(link["api_data"]) for link in links],
+                        dtype=np.int8)
+    with_data = found & (api_data != -1)
+    attributes["api_data"][positions[with_data]] = api_data[with_data]
+
+    return __copy_to_parallel_edges(index, attributes)
+
+
+def set_attributes_from_mesa(index, attributes, traffic_levels, edges):
+    """ Set the traffic level and current speed of the simulation to the arrays of the attributes
+    Args:
+        index: The index of the edges (see 'get_edge_index')
+        attributes: The arrays of the attributes (see 'new_edge_attributes')
+        traffic_levels: The traffic level of the simulation by (source, target, key)
+        edges: The edges of the map (Sylvereye edges data), used for their maximum speed
+    Returns:
+        The arrays of the attributes"""
+
+    if "maxspeeds" not in index:
+        index["maxspeeds"] = np.array([float(edge["data"]["maxspeed"]) for edge in edges])
+
+    attributes["traffic_level"][:] = [traffic_levels[key] for key in index["mesa_keys"]]
+    attributes["current_speed"][:] = attributes["traffic_level"] * index["maxspeeds"]
+
+    return attributes
+
+
+def set_attributes_to_edges(attributes, edges):
+    """ Write the arrays of the attributes in the edges of the map (the edges without data keep their values)
+    Args:
+        attributes: The arrays of the attributes (see 'new_edge_attributes')
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        The edges with the attributes"""
+
+    traffic_level = attributes["traffic_level"].tolist()
+    current_speed = attributes["current_speed"].tolist()
+    api_data = attributes["api_data"].tolist()
+
+    for i, edge in enumerate(edges):
+        if not math.isnan(traffic_level[i]):
+            edge["data"]["traffic_level"] = traffic_level[i]
+        if not math.isnan(current_speed[i]):
+            edge["data"]["current_speed"] = current_speed[i]
+        if api_data[i] != -1:
+            edge["data"]["api_data"] = bool(api_data[i])
+
+    return edges
@@ -0,0 +1,168 @@
+import csv
+import gzip
+import importlib.util
+import io
+
+import numpy as np
+
+from dashboardfunctions import constants
+from dashboardfunctions.columnar import get_raw_batches_from_columnar_engine, to_text
+from dashboardfunctions.mongo import get_raw_rows_from_graphs_with_filters
+
+# Columns of the raw export, one row for each edge in each snapshot
+EXPORT_COLUMNS = ["datetime", "source", "target", "key", "name", "highway", "traffic_level", "current_speed",
+                  "api_data"]
+
+# Formats of the raw export: mimetype and extension of the file ('parquet' and 'arrow' need pyarrow)
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrow"),
+    "csv": ("application/gzip", ".csv.gz"),
+}
+
+
+class __StreamBuffer(io.RawIOBase):
+    # File that keeps the bytes written until they are sent, so each batch is sent as soon as it is encoded
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def pop(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def get_export_formats():
+    """ Get the formats of the raw export that can be used (Parquet and Arrow only if pyarrow is installed)
+    Returns:
+        The list of the names of the formats"""
+
+    if importlib.util.find_spec("pyarrow") is None:
+        return ["csv"]
+
+    return list(EXPORT_FORMATS)
+
+
+def __rows_to_batch(rows):
+    return {
+        "datetime": np.array([row["datetime"] for row in rows], dtype="datetime64[ms]"),
+        "source": np.array([row["source"] for row in rows], dtype=np.int64),
+        "target": np.array([row["target"] for row in rows], dtype=np.int64),
+        "key": np.array([row.get("key") or 0 for row in rows], dtype=np.int64),
+        "name": np.array([to_text(row.get("name")) for row in rows], dtype=object),
+        "highway": np.array([to_text(row.get("highway")) for row in rows], dtype=object),
+        "traffic_level": np.array([row.get("traffic_level") for row in rows], dtype=np.float32),
+        "current_speed": np.array([row.get("current_speed") for row in rows], dtype=np.float32),
+        "api_data": np.array([bool(row.get("api_data")) for row in rows], dtype=bool),
+    }
+
+
+def __get_batches_from_mongo(db, filters, batch_rows):
+    rows = []
+    for row in get_raw_rows_from_graphs_with_filters(db, *filters, batch_size=min(batch_rows, 10000)):
+        rows.append(row)
+        if len(rows) == batch_rows:
+            yield __rows_to_batch(rows)
+            rows = []
+
+    if rows:
+        yield __rows_to_batch(rows)
+
+
+def __get_batches(db, filters):
+    # The snapshots in memory of the columnar engine if it is used, the raw snapshots of MongoDB otherwise
+    if constants.COLUMNAR_ENGINE != "none":
+        return get_raw_batches_from_columnar_engine(db, *filters, batch_rows=constants.EXPORT_BATCH_ROWS)
+
+    return __get_batches_from_mongo(db, filters, constants.EXPORT_BATCH_ROWS)
+
+
+def __csv_rows(batch):
+    # Empty cells for the missing values, as 'to_csv'
+    columns = {
+        "datetime": np.datetime_as_string(batch["datetime"], unit="s"),
+        **{name: ["" if value is None else value for value in batch[name]] for name in ["name", "highway"]},
+        **{name: np.where(np.isnan(batch[name]), "", batch[name].astype(object))
+           for name in ["traffic_level", "current_speed"]},
+    }
+
+    return zip(*[columns.get(name, batch[name]) for name in EXPORT_COLUMNS])
+
+
+def __stream_csv(batches, buffer):
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gzip_file:
+        text = io.TextIOWrapper(gzip_file, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+
+        for batch in batches:
+            writer.writerows(__csv_rows(batch))
+            text.flush()
+            yield buffer.pop()
+
+        text.flush()
+        text.detach()
+
+    yield buffer.pop()
+
+
+def __stream_arrow(batches, buffer, export_format):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("datetime", pa.timestamp("ms")), ("source", pa.int64()), ("target", pa.int64()),
+                        ("key", pa.int64()), ("name", pa.string()), ("highway", pa.string()),
+                        ("traffic_level", pa.float32()), ("current_speed", pa.float32()), ("api_data", pa.bool_())])
+
+    # Each batch is a row group of the Parquet file or a record batch of the Arrow stream
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(buffer, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(buffer, schema)
+
+    for batch in batches:
+        # NaN values are saved as nulls
+        writer.write_batch(pa.record_batch([pa.array(batch[name], type=schema.field(name).type, from_pandas=True)
+                                            for name in EXPORT_COLUMNS], schema=schema))
+        yield buffer.pop()
+
+    writer.close()
+    yield buffer.pop()
+
+
+def stream_raw_export(db, export_format, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                      end_hour_minute):
+    """ Export the traffic of each edge in each snapshot that matches the filters, encoded batch by batch (at most
+    EXPORT_BATCH_ROWS rows in memory), so the file can be sent while it is read
+    Args:
+        db: The database
+        export_format: The format of the file ('parquet', 'arrow' or 'csv', see 'EXPORT_FORMATS')
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names (empty for every street)
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+    Returns:
+        A generator of the bytes of the file"""
+
+    batches = __get_batches(db, (from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                 end_hour_minute))
+
+    if export_format == "csv":
+        return __stream_csv(batches, __StreamBuffer())
+
+    return __stream_arrow(batches, __StreamBuffer(), export_format)
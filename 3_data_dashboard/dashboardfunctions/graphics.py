@@ -193,3 +193,63 @@ def create_horizontal_bars_by_weekday_graph(data, selected_category):
     )
 
     return fig
+
+
+def create_edge_history_graph(history, opposite_history=None):
+    if history is None or len(history["datetime"]) == 0:
+        return go.Figure()  # Return an empty figure if there is no data
+
+    fig = go.Figure()
+
+    # Band between the 10th and the 90th percentiles of the hour of the day of each snapshot
+    fig.add_trace(go.Scatter(
+        x=history["datetime"],
+        y=history["p90"][history["hour"]],
+        mode='lines',
+        line=dict(width=0),
+        showlegend=False,
+        hoverinfo='skip'
+    ))
+    fig.add_trace(go.Scatter(
+        x=history["datetime"],
+        y=history["p10"][history["hour"]],
+        mode='lines',
+        line=dict(width=0),
+        fill='tonexty',
+        fillcolor='rgba(0, 0, 255, 0.15)',
+        name='P10-P90 of the hour'
+    ))
+    fig.add_trace(go.Scatter(
+        x=history["datetime"],
+        y=history["p50"][history["hour"]],
+        mode='lines',
+        line=dict(color='blue', width=1, dash='dot'),
+        name='Median of the hour'
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=history["datetime"],
+        y=history["traffic_level"],
+        mode='lines',
+        line=dict(color='blue', width=1.5),
+        name='Edge'
+    ))
+    if opposite_history is not None and len(opposite_history["datetime"]) > 0:
+        fig.add_trace(go.Scatter(
+            x=opposite_history["datetime"],
+            y=opposite_history["traffic_level"],
+            mode='lines',
+            line=dict(color='orange', width=1.5),
+            name='Opposite edge'
+        ))
+
+    # Small graph (sparkline) with the legend below
+    fig.update_layout(
+        title='Traffic level history',
+        yaxis=dict(range=[0, 1]),
+        margin=dict(l=30, r=10, t=40, b=20),
+        legend=dict(orientation='h', y=-0.2),
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+
+    return fig
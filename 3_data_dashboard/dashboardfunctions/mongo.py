@@ -4,6 +4,11 @@ import networkx as nx
 from pymongo import MongoClient
 
 from dashboardfunctions import constants
+from dashboardfunctions.compact import get_compact_edges_by_filename
+from dashboardfunctions.retention import get_compacted_edges_by_filename, get_data_from_both_tiers
+from dashboardfunctions.street_names import street_name_index, split_street_name_patterns
+from dashboardfunctions.rollups import rollups_are_complete, get_data_from_rollups, get_rollup_match_conditions, \
+    round_hour_minute_to_slot
 
 
 def get_database(database_name="TFG"):
@@ -27,50 +32,97 @@ def get_graph_by_filename(db, filename):
 
 
 def get_edges_by_filename(db, filename):
+    # The snapshots saved with GRAPHS_STORAGE_MODE='compact' are only in 'compact_graphs', 'graphs' has the complete
+    # documents of the default mode (and of older runs)
+    edges = get_compact_edges_by_filename(db, filename)
+    if edges is not None:
+        return edges
+
     mongo_object = db["graphs"].find_one({"filename": filename})
     if mongo_object:
         return mongo_object["links"]
     else:
-        return None
+        # The snapshots older than the retention boundary are only in 'compacted_graphs'
+        return get_compacted_edges_by_filename(db, filename)
+
+
+def __raw_accumulators(with_interpolated=True):
+    accumulators = {
+        "minTrafficLevel": {"$min": "$links.traffic_level"},
+        "maxTrafficLevel": {"$max": "$links.traffic_level"},
+        "avgTrafficLevel": {"$avg": "$links.traffic_level"},
+        "medianTrafficLevel": {
+            "$median": {
+                "input": "$links.traffic_level",
+                "method": "approximate"
+            }
+        },
 
+        "minCurrentSpeed": {"$min": "$links.current_speed"},
+        "maxCurrentSpeed": {"$max": "$links.current_speed"},
+        "avgCurrentSpeed": {"$avg": "$links.current_speed"},
+        "medianCurrentSpeed": {
+            "$median": {
+                "input": "$links.current_speed",
+                "method": "approximate"
+            }
+        },
 
-def get_data_from_graphs_with_filters_by_name(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
-                                              end_hour_minute):
-    previous_to_group = __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types,
-                                                                start_hour_minute,
-                                                                end_hour_minute)
-    return db["graphs"].aggregate([
-        previous_to_group[0],
-        previous_to_group[1],
-        previous_to_group[2],
-        {
-            "$group": {
-                "_id": "$links.name",
-                "minTrafficLevel": {"$min": "$links.traffic_level"},
-                "maxTrafficLevel": {"$max": "$links.traffic_level"},
-                "avgTrafficLevel": {"$avg": "$links.traffic_level"},
-                "medianTrafficLevel": {
-                    "$median": {
-                        "input": "$links.traffic_level",
-                        "method": "approximate"
-                    }
-                },
+        "amountOfData": {"$sum": 1},
+    }
 
-                "minCurrentSpeed": {"$min": "$links.current_speed"},
-                "maxCurrentSpeed": {"$max": "$links.current_speed"},
-                "avgCurrentSpeed": {"$avg": "$links.current_speed"},
-                "medianCurrentSpeed": {
-                    "$median": {
-                        "input": "$links.current_speed",
-                        "method": "approximate"
-                    }
-                },
+    if with_interpolated:
+        accumulators["amountOfTimesInterpolated"] = {"$sum": {"$cond": {"if": "$links.api_data", "then": 0,
+                                                                        "else": 1}}}
 
-                "amountOfData": {"$sum": 1},
-                "amountOfTimesInterpolated": {"$sum": {"$cond": {"if": "$links.api_data", "then": 0, "else": 1}}}
+    return accumulators
+
+
+def __group_stages_by_name(collection, accumulators):
+    return [
+        {
+            "$group": {
+                "_id": "$name" if collection == "rollups" else "$links.name",
+                **accumulators
             }
         },
-    ])
+    ]
+
+
+def get_data_from_graphs_with_filters_by_name(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                              end_hour_minute):
+    # The snapshots older than the retention boundary are read from 'compacted_graphs'
+    def aggregate(collection, first_date, last_date, accumulators):
+        previous_to_group = __generate_stages_previous_to_group(collection, first_date, last_date, names_pattern,
+                                                                highway_types, start_hour_minute, end_hour_minute)
+        return db[collection].aggregate([
+            *previous_to_group,
+            *__group_stages_by_name(collection, accumulators)
+        ])
+
+    if rollups_are_complete(db):
+        return get_data_from_rollups(aggregate, from_date, to_date)
+
+    return get_data_from_both_tiers(db, from_date, to_date, aggregate, __raw_accumulators())
+
+
+def __generate_stages_previous_to_group(collection, from_date, to_date, names_pattern, highway_types,
+                                        start_hour_minute, end_hour_minute):
+    if collection == "compacted_graphs":
+        # The compacted documents have the time fields of the start of their half an hour, as the rollups
+        return list(__generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types,
+                                                            round_hour_minute_to_slot(start_hour_minute),
+                                                            end_hour_minute))
+
+    if collection != "rollups":
+        return list(__generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types,
+                                                            start_hour_minute, end_hour_minute))
+
+    # The rollups are already one document per street name, highway and slot, there is nothing to unwind
+    previous_to_group = __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types,
+                                                                round_hour_minute_to_slot(start_hour_minute),
+                                                                end_hour_minute)
+    return [get_rollup_match_conditions(previous_to_group)]
 
 
 def __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types, start_hour_minute,
@@ -83,34 +135,16 @@ def __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, h
 
     print(start_hour_int, start_minute_int, end_hour_int, end_minute_int)
 
+    # 'minute_of_day' is saved at ingest, so the hours filter is a range that can use the (datetime, minute_of_day)
+    # index (the pipeline adds it to the old snapshots, see 'update_data_mongo/indexes.py' in '2_refine_data')
     match_conditions = {
         "datetime": {
             "$gte": from_date,
             "$lte": to_date
         },
-        "hour_int": {
-            "$gte": start_hour_int,
-            "$lte": end_hour_int
-        },
-        "$expr": {
-            "$and": [
-                # Handle start hour minute filter
-                {
-                    "$cond": [
-                        {"$eq": ["$hour_int", start_hour_int]},  # Only for the start hour
-                        {"$gte": ["$minute_int", start_minute_int]},  # Remove the first X minutes
-                        True  # Don't apply to other hours
-                    ]
-                },
-                # Handle end hour minute filter
-                {
-                    "$cond": [
-                        {"$eq": ["$hour_int", end_hour_int]},  # Only for the end hour
-                        {"$lte": ["$minute_int", end_minute_int]},  # Remove the last Y minutes
-                        True  # Don't apply to other hours
-                    ]
-                }
-            ]
+        "minute_of_day": {
+            "$gte": start_hour_int * 60 + start_minute_int,
+            "$lte": end_hour_int * 60 + end_minute_int
         }
     }
 
@@ -122,22 +156,117 @@ def __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, h
     }
 
     if len(names_pattern) > 0:
-        regex_patterns = [{"links.name": {"$regex": pattern, "$options": "i"}} for pattern in names_pattern]
-        match_conditions_after_unwind["$or"] = regex_patterns
+        # The patterns are resolved to the exact street names with the index of the base graph, so MongoDB compares
+        # each link with a set of names instead of evaluating a regex. The patterns without names in the base graph
+        # are still compared with a case-insensitive regex
+        street_names, regex_patterns = split_street_name_patterns(street_name_index, names_pattern)
+        name_conditions = [{"links.name": {"$in": street_names}}] if street_names else []
+        name_conditions += [{"links.name": {"$regex": pattern, "$options": "i"}} for pattern in regex_patterns]
+
+        if len(name_conditions) == 1:
+            match_conditions_after_unwind["links.name"] = name_conditions[0]["links.name"]
+        elif name_conditions:
+            match_conditions_after_unwind["$or"] = name_conditions
 
     return {"$match": match_conditions}, {"$unwind": "$links"}, {"$match": match_conditions_after_unwind}
 
 
-def get_data_from_graphs_with_filters_by_hours(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
-                                               end_hour_minute):
-    previous_to_group = __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types,
-                                                                start_hour_minute, end_hour_minute)
-
+def __find_index_scans(plan):
+    # Names of the indexes scanned by the winning plan (the rejected plans are skipped)
+    if isinstance(plan, dict):
+        index_names = [plan["indexName"]] if plan.get("stage") == "IXSCAN" else []
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                index_names += __find_index_scans(value)
+        return index_names
+
+    if isinstance(plan, list):
+        return [index_name for item in plan for index_name in __find_index_scans(item)]
+
+    return []
+
+
+def get_indexes_used_by_filters(db, collection, from_date, to_date, start_hour_minute, end_hour_minute):
+    """ Check with 'explain' the indexes that the query planner uses for the date and hours filters
+    Args:
+        db: The database
+        collection: The name of the collection ('graphs', 'compacted_graphs', 'rollups'...)
+        from_date: The first datetime
+        to_date: The last datetime
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+    Returns:
+        The list of names of the scanned indexes (empty if the whole collection is scanned)"""
+
+    match = __generate_aggregation_previos_to_group(from_date, to_date, [], [], start_hour_minute, end_hour_minute)[0]
+    explain = db.command("explain", {"aggregate": collection, "pipeline": [match], "cursor": {}},
+                         verbosity="queryPlanner")
+
+    return __find_index_scans(explain)
+
+
+def get_raw_rows_from_graphs_with_filters(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                          end_hour_minute, batch_size=10000):
+    """ Get a cursor with one row for each link of each raw snapshot that matches the filters (the same filters as the
+    statistics), read from MongoDB in batches
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names (empty for every street)
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        batch_size: The amount of rows of each batch of the cursor
+    Returns:
+        The cursor of the rows (datetime, source, target, key, name, highway, traffic_level, current_speed and
+        api_data), in chronological order"""
+
+    match, unwind, match_after_unwind = __generate_aggregation_previos_to_group(from_date, to_date, names_pattern,
+                                                                                highway_types, start_hour_minute,
+                                                                                end_hour_minute)
     return db["graphs"].aggregate([
-        previous_to_group[0],
-        previous_to_group[1],
-        previous_to_group[2],
-
+        match,
+        {"$sort": {"datetime": 1}},
+        {"$project": {"datetime": 1, "links.source": 1, "links.target": 1, "links.key": 1, "links.name": 1,
+                      "links.highway": 1, "links.traffic_level": 1, "links.current_speed": 1, "links.api_data": 1}},
+        unwind,
+        match_after_unwind,
+        {"$project": {"_id": 0, "datetime": 1, "source": "$links.source", "target": "$links.target",
+                      "key": "$links.key", "name": "$links.name", "highway": "$links.highway",
+                      "traffic_level": "$links.traffic_level", "current_speed": "$links.current_speed",
+                      "api_data": "$links.api_data"}}
+    ], allowDiskUse=True, batchSize=batch_size)
+
+
+def get_edge_traffic_levels_from_graphs(db, from_date, to_date, source, target, key=0):
+    """ Get the traffic level of an edge in each raw snapshot of a date range, projecting only the link of the edge
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        source: The OSM id of the source node of the edge
+        target: The OSM id of the target node of the edge
+        key: The key of the edge (parallel edges)
+    Returns:
+        The list of the datetimes of the snapshots with the edge and the list of its traffic levels (None without
+        traffic level), in chronological order"""
+
+    # The links without key are the ones of the edges without parallel edges
+    link = {"source": source, "target": target, "key": {"$in": [key, None]} if key == 0 else key}
+    snapshots = db["graphs"].find({"datetime": {"$gte": from_date, "$lte": to_date}, "links": {"$elemMatch": link}},
+                                  {"_id": 0, "datetime": 1, "links": {"$elemMatch": link}}).sort("datetime", 1)
+
+    datetimes, traffic_levels = [], []
+    for snapshot in snapshots:
+        datetimes.append(snapshot["datetime"])
+        traffic_levels.append(snapshot["links"][0].get("traffic_level"))
+
+    return datetimes, traffic_levels
+
+
+def __group_stages_by_hours(accumulators):
+    return [
         {
             "$group": {
                 # Aproximate the _id to the nearest 30min, so we can group by half an hour, taking into account the 'hour_int' and 'minute_int' fields
@@ -151,28 +280,7 @@ def get_data_from_graphs_with_filters_by_hours(db, from_date, to_date, names_pat
                         ]
                     }
                 },
-                "minTrafficLevel": {"$min": "$links.traffic_level"},
-                "maxTrafficLevel": {"$max": "$links.traffic_level"},
-                "avgTrafficLevel": {"$avg": "$links.traffic_level"},
-                "medianTrafficLevel": {
-                    "$median": {
-                        "input": "$links.traffic_level",
-                        "method": "approximate"
-                    }
-                },
-
-                "minCurrentSpeed": {"$min": "$links.current_speed"},
-                "maxCurrentSpeed": {"$max": "$links.current_speed"},
-                "avgCurrentSpeed": {"$avg": "$links.current_speed"},
-                "medianCurrentSpeed": {
-                    "$median": {
-                        "input": "$links.current_speed",
-                        "method": "approximate"
-                    }
-                },
-
-                "amountOfData": {"$sum": 1},
-                "amountOfTimesInterpolated": {"$sum": {"$cond": {"if": "$links.api_data", "then": 0, "else": 1}}}
+                **accumulators
             },
         },
         {
@@ -204,16 +312,7 @@ def get_data_from_graphs_with_filters_by_hours(db, from_date, to_date, names_pat
                         {"$cond": [{"$eq": ["$_id.halfHour", "00"]}, "30", "00"]}
                     ]
                 },
-                "minTrafficLevel": 1,
-                "maxTrafficLevel": 1,
-                "avgTrafficLevel": 1,
-                "medianTrafficLevel": 1,
-                "minCurrentSpeed": 1,
-                "maxCurrentSpeed": 1,
-                "avgCurrentSpeed": 1,
-                "medianCurrentSpeed": 1,
-                "amountOfData": 1,
-                "amountOfTimesInterpolated": 1
+                **{field: 1 for field in accumulators}
             }
         },
         {
@@ -221,46 +320,117 @@ def get_data_from_graphs_with_filters_by_hours(db, from_date, to_date, names_pat
                 "timeSort": 1
             }
         }
-    ])
+    ]
 
 
-def get_data_from_graphs_with_filters_by_weekday(db, from_date, to_date, names_pattern, highway_types,
-                                                 start_hour_minute,
-                                                 end_hour_minute):
-    previous_to_group = __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, highway_types,
-                                                                start_hour_minute, end_hour_minute)
+def get_data_from_graphs_with_filters_by_hours(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                               end_hour_minute):
+    # The snapshots older than the retention boundary are read from 'compacted_graphs'
+    def aggregate(collection, first_date, last_date, accumulators):
+        previous_to_group = __generate_stages_previous_to_group(collection, first_date, last_date, names_pattern,
+                                                                highway_types, start_hour_minute, end_hour_minute)
 
-    return db["graphs"].aggregate([
-        previous_to_group[0],
-        previous_to_group[1],
-        previous_to_group[2],
+        return db[collection].aggregate([
+            *previous_to_group,
+            *__group_stages_by_hours(accumulators)
+        ])
+
+    if rollups_are_complete(db):
+        return get_data_from_rollups(aggregate, from_date, to_date)
+
+    return get_data_from_both_tiers(db, from_date, to_date, aggregate, __raw_accumulators(), sort_key="timeSort")
+
+
+def __group_stages_by_weekday(accumulators):
+    return [
         {
             "$group": {
                 "_id": "$day_of_week",
-                "minTrafficLevel": {"$min": "$links.traffic_level"},
-                "maxTrafficLevel": {"$max": "$links.traffic_level"},
-                "avgTrafficLevel": {"$avg": "$links.traffic_level"},
-                "medianTrafficLevel": {
-                    "$median": {
-                        "input": "$links.traffic_level",
-                        "method": "approximate"
-                    }
-                },
+                **accumulators
+            },
+        }
+    ]
+
 
-                "minCurrentSpeed": {"$min": "$links.current_speed"},
-                "maxCurrentSpeed": {"$max": "$links.current_speed"},
-                "avgCurrentSpeed": {"$avg": "$links.current_speed"},
-                "medianCurrentSpeed": {
-                    "$median": {
-                        "input": "$links.current_speed",
-                        "method": "approximate"
+def get_data_from_graphs_with_filters_by_weekday(db, from_date, to_date, names_pattern, highway_types,
+                                                 start_hour_minute,
+                                                 end_hour_minute):
+    # The snapshots older than the retention boundary are read from 'compacted_graphs'
+    def aggregate(collection, first_date, last_date, accumulators):
+        previous_to_group = __generate_stages_previous_to_group(collection, first_date, last_date, names_pattern,
+                                                                highway_types, start_hour_minute, end_hour_minute)
+
+        return db[collection].aggregate([
+            *previous_to_group,
+            *__group_stages_by_weekday(accumulators)
+        ])
+
+    if rollups_are_complete(db):
+        return get_data_from_rollups(aggregate, from_date, to_date, with_interpolated=False)
+
+    return get_data_from_both_tiers(db, from_date, to_date, aggregate, __raw_accumulators(with_interpolated=False),
+                                    with_interpolated=False)
+
+
+def get_data_from_graphs_with_filters(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
+                                      end_hour_minute):
+    """ Get the data grouped by street name, by half an hour and by day of the week with a single aggregation ('$facet'),
+    so the snapshots are filtered and unwound only once
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        names_pattern: The list of patterns of the street names (empty for every street)
+        highway_types: The list of highway types
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+    Returns:
+        The groups by street name, by half an hour and by day of the week (the same as the three functions above)"""
+
+    # Each collection (raw snapshots, compacted snapshots or rollups) is aggregated once, and each grouping takes its
+    # results from the same '$facet'
+    facet_results = {}
+
+    def aggregate_facet(facet_name):
+        def aggregate(collection, first_date, last_date, accumulators):
+            key = (collection, first_date, last_date)
+            if key not in facet_results:
+                previous_to_group = __generate_stages_previous_to_group(collection, first_date, last_date,
+                                                                        names_pattern, highway_types,
+                                                                        start_hour_minute, end_hour_minute)
+                facet_results[key] = next(db[collection].aggregate([
+                    *previous_to_group,
+                    {
+                        "$facet": {
+                            "by_name": __group_stages_by_name(collection, accumulators),
+                            "by_hours": __group_stages_by_hours(accumulators),
+                            "by_weekday": __group_stages_by_weekday(accumulators)
+                        }
                     }
-                },
+                ]))
 
-                "amountOfData": {"$sum": 1},
-            },
-        }
-    ])
+            return facet_results[key][facet_name]
+
+        return aggregate
+
+    if rollups_are_complete(db):
+        data_by_name = get_data_from_rollups(aggregate_facet("by_name"), from_date, to_date)
+        data_by_hours = get_data_from_rollups(aggregate_facet("by_hours"), from_date, to_date)
+        data_by_weekday = get_data_from_rollups(aggregate_facet("by_weekday"), from_date, to_date)
+    else:
+        # The three groupings use the same accumulators, so they can share the '$facet'
+        data_by_name = get_data_from_both_tiers(db, from_date, to_date, aggregate_facet("by_name"),
+                                                __raw_accumulators())
+        data_by_hours = get_data_from_both_tiers(db, from_date, to_date, aggregate_facet("by_hours"),
+                                                 __raw_accumulators(), sort_key="timeSort")
+        data_by_weekday = get_data_from_both_tiers(db, from_date, to_date, aggregate_facet("by_weekday"),
+                                                   __raw_accumulators())
+
+    # The groups by day of the week don't have the amount of interpolated values
+    data_by_weekday = [{key: value for key, value in row.items() if key != "amountOfTimesInterpolated"}
+                       for row in data_by_weekday]
+
+    return list(data_by_name), list(data_by_hours), data_by_weekday
 
 
 if __name__ == "__main__":
@@ -268,6 +438,11 @@ if __name__ == "__main__":
 
     import time
 
+    # The date and hours filters should scan the (datetime, minute_of_day) index, not the whole collection
+    print("Indexes used by the filters -> ",
+          get_indexes_used_by_filters(database, "graphs", datetime.datetime(2024, 5, 8, 0, 0, 0),
+                                      datetime.datetime(2024, 5, 31, 23, 59, 59), "07:30", "09:30"))
+
     # mongo_cursor = get_data_from_graphs_with_filters_by_name(database, datetime.datetime(2024, 5, 8, 0, 0, 0),
     #                                                          datetime.datetime(2024, 5, 10, 23, 59, 59),
     #                                                          [],
@@ -0,0 +1,206 @@
+from datetime import timedelta
+
+# Same histograms (sketches) as 'update_data_mongo/retention.py' in '2_refine_data'
+TRAFFIC_LEVEL_BINS = 20
+TRAFFIC_LEVEL_BIN_WIDTH = 1 / TRAFFIC_LEVEL_BINS
+CURRENT_SPEED_BINS = 26
+CURRENT_SPEED_BIN_WIDTH = 5
+
+LINK_STATIC_FIELDS = ["source", "target", "key", "osmid", "name", "highway"]
+
+
+def get_retention_boundary(db):
+    # The snapshots before the boundary are only in 'compacted_graphs' (None if the retention job was never run)
+    retention = db["retention"].find_one({"_id": "graphs"})
+    if retention:
+        return retention["boundary"]
+    else:
+        return None
+
+
+def get_compacted_edges_by_filename(db, filename):
+    compacted = db["compacted_graphs"].find_one({"filenames": filename})
+    if not compacted:
+        return None
+
+    # The snapshot was compacted, the mean of its slot is used instead
+    edges = []
+    for link in compacted["links"]:
+        count = link["count"]
+        edges.append({
+            **{field: link.get(field) for field in LINK_STATIC_FIELDS},
+            "traffic_level": link["traffic_level_sum"] / count if count > 0 else None,
+            "current_speed": link["current_speed_sum"] / count if count > 0 else None,
+            "api_data": link["api_count"] > 0
+        })
+
+    return edges
+
+
+def get_histogram_fields(prefix, bins):
+    return [f"{prefix}{i}" for i in range(bins)]
+
+
+def raw_histogram_accumulators(prefix, field, bins, bin_width):
+    # Count the values of the raw links of each bin, so they can be merged with the histograms of the compacted links
+    value = f"$links.{field}"
+    bin_expression = {"$max": [0, {"$min": [bins - 1, {"$floor": {"$divide": [value, bin_width]}}]}]}
+
+    return {
+        name: {"$sum": {"$cond": [{"$and": [{"$ne": [value, None]}, {"$eq": [bin_expression, i]}]}, 1, 0]}}
+        for i, name in enumerate(get_histogram_fields(prefix, bins))
+    }
+
+
+def compacted_accumulators(prefix="$links."):
+    # The partial aggregates are the fields of the links in 'compacted_graphs' and top level fields in 'rollups'
+    return {
+        "minTrafficLevel": {"$min": f"{prefix}traffic_level_min"},
+        "maxTrafficLevel": {"$max": f"{prefix}traffic_level_max"},
+        "sumTrafficLevel": {"$sum": f"{prefix}traffic_level_sum"},
+
+        "minCurrentSpeed": {"$min": f"{prefix}current_speed_min"},
+        "maxCurrentSpeed": {"$max": f"{prefix}current_speed_max"},
+        "sumCurrentSpeed": {"$sum": f"{prefix}current_speed_sum"},
+
+        # Every link, as '$sum: 1' over the raw links ('count' only has the ones with traffic level, and it is the only
+        # count of the documents saved before 'links' existed)
+        "amountOfData": {"$sum": {"$ifNull": [f"{prefix}links", f"{prefix}count"]}},
+        "amountOfApiData": {"$sum": f"{prefix}api_count"},
+
+        **{name: {"$sum": f"{prefix}traffic_level_hist.b{i}"}
+           for i, name in enumerate(get_histogram_fields("trafficLevelHist", TRAFFIC_LEVEL_BINS))},
+        **{name: {"$sum": f"{prefix}current_speed_hist.b{i}"}
+           for i, name in enumerate(get_histogram_fields("currentSpeedHist", CURRENT_SPEED_BINS))},
+    }
+
+
+def percentile_from_histogram(counts, bin_width, fraction):
+    """ Approximate a percentile from a histogram (interpolating inside the bin of the percentile)
+    Args:
+        counts: The amount of values of each bin
+        bin_width: The width of the bins (the first bin starts at 0)
+        fraction: The fraction of the values below the percentile (0.5 for the median)
+    Returns:
+        The approximated percentile (None if the histogram is empty)"""
+
+    total = sum(counts)
+    if total == 0:
+        return None
+
+    position = total * fraction
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count > 0 and cumulative + count >= position:
+            return (i + (position - cumulative) / count) * bin_width
+        cumulative += count
+
+    return len(counts) * bin_width
+
+
+def median_from_histogram(counts, bin_width):
+    # Approximated median of a histogram (see 'percentile_from_histogram')
+    return percentile_from_histogram(counts, bin_width, 0.5)
+
+
+def __merge_min(values):
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def __merge_max(values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def __merge_row(raw, compacted, with_interpolated):
+    if compacted is None:
+        return {key: value for key, value in raw.items() if "Hist" not in key}
+
+    raw_count = raw["amountOfData"] if raw else 0
+    count = raw_count + compacted["amountOfData"]
+
+    row = {"_id": compacted["_id"]}
+    if "timeSort" in compacted:
+        row["timeSort"] = compacted["timeSort"]
+
+    for name, prefix, bins, bin_width in [("TrafficLevel", "trafficLevelHist", TRAFFIC_LEVEL_BINS,
+                                           TRAFFIC_LEVEL_BIN_WIDTH),
+                                          ("CurrentSpeed", "currentSpeedHist", CURRENT_SPEED_BINS,
+                                           CURRENT_SPEED_BIN_WIDTH)]:
+        # The means only use the values that are not null, the ones counted in the histograms
+        raw_histogram = [raw[field] if raw else 0 for field in get_histogram_fields(prefix, bins)]
+        histogram = [compacted[field] + raw_histogram[i] for i, field in enumerate(get_histogram_fields(prefix, bins))]
+        raw_sum = raw[f"avg{name}"] * sum(raw_histogram) if raw and raw[f"avg{name}"] is not None else 0
+        values_count = sum(histogram)
+
+        row[f"min{name}"] = __merge_min([compacted[f"min{name}"], raw[f"min{name}"] if raw else None])
+        row[f"max{name}"] = __merge_max([compacted[f"max{name}"], raw[f"max{name}"] if raw else None])
+        row[f"avg{name}"] = (raw_sum + compacted[f"sum{name}"]) / values_count if values_count > 0 else None
+        row[f"median{name}"] = median_from_histogram(histogram, bin_width)
+
+    row["amountOfData"] = count
+    if with_interpolated:
+        row["amountOfTimesInterpolated"] = (raw["amountOfTimesInterpolated"] if raw else 0) + \
+                                           compacted["amountOfData"] - compacted["amountOfApiData"]
+
+    return row
+
+
+def merge_tier_results(raw_results, compacted_results, with_interpolated=True):
+    """ Merge the groups of the raw snapshots with the groups of the compacted ones
+    Args:
+        raw_results: The groups of the 'graphs' collection (with the histogram fields)
+        compacted_results: The groups of the 'compacted_graphs' collection
+        with_interpolated: A boolean to indicate if 'amountOfTimesInterpolated' should be calculated
+    Returns:
+        The list of merged groups, with the same fields as the groups of the raw snapshots"""
+
+    raw_by_id = {row["_id"]: row for row in raw_results}
+    compacted_by_id = {row["_id"]: row for row in compacted_results}
+
+    merged = [__merge_row(row, compacted_by_id.get(row["_id"]), with_interpolated) for row in raw_results]
+    merged += [__merge_row(None, row, with_interpolated) for row in compacted_results if row["_id"] not in raw_by_id]
+
+    return merged
+
+
+def get_data_from_both_tiers(db, from_date, to_date, aggregate, raw_accumulators, with_interpolated=True,
+                             sort_key=None):
+    """ Run an aggregation over the raw snapshots and, if the range starts before the retention boundary, over the
+    compacted ones too, merging both results
+    Args:
+        db: The database
+        from_date: The first datetime
+        to_date: The last datetime
+        aggregate: A function (collection name, first datetime, last datetime, accumulators) that runs the aggregation
+        raw_accumulators: The accumulators of the aggregation over the raw snapshots
+        with_interpolated: A boolean to indicate if 'amountOfTimesInterpolated' is one of the accumulators
+        sort_key: The field used to sort the merged groups (None to keep the order)
+    Returns:
+        The groups of the aggregation"""
+
+    boundary = get_retention_boundary(db)
+    if boundary is None or from_date >= boundary:
+        return aggregate("graphs", from_date, to_date, raw_accumulators)
+
+    # The raw groups also count the values of each bin, so the medians of both tiers can be merged
+    raw_results = []
+    if to_date >= boundary:
+        raw_results = list(aggregate("graphs", boundary, to_date, {
+            **raw_accumulators,
+            **raw_histogram_accumulators("trafficLevelHist", "traffic_level", TRAFFIC_LEVEL_BINS,
+                                         TRAFFIC_LEVEL_BIN_WIDTH),
+            **raw_histogram_accumulators("currentSpeedHist", "current_speed", CURRENT_SPEED_BINS,
+                                         CURRENT_SPEED_BIN_WIDTH)
+        }))
+
+    compacted_results = list(aggregate("compacted_graphs", from_date,
+                                       min(to_date, boundary - timedelta(milliseconds=1)),
+                                       compacted_accumulators()))
+
+    merged = merge_tier_results(raw_results, compacted_results, with_interpolated)
+    if sort_key is not None:
+        merged.sort(key=lambda row: row[sort_key])
+
+    return merged
@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+
+from dashboardfunctions.retention import compacted_accumulators, merge_tier_results, get_histogram_fields, \
+    percentile_from_histogram, TRAFFIC_LEVEL_BINS, TRAFFIC_LEVEL_BIN_WIDTH, CURRENT_SPEED_BINS, CURRENT_SPEED_BIN_WIDTH
+
+# Fraction of the values below each percentile statistic of the map
+STATISTIC_FRACTIONS = {"median": 0.5, "p90": 0.9}
+
+
+def rollups_are_complete(db):
+    # The rollups are only used once 'update_data_mongo/rollups.py' has built them with every saved snapshot
+    status = db["rollups_status"].find_one({"_id": "rollups"})
+    return status is not None and status.get("complete", False)
+
+
+def get_group_key(name, highway):
+    # Same key of the street name and highway of a rollup as 'update_data_mongo/rollups.py' in '2_refine_data'
+    return json.dumps([name, highway], default=str)
+
+
+def __get_first_slot(from_date):
+    # The slot of the first datetime is included, although some of its snapshots are before it
+    return datetime(from_date.year, from_date.month, from_date.day, from_date.hour, from_date.minute // 30 * 30)
+
+
+def round_hour_minute_to_slot(hour_minute):
+    # The rollups are saved by half an hour slot, so the filters start at the beginning of a slot
+    hour, minute = hour_minute.split(":")
+    return f"{hour}:{'00' if int(minute) < 30 else '30'}"
+
+
+def get_rollup_match_conditions(previous_to_group):
+    """ Move the conditions over the links (after the unwind) to the top level fields of the rollups
+    Args:
+        previous_to_group: The stages before the group of the aggregation over the raw snapshots (match, unwind and
+            match over the links)
+    Returns:
+        The match stage for the 'rollups' collection"""
+
+    match_conditions = dict(previous_to_group[0]["$match"])
+    match_conditions_after_unwind = previous_to_group[2]["$match"]
+
+    match_conditions["highway"] = match_conditions_after_unwind["links.highway"]
+    if "links.name" in match_conditions_after_unwind:
+        match_conditions["name"] = match_conditions_after_unwind["links.name"]
+    if "$or" in match_conditions_after_unwind:
+        match_conditions["$or"] = [{"name": condition["links.name"]}
+                                   for condition in match_conditions_after_unwind["$or"]]
+
+    return {"$match": match_conditions}
+
+
+def get_data_from_rollups(aggregate, from_date, to_date, with_interpolated=True):
+    """ Run an aggregation over the rollups (one document per street name, highway and half an hour slot) instead of
+    the snapshots, so the time depends on the amount of groups and not on the amount of links
+    Args:
+        aggregate: A function (collection name, first datetime, last datetime, accumulators) that runs the aggregation
+        from_date: The first datetime
+        to_date: The last datetime
+        with_interpolated: A boolean to indicate if 'amountOfTimesInterpolated' should be calculated
+    Returns:
+        The groups of the aggregation, with the same fields as the groups of the raw snapshots"""
+
+    rollup_results = list(aggregate("rollups", __get_first_slot(from_date), to_date, compacted_accumulators("$")))
+
+    # The rollups have the same partial aggregates as the compacted snapshots, so they are merged the same way
+    return merge_tier_results([], rollup_results, with_interpolated)
+
+
+def __group_statistic(group, name, histogram_prefix, bins, bin_width, statistic):
+    histogram = [group[field] for field in get_histogram_fields(histogram_prefix, bins)]
+    if statistic in STATISTIC_FRACTIONS:
+        return percentile_from_histogram(histogram, bin_width, STATISTIC_FRACTIONS[statistic])
+
+    # The mean only uses the values that are not null, the ones counted in the histogram
+    values_count = sum(histogram)
+    return group[f"sum{name}"] / values_count if values_count > 0 else None
+
+
+def get_edge_statistics_from_rollups(db, edges, from_date, to_date, start_hour_minute, end_hour_minute, weekday_ints,
+                                     statistic):
+    """ Get a statistic of the traffic level and of the current speed of each edge from the rollups, so the map can show
+    it without the snapshots in memory. The rollups are by street name and highway, so each edge has the statistic of
+    its street (the median and the percentile are approximated from the histograms)
+    Args:
+        db: The database
+        edges: The edges of the map (Sylvereye edges data)
+        from_date: The first datetime
+        to_date: The last datetime
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        weekday_ints: The days of the week (0 is Monday)
+        statistic: The statistic ('mean', 'median' or 'p90')
+    Returns:
+        The links (source, target and key) with the statistic as 'traffic_level' and 'current_speed', and 'api_data' if
+        any of their values came from the API, or None if the rollups are not complete"""
+
+    if not rollups_are_complete(db):
+        return None
+
+    start_hour, start_minute = [int(part) for part in round_hour_minute_to_slot(start_hour_minute).split(":")]
+    end_hour, end_minute = [int(part) for part in end_hour_minute.split(":")]
+
+    groups = db["rollups"].aggregate([
+        {
+            "$match": {
+                "datetime": {"$gte": __get_first_slot(from_date), "$lte": to_date},
+                "minute_of_day": {"$gte": start_hour * 60 + start_minute, "$lte": end_hour * 60 + end_minute},
+                "weekday_int": {"$in": list(weekday_ints)}
+            }
+        },
+        {"$group": {"_id": "$group", **compacted_accumulators("$")}}
+    ])
+
+    statistics = {}
+    for group in groups:
+        statistics[group["_id"]] = {
+            "traffic_level": __group_statistic(group, "TrafficLevel", "trafficLevelHist", TRAFFIC_LEVEL_BINS,
+                                               TRAFFIC_LEVEL_BIN_WIDTH, statistic),
+            "current_speed": __group_statistic(group, "CurrentSpeed", "currentSpeedHist", CURRENT_SPEED_BINS,
+                                               CURRENT_SPEED_BIN_WIDTH, statistic),
+            "api_data": group["amountOfApiData"] > 0
+        }
+
+    links = []
+    for edge in edges:
+        data = edge["data"]
+        group_statistics = statistics.get(get_group_key(data.get("name"), data.get("highway")))
+        if group_statistics is not None:
+            links.append({"source": data["source_osmid"], "target": data["target_osmid"], "key": data.get("key", 0),
+                          **group_statistics})
+
+    return links
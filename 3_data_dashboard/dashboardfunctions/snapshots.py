@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from dashboardfunctions import constants
+from dashboardfunctions.catalog import get_catalog_neighbours
+from dashboardfunctions.compact import get_compact_edges_by_filename
+from dashboardfunctions.edge_index import get_edge_index, new_edge_attributes, set_attributes_from_links, \
+    set_attributes_to_edges
+from dashboardfunctions.retention import get_compacted_edges_by_filename
+
+LINKS_PROJECTION = {"links.source": 1, "links.target": 1, "links.traffic_level": 1, "links.current_speed": 1,
+                    "links.api_data": 1}
+
+# Decoded snapshots by filename (least recently used first), shared by the callbacks and the prefetch threads
+snapshot_cache = OrderedDict()
+snapshot_cache_lock = threading.Lock()
+prefetch_executor = ThreadPoolExecutor(max_workers=2)
+prefetching = set()
+
+# Edges of the map with the data of the last snapshots shown, shared by every session of the process
+SNAPSHOT_EDGES_CACHE_SIZE = 8
+snapshot_edges_cache = OrderedDict()
+
+
+def __read_links(db, filename):
+    # The snapshots are saved in 'compact_graphs' (GRAPHS_STORAGE_MODE='compact'), in 'graphs' (the complete documents
+    # of the default mode and of older runs) or, older than the retention boundary, in 'compacted_graphs'
+    links = get_compact_edges_by_filename(db, filename)
+    if links is not None:
+        return links
+
+    # Only the fields of the links that change between snapshots are read
+    mongo_object = db["graphs"].find_one({"filename": filename}, LINKS_PROJECTION)
+    if mongo_object:
+        return mongo_object["links"]
+
+    return get_compacted_edges_by_filename(db, filename)
+
+
+def load_snapshot(db, filename, edges):
+    """ Read a snapshot from MongoDB as arrays in the order of the edges of the map
+    Args:
+        db: The database
+        filename: The filename of the snapshot
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        A dictionary with the arrays 'traffic_level', 'current_speed' (NaN without data) and 'api_data' (-1 without
+        data), or None if the snapshot doesn't exist"""
+
+    links = __read_links(db, filename)
+    if not links:
+        return None
+
+    index = get_edge_index(edges)
+    return set_attributes_from_links(index, new_edge_attributes(index), links)
+
+
+def __cache_snapshot(filename, snapshot):
+    with snapshot_cache_lock:
+        snapshot_cache[filename] = snapshot
+        snapshot_cache.move_to_end(filename)
+        while len(snapshot_cache) > constants.SNAPSHOT_CACHE_SIZE:
+            snapshot_cache.popitem(last=False)
+
+
+def __prefetch_snapshot(db, filename, edges):
+    try:
+        snapshot = load_snapshot(db, filename, edges)
+        if snapshot is not None:
+            __cache_snapshot(filename, snapshot)
+    finally:
+        with snapshot_cache_lock:
+            prefetching.discard(filename)
+
+
+def get_neighbour_filenames(db, filename, amount):
+    """ Get the filenames of the previous and next snapshots (the ones in 'dates')
+    Args:
+        db: The database
+        filename: The filename of the snapshot (with the extensions)
+        amount: The amount of previous and next snapshots
+    Returns:
+        The list of filenames, the nearest first"""
+
+    # The neighbours are found in the catalog of the snapshots, without a query
+    snapshot_datetime = datetime.strptime(filename.split(".")[0], "%Y_%m_%d_%H_%M_%S")
+    return get_catalog_neighbours(db, snapshot_datetime, amount)
+
+
+def prefetch_neighbours(db, filename, edges, amount=None):
+    # The neighbour snapshots are read in background threads, so stepping through a day doesn't wait for MongoDB
+    if amount is None:
+        amount = constants.SNAPSHOT_PREFETCH
+    if amount <= 0:
+        return
+
+    for neighbour in get_neighbour_filenames(db, filename, amount):
+        with snapshot_cache_lock:
+            if neighbour in snapshot_cache or neighbour in prefetching:
+                continue
+            prefetching.add(neighbour)
+
+        prefetch_executor.submit(__prefetch_snapshot, db, neighbour, edges)
+
+
+def get_snapshot(db, filename, edges):
+    """ Get a snapshot from the cache (or from MongoDB), and start the prefetch of its neighbours
+    Args:
+        db: The database
+        filename: The filename of the snapshot
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        The arrays of the snapshot (see 'load_snapshot'), or None if the snapshot doesn't exist"""
+
+    with snapshot_cache_lock:
+        snapshot = snapshot_cache.get(filename)
+        if snapshot is not None:
+            snapshot_cache.move_to_end(filename)
+
+    if snapshot is None:
+        snapshot = load_snapshot(db, filename, edges)
+        if snapshot is not None:
+            __cache_snapshot(filename, snapshot)
+
+    if snapshot is not None:
+        prefetch_neighbours(db, filename, edges)
+
+    return snapshot
+
+
+def apply_snapshot(snapshot, edges):
+    """ Set the traffic level, current speed and API data of a snapshot to the edges of the map (the edges without data
+    in the snapshot keep their values)
+    Args:
+        snapshot: The arrays of the snapshot (see 'load_snapshot')
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        The edges with the data of the snapshot"""
+
+    return set_attributes_to_edges(snapshot, edges)
+
+
+def copy_edges(edges):
+    # The data of each edge is copied, so the attributes of a snapshot can be set without changing the base graph
+    return [{**edge, "data": dict(edge["data"])} for edge in edges]
+
+
+def get_snapshot_edges(db, filename, base_edges):
+    """ Get the edges of the map with the data of a snapshot. The edges are shared by every session of the process, so
+    they must not be modified (copy them first)
+    Args:
+        db: The database
+        filename: The filename of the snapshot (None for the base graph)
+        base_edges: The edges of the base graph (Sylvereye edges data)
+    Returns:
+        The edges with the data of the snapshot, or the base edges if the snapshot doesn't exist"""
+
+    if filename is None:
+        return base_edges
+
+    with snapshot_cache_lock:
+        edges = snapshot_edges_cache.get(filename)
+        if edges is not None:
+            snapshot_edges_cache.move_to_end(filename)
+            return edges
+
+    snapshot = get_snapshot(db, filename, base_edges)
+    if snapshot is None:
+        return base_edges
+
+    edges = apply_snapshot(snapshot, copy_edges(base_edges))
+    with snapshot_cache_lock:
+        snapshot_edges_cache[filename] = edges
+        while len(snapshot_edges_cache) > SNAPSHOT_EDGES_CACHE_SIZE:
+            snapshot_edges_cache.popitem(last=False)
+
+    return edges
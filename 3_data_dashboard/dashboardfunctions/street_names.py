@@ -0,0 +1,126 @@
+import unicodedata
+
+import numpy as np
+
+# Index of the street names of the map, built from the edges of the base graph (they never change, so the index is only
+# computed again if the amount of edges changes)
+street_name_index = {}
+
+
+def normalize_street_name(name):
+    # Lower case, without accents and with single spaces, so "Avenida Andalucía" is found with "avenida andalucia"
+    decomposed = unicodedata.normalize("NFKD", name)
+    without_accents = "".join(character for character in decomposed if not unicodedata.combining(character))
+    return " ".join(without_accents.lower().split())
+
+
+def __get_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def get_street_name_index(edges):
+    """ Get the index of the street names of the edges of the map
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        A dictionary with the street names, their normalised names, the positions of the edges of each name and the
+        names of each trigram"""
+
+    if street_name_index.get("size") == len(edges):
+        return street_name_index
+
+    name_positions = {}
+    for i, edge in enumerate(edges):
+        names = edge["data"].get("name")
+        # Some edges have a list of names (the edge is found with any of them)
+        for name in (names if isinstance(names, list) else [names]):
+            if isinstance(name, str) and name.strip():
+                name_positions.setdefault(name, []).append(i)
+
+    names = sorted(name_positions)
+    normalized_names = [normalize_street_name(name) for name in names]
+
+    trigram_names = {}
+    for name_id, normalized_name in enumerate(normalized_names):
+        for trigram in __get_trigrams(normalized_name):
+            trigram_names.setdefault(trigram, set()).add(name_id)
+
+    street_name_index.clear()
+    street_name_index.update({
+        "size": len(edges),
+        "names": names,
+        "normalized_names": normalized_names,
+        "positions": [np.array(name_positions[name], dtype=np.int64) for name in names],
+        "trigram_names": trigram_names,
+    })
+
+    return street_name_index
+
+
+def __find_name_ids(index, pattern):
+    pattern = normalize_street_name(pattern)
+    if not pattern:
+        return []
+
+    # Only the names with every trigram of the pattern are compared (all of them if the pattern is shorter)
+    trigrams = __get_trigrams(pattern)
+    if trigrams:
+        candidates = sorted(set.intersection(*[index["trigram_names"].get(trigram, set()) for trigram in trigrams]))
+    else:
+        candidates = range(len(index["names"]))
+
+    return [name_id for name_id in candidates if pattern in index["normalized_names"][name_id]]
+
+
+def split_street_name_patterns(index, patterns):
+    """ Get the street names of the patterns found in the index, and the patterns without any of them (they can match
+    names that are not in the base graph, or be regular expressions, so they are compared with a regex instead)
+    Args:
+        index: The index of the street names (see 'get_street_name_index')
+        patterns: The list of partial names (case and accents are ignored)
+    Returns:
+        The sorted list of street names and the list of patterns not found"""
+
+    name_ids = set()
+    patterns_not_found = []
+    for pattern in patterns:
+        pattern_name_ids = __find_name_ids(index, pattern) if index else []
+        if pattern_name_ids:
+            name_ids.update(pattern_name_ids)
+        elif normalize_street_name(pattern):
+            patterns_not_found.append(pattern)
+
+    return [index["names"][name_id] for name_id in sorted(name_ids)], patterns_not_found
+
+
+def get_street_names_mask(index, patterns):
+    """ Get the mask of the edges with a street name that contains any of the patterns
+    Args:
+        index: The index of the street names (see 'get_street_name_index')
+        patterns: The list of partial names (case and accents are ignored)
+    Returns:
+        The boolean array with one value for each edge of the map"""
+
+    mask = np.zeros(index["size"], dtype=bool)
+    for pattern in patterns:
+        for name_id in __find_name_ids(index, pattern):
+            mask[index["positions"][name_id]] = True
+
+    return mask
+
+
+def get_street_name_suggestions(index, text, limit=10):
+    """ Get the street names to suggest while a name is written
+    Args:
+        index: The index of the street names (see 'get_street_name_index')
+        text: The text written
+        limit: The maximum amount of suggestions
+    Returns:
+        The list of street names, first the ones that start with the text and then the ones with more edges"""
+
+    pattern = normalize_street_name(text)
+    name_ids = __find_name_ids(index, text)
+    name_ids.sort(key=lambda name_id: (not index["normalized_names"][name_id].startswith(pattern),
+                                       -len(index["positions"][name_id]), index["names"][name_id]))
+
+    return [index["names"][name_id] for name_id in name_ids[:limit]]
@@ -0,0 +1,115 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from shapely import LineString, clip_by_rect
+
+from dashboardfunctions import constants
+from dashboardfunctions.snapshots import get_snapshot, get_snapshot_edges
+from dashboardfunctions.viewport import get_viewport_index, get_viewport_mask, get_level_of_detail_band, \
+    get_level_of_detail_coords
+from mapfunctions.utils import get_geojson_corners_coordinates
+
+# Size of the tiles in tile coordinates, and size of the border around each tile (the edges are clipped to the tile
+# with the border, so the lines are joined without gaps between tiles)
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_LAYER_NAME = "traffic"
+
+# Attributes of the edges saved in the features of the tiles
+TILE_ATTRIBUTES = ["name", "highway", "traffic_level", "current_speed"]
+
+# Tiles already encoded, by snapshot, zoom, x and y (the least recently used ones are removed when there are more than
+# TILE_CACHE_SIZE)
+tile_cache = OrderedDict()
+tile_cache_lock = threading.Lock()
+
+
+def __to_tile_coordinates(coords, zoom, x_tile, y_tile):
+    # Web Mercator, with the origin in the top left corner of the tile
+    tiles = 2 ** zoom
+    points = []
+    for lat, lon in coords:
+        x = (lon + 180) / 360 * tiles - x_tile
+        y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * tiles - y_tile
+        points.append((x * TILE_EXTENT, y * TILE_EXTENT))
+
+    return points
+
+
+def __get_tile_bounds(zoom, x_tile, y_tile):
+    corners = get_geojson_corners_coordinates(x_tile, y_tile, zoom)
+    lats = [corner[0] for corner in corners]
+    lons = [corner[1] for corner in corners]
+
+    # The bounds include the border of the tile
+    lat_buffer = (max(lats) - min(lats)) * TILE_BUFFER / TILE_EXTENT
+    lon_buffer = (max(lons) - min(lons)) * TILE_BUFFER / TILE_EXTENT
+
+    return min(lats) - lat_buffer, min(lons) - lon_buffer, max(lats) + lat_buffer, max(lons) + lon_buffer
+
+
+def __get_feature_properties(data):
+    properties = {}
+    for attribute in TILE_ATTRIBUTES:
+        value = data.get(attribute)
+        if isinstance(value, list):
+            value = ", ".join(str(item) for item in value)
+        # The tiles can't save empty values (None, "None" or NaN)
+        if value is None or value == "None" or (isinstance(value, float) and math.isnan(value)):
+            continue
+        properties[attribute] = value
+
+    return properties
+
+
+def get_traffic_tile(db, filename, zoom, x_tile, y_tile, base_edges):
+    """ Get a vector tile (Mapbox Vector Tile) with the edges of the map and the traffic of a snapshot
+    Args:
+        db: The database
+        filename: The filename of the snapshot (None for the base graph)
+        zoom: The zoom of the tile
+        x_tile: The x coordinate of the tile
+        y_tile: The y coordinate of the tile
+        base_edges: The edges of the base graph (Sylvereye edges data)
+    Returns:
+        The bytes of the tile, or None if the snapshot doesn't exist"""
+
+    key = (filename, zoom, x_tile, y_tile)
+    with tile_cache_lock:
+        tile = tile_cache.get(key)
+        if tile is not None:
+            tile_cache.move_to_end(key)
+            return tile
+
+    if filename is not None and get_snapshot(db, filename, base_edges) is None:
+        return None
+
+    import mapbox_vector_tile
+
+    edges = get_snapshot_edges(db, filename, base_edges)
+    index = get_viewport_index(base_edges)
+    # The edges are simplified at low zoom, as in the map
+    band = get_level_of_detail_band(zoom)
+    coords = get_level_of_detail_coords(index, base_edges, band) if band is not None else None
+
+    features = []
+    for i in np.flatnonzero(get_viewport_mask(index, __get_tile_bounds(zoom, x_tile, y_tile))):
+        edge_coords = coords[i] if coords is not None else edges[i]["coords"]
+        line = LineString(__to_tile_coordinates(edge_coords, zoom, x_tile, y_tile))
+        line = clip_by_rect(line, -TILE_BUFFER, -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER, TILE_EXTENT + TILE_BUFFER)
+        if line.is_empty:
+            continue
+
+        features.append({"geometry": line, "properties": __get_feature_properties(edges[i]["data"])})
+
+    tile = mapbox_vector_tile.encode({"name": TILE_LAYER_NAME, "features": features},
+                                     default_options={"extents": TILE_EXTENT, "y_coord_down": True})
+
+    with tile_cache_lock:
+        tile_cache[key] = tile
+        while len(tile_cache) > constants.TILE_CACHE_SIZE:
+            tile_cache.popitem(last=False)
+
+    return tile
@@ -5,15 +5,15 @@ import geojson
 
 from shapely.geometry import Point
 
-from mapfunctions.utils import float_to_hex_color, are_opposite_bearings, get_cardinal_direction_from_bearing, skip_feature
+from mapfunctions.utils import floats_to_hex_colors, are_opposite_bearings, get_cardinal_direction_from_bearing, skip_feature
 from mapfunctions.graph_functions import init_graph_point, init_graph_bbox
 
 
-def __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, error_management=False):
+def __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, stroke, error_management=False):
     property_error = False
 
     feature["properties"]["stroke-width"] = 6
-    feature["properties"]["stroke"] = float_to_hex_color(feature["properties"]["traffic_level"])
+    feature["properties"]["stroke"] = stroke
 
     feature["properties"]["aiming"] = get_cardinal_direction_from_bearing(bearing_api_edge)
     feature["properties"]["api_bearing"] = bearing_api_edge
@@ -69,6 +69,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
         coordinates_lat = []
         coordinates_lon = []
 
+        traffic_levels = []
+
         new_features = []
         i = 0
         for feature in data["features"]:
@@ -97,6 +99,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
             middle_coordinates_lon.append(middle_point[1])
             middle_coordinates_lat.append(middle_point[0])
 
+            traffic_levels.append(feature["properties"].get("traffic_level"))
+
         nearest_edges_and_distance_list = ox.distance.nearest_edges(graph, middle_coordinates_lon,
                                                                     middle_coordinates_lat, return_dist=True)
 
@@ -106,6 +110,9 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
         nearest_edges_list = nearest_edges_and_distance_list[0]
         nearest_distance_list = nearest_edges_and_distance_list[1]
 
+        # The color of every feature is computed at once
+        strokes = floats_to_hex_colors(traffic_levels)
+
         j = 0
         for feature in data["features"]:
 
@@ -147,7 +154,8 @@ def add_info_to_file(filename, folder_input, folder_output, graph,
             else:
                 feature["properties"]["splits"] = amount_splits
 
-            __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, error_management=error_management)
+            __add_properties_to_feature(feature, nearest_edge, bearing_api_edge, strokes[j],
+                                        error_management=error_management)
 
             j += 1
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the modules as the app does (from the folder of 'app.py'), and the constants need the Mapbox token
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MAPBOX_PUBLIC_TOKEN", "")
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from dashboardfunctions import catalog as catalog_module
+from dashboardfunctions.catalog import get_catalog_positions, get_catalog_options, get_catalog_neighbours, \
+    refresh_catalog
+
+
+class DatesCollection:
+    # The queries of the catalog on the 'dates' collection: every date, or the ones after a datetime, sorted
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection=None):
+        after = query.get("datetime", {}).get("$gt")
+        return DatesCursor([document for document in self.documents if after is None or document["datetime"] > after])
+
+    def count_documents(self, query):
+        return len(self.documents)
+
+
+class DatesCursor(list):
+    def sort(self, field, direction):
+        return DatesCursor(sorted(self, key=lambda document: document[field], reverse=direction < 0))
+
+
+def make_dates(datetimes):
+    return [{"datetime": date, "day_of_week": date.strftime("%A"),
+             "filename_extensions": date.strftime("%Y_%m_%d_%H_%M_%S") + ".pbf.json"} for date in datetimes]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # Every test starts with an empty catalog
+    empty_catalog = {key: value[:0] for key, value in catalog_module.catalog.items() if key != "last_refresh"}
+    monkeypatch.setattr(catalog_module, "catalog", {**empty_catalog, "last_refresh": None})
+
+    # Every 20 minutes for 3 days, from Monday 6 May 2024
+    datetimes = [datetime(2024, 5, 6) + timedelta(minutes=20 * i) for i in range(3 * 72)]
+    return {"dates": DatesCollection(make_dates(datetimes[::-1]))}
+
+
+def linear_positions(db, from_date, to_date, start_minute, end_minute, weekdays=None):
+    datetimes = sorted(document["datetime"] for document in db["dates"].documents)
+    return [i for i, date in enumerate(datetimes)
+            if from_date <= date <= to_date and start_minute <= date.hour * 60 + date.minute <= end_minute
+            and (weekdays is None or date.weekday() in weekdays)]
+
+
+@pytest.mark.parametrize("from_date, to_date, start_hour_minute, end_hour_minute, weekdays", [
+    (datetime(2024, 5, 6), datetime(2024, 5, 9), "00:00", "24:00", None),
+    (datetime(2024, 5, 6, 10, 10), datetime(2024, 5, 7, 12), "08:00", "13:40", None),
+    (datetime(2024, 5, 6), datetime(2024, 5, 9), "07:20", "07:20", [1, 2]),
+    (datetime(2024, 6, 1), datetime(2024, 6, 2), "00:00", "24:00", None),
+])
+def test_positions_match_a_linear_search(db, from_date, to_date, start_hour_minute, end_hour_minute, weekdays):
+    start_hour, start_minute = [int(part) for part in start_hour_minute.split(":")]
+    end_hour, end_minute = [int(part) for part in end_hour_minute.split(":")]
+
+    positions = get_catalog_positions(db, from_date, to_date, start_hour_minute, end_hour_minute, weekdays)
+
+    assert positions.tolist() == linear_positions(db, from_date, to_date, start_hour * 60 + start_minute,
+                                                  end_hour * 60 + end_minute, weekdays)
+
+
+def test_options_and_neighbours(db):
+    options = get_catalog_options(db, datetime(2024, 5, 7, 10), datetime(2024, 5, 7, 10, 40))
+
+    assert [option["value"] for option in options] == ["2024_05_07_10_00_00.pbf.json", "2024_05_07_10_20_00.pbf.json",
+                                                      "2024_05_07_10_40_00.pbf.json"]
+    assert options[0]["label"] == "2024/05/07 - Tuesday - 10:00  "
+
+    assert get_catalog_neighbours(db, datetime(2024, 5, 7, 10, 20), 2) == [
+        "2024_05_07_10_40_00.pbf.json", "2024_05_07_10_00_00.pbf.json",
+        "2024_05_07_11_00_00.pbf.json", "2024_05_07_09_40_00.pbf.json"]
+    assert get_catalog_neighbours(db, datetime(2024, 5, 6), 1) == ["2024_05_06_00_20_00.pbf.json"]
+
+
+def test_new_and_late_snapshots_are_read(db):
+    refresh_catalog(db, force=True)
+    db["dates"].documents += make_dates([datetime(2024, 5, 9, 1), datetime(2024, 5, 9, 2)])
+    assert len(refresh_catalog(db, force=True)["filenames"]) == 218
+
+    # A snapshot before the last one reads every snapshot again
+    db["dates"].documents += make_dates([datetime(2024, 5, 6, 0, 5)])
+    current_catalog = refresh_catalog(db, force=True)
+    assert current_catalog["filenames"][1] == "2024_05_06_00_05_00.pbf.json"
+    assert list(current_catalog["datetimes"]) == sorted(current_catalog["datetimes"])
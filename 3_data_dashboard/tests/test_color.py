@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from dashboardfunctions.color import float_to_hex_color, values_to_colors
+
+
+@pytest.mark.parametrize("min_val, max_val", [(0, 1), (5, 60), (3, 3)])
+def test_values_to_colors_matches_float_to_hex_color(min_val, max_val):
+    values = np.concatenate([np.linspace(min_val - 2, max_val + 2, 501), [min_val, max_val, np.nan]])
+
+    colors = values_to_colors(values, min_val=min_val, max_val=max_val)
+
+    expected = [int(float_to_hex_color(value, min_val=min_val, max_val=max_val)[1:], 16) for value in values]
+    assert colors.tolist() == expected
+
+
+def test_colors_of_the_limits():
+    assert [f"#{color:06X}" for color in values_to_colors([0, 0.5, 1])] == ["#FF0000", "#FFA500", "#00FF00"]
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+from dashboardfunctions import constants, columnar
+
+
+class Cursor(list):
+    def sort(self, field, direction):
+        return Cursor(sorted(self, key=lambda document: document[field], reverse=direction < 0))
+
+
+class Collection:
+    # The queries of the engine: the documents after a datetime, sorted, and the last ingest event
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+
+    def find(self, query=None, projection=None):
+        after = (query or {}).get("datetime", {}).get("$gt")
+        return Cursor([document for document in self.documents if after is None or document["datetime"] > after])
+
+    def find_one(self, query=None, sort=None):
+        return None
+
+
+def make_link(source, traffic_level, api_data, name="Calle Larios"):
+    return {"source": source, "target": source + 1, "key": 0, "name": name, "highway": "primary",
+            "traffic_level": traffic_level, "current_speed": None if traffic_level is None else traffic_level * 50,
+            "api_data": api_data}
+
+
+@pytest.fixture
+def database(monkeypatch):
+    # 10:00 has every link, 10:40 has only null levels and 11:10 doesn't have the second link
+    graphs = [
+        {"datetime": datetime(2024, 5, 6, 10, 0), "links": [make_link(1, 0.5, True), make_link(2, 0.25, False)]},
+        {"datetime": datetime(2024, 5, 6, 10, 40), "links": [make_link(1, None, False), make_link(2, None, True)]},
+        {"datetime": datetime(2024, 5, 6, 11, 10), "links": [make_link(1, 1.0, False)]},
+    ]
+    db = {"graphs": Collection(graphs), "compact_graphs": Collection(), "retention": Collection(),
+          "ingest_events": Collection()}
+
+    monkeypatch.setattr(constants, "COLUMNAR_ENGINE", "memory")
+    monkeypatch.setattr(columnar, "engine", {**columnar.engine, "edges": None, "chunks": [], "last_datetime": None,
+                                             "last_ingest": None})
+    return db
+
+
+def test_amount_of_data_counts_links_without_traffic_level(database):
+    data_by_name, data_by_hours, data_by_weekday = columnar.get_data_from_columnar_engine(
+        database, datetime(2024, 5, 6), datetime(2024, 5, 7), [], ["primary"], "00:00", "23:59")
+
+    # As '$sum: 1' in MongoDB, the null levels are counted but the missing link is not
+    assert [(row["_id"], row["amountOfData"], row["amountOfTimesInterpolated"]) for row in data_by_name] == \
+           [("Calle Larios", 5, 3)]
+    assert data_by_name[0]["avgTrafficLevel"] == pytest.approx(1.75 / 3)
+    assert [row["amountOfData"] for row in data_by_weekday] == [5]
+
+
+def test_time_sort_of_a_half_hour_without_traffic_level(database):
+    data_by_hours = columnar.get_data_from_columnar_engine(
+        database, datetime(2024, 5, 6), datetime(2024, 5, 7), [], ["primary"], "00:00", "23:59")[1]
+
+    # The half an hour with only null levels keeps its own 'timeSort'
+    assert [(row["_id"], row["timeSort"], row["amountOfData"]) for row in data_by_hours] == [
+        ("10:00-10:30", "10000", 2),
+        ("10:30-11:00", "1030", 2),
+        ("11:00-11:30", "11000", 1),
+    ]
+    assert data_by_hours[1]["avgTrafficLevel"] is None
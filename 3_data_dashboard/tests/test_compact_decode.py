@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from dashboardfunctions.compact import decode_traffic_levels, decode_links
+
+EDGE_ORDER = {"links": [{"source": i, "target": i + 1, "key": 0} for i in range(3)], "maxspeeds": [50.0, 30.0, 40.0]}
+
+
+def test_decode_a_chain():
+    # Keyframe [0, 127, empty] and a delta that changes the first and the last edges (254 is a traffic level of 1)
+    keyframe = {"dtype": "uint8", "keyframe": True, "traffic_level": np.array([0, 127, 255], dtype=np.uint8).tobytes(),
+                "api_data": np.packbits([True, False, True]).tobytes()}
+    delta = {"dtype": "uint8", "keyframe": False, "changed_indexes": np.array([0, 2], dtype=np.uint32).tobytes(),
+             "changed_values": np.array([255, 254], dtype=np.uint8).tobytes(),
+             "api_data": np.packbits([False, False, True]).tobytes()}
+
+    keyframe_quantized = decode_traffic_levels(keyframe)
+    delta_quantized = decode_traffic_levels(delta, keyframe_quantized)
+
+    assert keyframe_quantized.tolist() == [0, 127, 255]
+    assert delta_quantized.tolist() == [255, 127, 254]
+
+    links = decode_links(EDGE_ORDER, delta, delta_quantized)
+    assert [link["traffic_level"] for link in links] == [None, pytest.approx(0.5), 1.0]
+    assert [link["current_speed"] for link in links] == [None, pytest.approx(15.0), 40.0]
+    assert [link["api_data"] for link in links] == [False, False, True]
+    assert links[1]["source"] == 1
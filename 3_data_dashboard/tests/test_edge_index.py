@@ -0,0 +1,39 @@
+import numpy as np
+
+from dashboardfunctions.edge_index import get_edge_index, get_positions, get_edge_position
+
+
+def make_edges(pairs):
+    return [{"data": {"source_osmid": source, "target_osmid": target}} for source, target in pairs]
+
+
+def test_get_positions_matches_a_linear_search():
+    rng = np.random.default_rng(0)
+    pairs = [(int(source), int(target)) for source, target in rng.integers(1000, 1100, size=(300, 2))]
+    edges = make_edges(pairs)
+    index = get_edge_index(edges)
+
+    sources = rng.integers(990, 1110, size=500)
+    targets = rng.integers(990, 1110, size=500)
+    positions = get_positions(index, sources, targets)
+
+    for source, target, position in zip(sources, targets, positions):
+        expected = next((i for i, pair in enumerate(pairs) if pair == (source, target)), -1)
+        assert position == expected
+
+
+def test_parallel_edges_point_to_the_first_one():
+    edges = make_edges([(1, 2), (2, 3), (1, 2), (3, 1)])
+    index = get_edge_index(edges)
+
+    assert get_positions(index, np.array([1, 3, 5]), np.array([2, 1, 1])).tolist() == [0, 3, -1]
+    assert index["parallel_positions"].tolist() == [2]
+    assert index["parallel_first_positions"].tolist() == [0]
+    assert get_edge_position(index, 1, 2) == 0
+    assert get_edge_position(index, 2, 1) is None
+
+
+def test_empty_map():
+    index = get_edge_index([])
+
+    assert get_positions(index, np.array([1]), np.array([2])).tolist() == [-1]
@@ -0,0 +1,74 @@
+import csv
+import gzip
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from dashboardfunctions import constants, export
+from dashboardfunctions.export import EXPORT_COLUMNS, stream_raw_export
+
+ROWS = [
+    {"datetime": datetime(2024, 5, 6, 10, 0), "source": 1, "target": 2, "key": 0, "name": "Calle Larios",
+     "highway": "primary", "traffic_level": 0.5, "current_speed": 25.0, "api_data": True},
+    {"datetime": datetime(2024, 5, 6, 10, 0), "source": 2, "target": 3, "name": ["Calle Larios", "Plaza Mayor"],
+     "highway": ["primary", "secondary"], "traffic_level": None, "current_speed": None, "api_data": False},
+    {"datetime": datetime(2024, 5, 6, 10, 20), "source": 1, "target": 2, "key": 1, "name": None,
+     "highway": "residential", "traffic_level": 0.25, "current_speed": 10.0, "api_data": None},
+]
+
+FILTERS = (datetime(2024, 5, 6), datetime(2024, 5, 7), [], ["primary"], "00:00", "23:59")
+
+
+@pytest.fixture
+def mongo_rows(monkeypatch):
+    # The rows of MongoDB are read in batches of 2 rows
+    monkeypatch.setattr(constants, "COLUMNAR_ENGINE", "none")
+    monkeypatch.setattr(constants, "EXPORT_BATCH_ROWS", 2)
+    monkeypatch.setattr(export, "get_raw_rows_from_graphs_with_filters", lambda db, *filters, batch_size: iter(ROWS))
+
+
+def test_csv_export(mongo_rows):
+    parts = list(stream_raw_export(None, "csv", *FILTERS))
+
+    rows = list(csv.reader(io.StringIO(gzip.decompress(b"".join(parts)).decode("utf-8"))))
+    assert len(parts) == 3
+    assert rows == [
+        EXPORT_COLUMNS,
+        ["2024-05-06T10:00:00", "1", "2", "0", "Calle Larios", "primary", "0.5", "25.0", "True"],
+        ["2024-05-06T10:00:00", "2", "3", "0", "Calle Larios, Plaza Mayor", "primary, secondary", "", "", "False"],
+        ["2024-05-06T10:20:00", "1", "2", "1", "", "residential", "0.25", "10.0", "False"],
+    ]
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_arrow_exports(mongo_rows, export_format):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    data = b"".join(stream_raw_export(None, export_format, *FILTERS))
+
+    if export_format == "parquet":
+        table = pq.read_table(io.BytesIO(data))
+    else:
+        table = pa.ipc.open_stream(data).read_all()
+    assert table.column_names == EXPORT_COLUMNS
+    assert table.num_rows == 3
+    assert table.column("name").to_pylist() == ["Calle Larios", "Calle Larios, Plaza Mayor", None]
+    assert table.column("traffic_level").to_pylist() == [0.5, None, 0.25]
+    assert table.column("datetime").to_pylist()[2] == datetime(2024, 5, 6, 10, 20)
+
+
+def test_export_from_the_columnar_engine(monkeypatch):
+    batch = {"datetime": np.array(["2024-05-06T10:00"], dtype="datetime64[ms]"), "source": np.array([1]),
+             "target": np.array([2]), "key": np.array([0]), "name": np.array(["Calle Larios"], dtype=object),
+             "highway": np.array(["primary"], dtype=object), "traffic_level": np.array([np.nan], dtype=np.float32),
+             "current_speed": np.array([12.5], dtype=np.float32), "api_data": np.array([True])}
+    monkeypatch.setattr(constants, "COLUMNAR_ENGINE", "memory")
+    monkeypatch.setattr(export, "get_raw_batches_from_columnar_engine", lambda db, *filters, batch_rows: [batch])
+
+    rows = list(csv.reader(io.StringIO(gzip.decompress(b"".join(stream_raw_export(None, "csv", *FILTERS)))
+                                       .decode("utf-8"))))
+
+    assert rows[1] == ["2024-05-06T10:00:00", "1", "2", "0", "Calle Larios", "primary", "", "12.5", "True"]
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from dashboardfunctions.retention import get_histogram_fields, percentile_from_histogram, TRAFFIC_LEVEL_BINS, \
+    CURRENT_SPEED_BINS
+from dashboardfunctions.rollups import get_edge_statistics_from_rollups, get_group_key
+
+
+class Collection:
+    # The queries of the rollups: the status document and the aggregation (which returns the groups already made)
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.pipelines = []
+
+    def find_one(self, query=None):
+        return self.documents[0] if self.documents else None
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(self.documents)
+
+
+def make_group(name, highway, traffic_levels, api_count):
+    traffic_level_hist = [0] * TRAFFIC_LEVEL_BINS
+    for traffic_level in traffic_levels:
+        traffic_level_hist[min(int(traffic_level * TRAFFIC_LEVEL_BINS), TRAFFIC_LEVEL_BINS - 1)] += 1
+
+    return {
+        "_id": get_group_key(name, highway),
+        "sumTrafficLevel": sum(traffic_levels),
+        "sumCurrentSpeed": 0,
+        "amountOfApiData": api_count,
+        **dict(zip(get_histogram_fields("trafficLevelHist", TRAFFIC_LEVEL_BINS), traffic_level_hist)),
+        **{field: 0 for field in get_histogram_fields("currentSpeedHist", CURRENT_SPEED_BINS)},
+    }
+
+
+def make_edge(source, name, highway):
+    return {"data": {"source_osmid": source, "target_osmid": source + 1, "name": name, "highway": highway}}
+
+
+def test_percentile_from_histogram():
+    assert percentile_from_histogram([0, 0], 0.5, 0.9) is None
+    # 10 values in the first bin: the 90th percentile is at 9/10 of it
+    assert percentile_from_histogram([10, 0], 0.5, 0.9) == pytest.approx(0.45)
+    assert percentile_from_histogram([5, 5], 0.5, 0.5) == pytest.approx(0.5)
+
+
+def test_edge_statistics_from_rollups():
+    rollups = Collection([make_group("Calle Larios", "primary", [0.2, 0.4], 0),
+                          make_group(["Alameda", "Calle Larios"], ["primary", "secondary"], [0.9], 1)])
+    db = {"rollups_status": Collection([{"_id": "rollups", "complete": True}]), "rollups": rollups}
+    edges = [make_edge(1, "Calle Larios", "primary"), make_edge(2, "Calle Larios", "secondary"),
+             make_edge(3, ["Alameda", "Calle Larios"], ["primary", "secondary"])]
+
+    links = get_edge_statistics_from_rollups(db, edges, datetime(2024, 5, 6, 10, 40), datetime(2024, 5, 7), "10:40",
+                                             "12:00", [0, 1], "mean")
+
+    # Each edge has the statistic of its street, and the edges of other streets have no data
+    assert [(link["source"], link["traffic_level"], link["current_speed"], link["api_data"]) for link in links] == [
+        (1, pytest.approx(0.3), None, False),
+        (3, pytest.approx(0.9), None, True),
+    ]
+
+    # The filters start at the beginning of the half an hour of the first datetime and hour
+    match = rollups.pipelines[0][0]["$match"]
+    assert match["datetime"]["$gte"] == datetime(2024, 5, 6, 10, 30)
+    assert match["minute_of_day"] == {"$gte": 630, "$lte": 720}
+    assert match["weekday_int"] == {"$in": [0, 1]}
+
+
+def test_edge_statistics_without_complete_rollups():
+    db = {"rollups_status": Collection(), "rollups": Collection()}
+
+    assert get_edge_statistics_from_rollups(db, [], datetime(2024, 5, 6), datetime(2024, 5, 7), "00:00", "23:59",
+                                            [0], "median") is None
@@ -0,0 +1,50 @@
+import multiprocessing
+
+import pytest
+
+from dashboardfunctions import constants
+from dashboardfunctions import session as session_module
+from dashboardfunctions.session import get_session_state, update_session_state
+
+
+@pytest.fixture
+def disk_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "SESSION_STORE", "disk")
+    monkeypatch.setattr(constants, "SESSION_STORE_FOLDER", str(tmp_path))
+    monkeypatch.setattr(session_module, "session_store", None)
+    yield tmp_path
+    session_module.session_store = None
+
+
+def update_field(session_id, field, times):
+    # Each process opens its own cache, as the workers of the dashboard
+    session_module.session_store = None
+    for i in range(times):
+        update_session_state(session_id, **{field: i})
+
+
+def test_update_keeps_other_values(disk_store):
+    update_session_state("a", datetime_graph="2024_05_08_10_00_00.pbf.json")
+    state = update_session_state("a", map_aggregate="mean")
+
+    assert state == {"datetime_graph": "2024_05_08_10_00_00.pbf.json", "map_aggregate": "mean"}
+    assert get_session_state("a") == state
+    assert get_session_state("b") == {}
+
+
+def test_update_without_session(disk_store):
+    assert update_session_state(None, map_aggregate="mean") == {"map_aggregate": "mean"}
+    assert get_session_state(None) == {}
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_updates_of_different_fields(disk_store):
+    # Two workers updating different values of the same session at the same time don't lose each other's values
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=update_field, args=("a", field, 200)) for field in ["first", "second"]]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert get_session_state("a") == {"first": 199, "second": 199}
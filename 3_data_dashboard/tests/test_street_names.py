@@ -0,0 +1,48 @@
+from dashboardfunctions.street_names import normalize_street_name, get_street_name_index, \
+    split_street_name_patterns, get_street_names_mask, get_street_name_suggestions
+
+NAMES = ["Avenida Andalucía", "Calle Larios", "Calle Álamos", None, ["Calle Larios", "Plaza  Mayor"], "Larios"]
+
+
+def make_index():
+    return get_street_name_index([{"data": {"name": name}} for name in NAMES])
+
+
+def test_normalize_street_name():
+    assert normalize_street_name("  Avenida   ANDALUCÍA ") == "avenida andalucia"
+
+
+def test_index_of_the_names():
+    index = make_index()
+
+    assert index["names"] == ["Avenida Andalucía", "Calle Larios", "Calle Álamos", "Larios", "Plaza  Mayor"]
+    assert index["positions"][1].tolist() == [1, 4]
+    assert index["trigram_names"]["ari"] == {1, 3}
+
+
+def test_mask_matches_a_substring_search():
+    index = make_index()
+
+    for patterns in [["larios"], ["ALAMOS", "mayor"], ["al"], ["andalucia"], ["nothing"]]:
+        expected = [any(normalize_street_name(pattern) in normalize_street_name(name)
+                        for name in (names if isinstance(names, list) else [names or ""]) for pattern in patterns)
+                    for names in NAMES]
+        assert get_street_names_mask(index, patterns).tolist() == expected
+
+
+def test_split_street_name_patterns():
+    index = make_index()
+
+    names, patterns_not_found = split_street_name_patterns(index, ["larios", "^calle", "Nueva", " "])
+
+    assert names == ["Calle Larios", "Larios"]
+    assert patterns_not_found == ["^calle", "Nueva"]
+    # Without the index every pattern is compared with a regex
+    assert split_street_name_patterns({}, ["larios"]) == ([], ["larios"])
+
+
+def test_suggestions_start_with_the_text():
+    index = make_index()
+
+    assert get_street_name_suggestions(index, "lar") == ["Larios", "Calle Larios"]
+    assert get_street_name_suggestions(index, "calle", limit=2) == ["Calle Larios", "Calle Álamos"]
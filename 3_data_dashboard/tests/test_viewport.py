@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pytest
+
+from dashboardfunctions import constants
+from dashboardfunctions.viewport import get_viewport_bounds, get_viewport_index, get_viewport_mask, \
+    get_level_of_detail_band, get_level_of_detail_coords
+
+
+def mercator_y(lat, zoom):
+    return 256 * 2 ** zoom * (1 - math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / math.pi) / 2
+
+
+@pytest.fixture
+def viewport(monkeypatch):
+    monkeypatch.setattr(constants, "VIEWPORT_WIDTH", 1024)
+    monkeypatch.setattr(constants, "VIEWPORT_HEIGHT", 512)
+    monkeypatch.setattr(constants, "VIEWPORT_MARGIN", 0)
+
+
+def test_bounds_at_the_equator(viewport):
+    # At zoom 2 the world is 1024 pixels wide, so the map shows every longitude
+    min_lat, min_lon, max_lat, max_lon = get_viewport_bounds([0, 0], 2)
+
+    assert (min_lon, max_lon) == pytest.approx((-180, 180))
+    assert min_lat == pytest.approx(-max_lat)
+    assert max_lat == pytest.approx(math.degrees(math.atan(math.sinh(math.pi / 2))))
+
+
+def test_bounds_are_centered_and_shrink_with_the_zoom(viewport):
+    center = [36.7197, -4.4745]
+
+    min_lat, min_lon, max_lat, max_lon = get_viewport_bounds(center, 16)
+    zoomed = get_viewport_bounds(center, 17)
+
+    assert (min_lon + max_lon) / 2 == pytest.approx(center[1])
+    assert min_lat < center[0] < max_lat
+    # Each side is half the height of the map in Web Mercator pixels (a pixel covers less latitude to the north)
+    assert mercator_y(center[0], 16) - mercator_y(max_lat, 16) == pytest.approx(256)
+    assert mercator_y(min_lat, 16) - mercator_y(center[0], 16) == pytest.approx(256)
+    assert max_lat - center[0] < center[0] - min_lat
+    assert zoomed[3] - zoomed[1] == pytest.approx((max_lon - min_lon) / 2)
+
+
+def test_margin_extends_the_bounds(viewport, monkeypatch):
+    min_lat, min_lon, max_lat, max_lon = get_viewport_bounds([36.7, -4.4], 15)
+    monkeypatch.setattr(constants, "VIEWPORT_MARGIN", 0.5)
+
+    wider = get_viewport_bounds([36.7, -4.4], 15)
+
+    assert wider[3] - wider[1] == pytest.approx(2 * (max_lon - min_lon))
+    assert wider[0] < min_lat and wider[2] > max_lat
+
+
+def test_viewport_mask_and_level_of_detail():
+    edges = [{"coords": [[0, 0], [0.00001, 0.5], [0, 1]]}, {"coords": [[5, 5], [6, 6]]}]
+    index = get_viewport_index(edges)
+
+    assert get_viewport_mask(index, (-1, -1, 1, 0.2)).tolist() == [True, False]
+    assert get_viewport_mask(index, (4, 4, 10, 10)).tolist() == [False, True]
+
+    assert [get_level_of_detail_band(zoom) for zoom in [10, 13, 14.5, 15]] == ["13", "15", "15", None]
+    coords = get_level_of_detail_coords(index, edges, "13")
+    assert coords[0] == [[0.0, 0.0], [0.0, 1.0]]
+    assert coords[1] == edges[1]["coords"]
+    assert np.array_equal(get_level_of_detail_coords(index, edges, "13"), coords)
@@ -1,10 +1,9 @@
-import copy
 import json
 import time
 
 import pandas as pd
 
-from dash import Dash, no_update
+from dash import Dash, Patch, no_update
 from dash.dash_table import DataTable
 from dash.dependencies import Input, Output, State
 from dash.html import Ul, Li, Thead, Tr, Tbody, Td, Th, Label, Br, Button, Progress, Pre
@@ -16,10 +15,20 @@ from dash import html
 from dash import dcc
 
 from dashboardfunctions import constants
+from dashboardfunctions.catalog import get_catalog_options, refresh_catalog
 from dashboardfunctions.color import color_by_attribute
-from dashboardfunctions.mongo import get_database, get_available_graphs_by_date, get_edges_by_filename
+from dashboardfunctions.edge_index import get_edge_index, get_edge_position
+from dashboardfunctions.filters import get_map_masks
+from dashboardfunctions.payload import MERGE_MAP_UPDATE, FILTER_MAP_UPDATE, get_static_edges, get_map_update, \
+    get_filter_index
+from dashboardfunctions.mongo import get_database
+from dashboardfunctions.session import new_session_id, get_session_state, update_session_state
+from dashboardfunctions.snapshots import get_snapshot, get_snapshot_edges, copy_edges
+from dashboardfunctions.viewport import get_viewport_index, get_viewport_bounds, get_viewport_mask, \
+    get_level_of_detail_band, get_level_of_detail_coords
+from dashboardfunctions.street_names import get_street_name_index, get_street_name_suggestions
 from dashboardfunctions.utils import get_node_edge_options, get_road_data_from_graph_with_dictionary, \
-    add_info_from_mongo_list, get_min_max_values_from_attribute_edges_data, \
+    get_min_max_values_from_attribute_edges_data, \
     translate_float_array_to_hour_string, add_info_from_mesa_list, analyze_and_plot_simulation_data, get_simulation_name
 
 from dashboardfunctions.graphics import create_arrows
@@ -41,19 +50,28 @@ long_callback_manager = DiskcacheLongCallbackManager(cache)
 # =====================================================================================================================
 
 mongo_database = get_database("TFG")
+# Catalog of the dates of the snapshots, used by the dropdown of the dates
+refresh_catalog(mongo_database)
 node_options, edge_options = get_node_edge_options()
-nodes_data, edges_data, graph = get_road_data_from_graph_with_dictionary('./base_graph.graphml')
-
-traffic_level_file = copy.deepcopy(edges_data)
-traffic_level_simulation = copy.deepcopy(edges_data)
-
-current_datetime_graph = None
-
-# SOME INFORMATION THAT WILL BE RETRIEVED FROM THE DATABASE AND WILL BE USED TO FILTER THE DATA
-# AND TO DISPLAY THE INFORMATION ON THE DASHBOARD
-
-last_data_by_street_name = []
-last_data_by_hours = []
+nodes_data, base_edges_data, graph = get_road_data_from_graph_with_dictionary('./base_graph.graphml')
+
+# Index of the street names of the base graph, used by the name filter of the map
+street_name_index = get_street_name_index(base_edges_data)
+static_edges_data = get_static_edges(base_edges_data)
+filter_index = get_filter_index(base_edges_data, nodes_data, street_name_index)
+# R-tree of the edges, used to only send the edges inside the map shown
+viewport_index = get_viewport_index(base_edges_data)
+
+# The traffic level, node type, name and street type controls only trigger the map callback of the server if the map is
+# not filtered in the browser (CLIENTSIDE_FILTERS in .env)
+map_filter_dependency = State if constants.CLIENTSIDE_FILTERS else Input
+# The zoom and the center of the map only trigger the map callback if the edges outside the map are not sent
+# (VIEWPORT_CULLING in .env)
+map_viewport_dependency = Input if constants.VIEWPORT_CULLING else State
+
+# The base graph is shared by every session and never modified. The state of each session (snapshot shown) is kept in
+# the session store, and the result of the simulation in 'traffic-level-simulation-store', so the dashboard can run
+# with several workers
 
 # =====================================================================================================================
 #                                    BUILD THE LAYOUT OF THE DASHBOARD
@@ -63,7 +81,8 @@ last_data_by_hours = []
 app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP], long_callback_manager=long_callback_manager)
 app.title = "Traffic simulator"
 app._favicon = "favicon.ico"
-app.layout = dbc.Container([
+server = app.server
+layout = dbc.Container([
     dcc.Store(id='traffic-level-simulation-store'),
     dcc.Store(id='data-simulation-store'),
 
@@ -340,8 +359,9 @@ app.layout = dbc.Container([
                         map_center=constants.SET_UP.get("MAP_CENTER"),
                         map_zoom=constants.SET_UP.get("MAP_ZOOM"),
                         map_style=constants.SET_UP.get("MAP_STYLE"),
-                        nodes_data=nodes_data,
-                        edges_data=edges_data,
+                        # Built in the browser from the static stores (see 'MERGE_MAP_UPDATE')
+                        nodes_data=[],
+                        edges_data=[],
                         tile_layer_opacity=constants.SET_UP.get("TILE_LAYER_OPACITY"),
                         node_options=node_options,
                         edge_options=edge_options
@@ -446,8 +466,10 @@ app.layout = dbc.Container([
                         id='name-input',
                         type='text',
                         placeholder='Split multiple names with commas "," ',
+                        list='name-suggestions',
                         style={'width': '100%'}
                     ),
+                    html.Datalist(id='name-suggestions'),
                     Br(),
                     Br(),
                     dbc.Label("Type", style={'fontWeight': 'bold'}),
@@ -514,6 +536,91 @@ app.layout = dbc.Container([
                       'paddingLeft': '8%', 'paddingRight': '8%', 'backgroundColor': '#f0f0f0'})
 
 
+def serve_layout():
+    # Each page load gets a new session id
+    return html.Div([
+        dcc.Store(id='session-id', data=new_session_id()),
+        # The geometry of the map is sent once, the map callback only sends the compact updates
+        dcc.Store(id='map-static-edges', data=static_edges_data),
+        dcc.Store(id='map-static-nodes', data=nodes_data),
+        dcc.Store(id='map-update'),
+        # The simplified coordinates of each zoom band, sent once (see 'update_level_of_detail_coords')
+        dcc.Store(id='map-band-coords', data={}),
+        dcc.Store(id='map-bands', data=[]),
+        dcc.Store(id='map-filter-index', data=filter_index),
+        layout
+    ])
+
+
+app.layout = serve_layout
+
+if constants.CLIENTSIDE_FILTERS:
+    app.clientside_callback(
+        FILTER_MAP_UPDATE,
+        Output('sylvereye-roadnet', 'edges_data'),
+        Output('sylvereye-roadnet', 'nodes_data'),
+        Input('map-update', 'data'),
+        Input('range-slider-traffic-level', 'value'),
+        Input('node-type-show', 'value'),
+        Input('name-input', 'value'),
+        Input('street-type-checklist', 'value'),
+        Input('map-band-coords', 'data'),
+        State('map-static-edges', 'data'),
+        State('map-static-nodes', 'data'),
+        State('map-filter-index', 'data'),
+    )
+else:
+    app.clientside_callback(
+        MERGE_MAP_UPDATE,
+        Output('sylvereye-roadnet', 'edges_data'),
+        Output('sylvereye-roadnet', 'nodes_data'),
+        Input('map-update', 'data'),
+        Input('map-band-coords', 'data'),
+        State('map-static-edges', 'data'),
+        State('map-static-nodes', 'data'),
+    )
+
+
+def get_displayed_edges(session_id, graph_display_dropdown, traffic_level_simulation_store):
+    """ Get the edges shown in the map of a session: the ones of the simulation, or the ones of the snapshot of the
+    session (copies, as they are shared by the sessions)
+    Args:
+        session_id: The id of the session
+        graph_display_dropdown: The data shown ('date' or 'simulation')
+        traffic_level_simulation_store: The edges of the simulation (JSON string)
+    Returns:
+        The edges, and the key of their data (used by the filters to know when the traffic level changes)"""
+
+    if graph_display_dropdown == "simulation":
+        print("Getting data from the simulation")
+        data_key = ("simulation", hash(traffic_level_simulation_store))
+        # Convert to python object the json string
+        if traffic_level_simulation_store is not None:
+            traffic_level_simulation_store = json.loads(traffic_level_simulation_store)
+        return traffic_level_simulation_store, data_key
+
+    datetime_graph = get_session_state(session_id).get("datetime_graph")
+    edges = [dict(edge) for edge in get_snapshot_edges(mongo_database, datetime_graph, base_edges_data)]
+    return edges, ("date", datetime_graph)
+
+
+@app.callback(
+    Output('name-suggestions', 'children'),
+    Input('name-input', 'value'),
+)
+def update_name_suggestions(name_input):
+    # Suggest the street names for the last name written (the previous ones are kept in each suggestion)
+    if name_input is None:
+        return []
+
+    previous_names, _, text = name_input.rpartition(",")
+    if len(text.strip()) < 2:
+        return []
+
+    prefix = previous_names + ", " if previous_names else ""
+    return [html.Option(value=prefix + name) for name in get_street_name_suggestions(street_name_index, text)]
+
+
 @app.callback(
     [Output('node-x', 'children'),
 
@@ -553,12 +660,14 @@ def update_node_data(clicked_node):
      ],
     Input('sylvereye-roadnet', 'clicked_edge'),
     Input('edge-color-by', 'value'),
-
+    State('graph-display-dropdown', 'value'),
+    State('traffic-level-simulation-store', 'data'),
+    State('session-id', 'data'),
 )
-def update_edge_data(clicked_edge, edge_color_by):
+def update_edge_data(clicked_edge, edge_color_by, graph_display_dropdown, traffic_level_simulation_store, session_id):
     print("Updating edge data")
     if clicked_edge and edge_color_by is not None:
-        global edges_data
+        edges_data, data_key = get_displayed_edges(session_id, graph_display_dropdown, traffic_level_simulation_store)
 
         edge_data = clicked_edge["data"]["data"]
         edge_bearing = edge_data.get("bearing")
@@ -572,11 +681,12 @@ def update_edge_data(clicked_edge, edge_color_by):
         target_node = edge_data.get("target_osmid")
 
         if not edge_data.get("oneway"):
-            opposite_edge_data = [edge for edge in edges_data if
-                                  edge["data"]["source_osmid"] == target_node and edge["data"][
-                                      "target_osmid"] == source_node][0]
+            # The opposite edge is found with the index of the edges, without going through all of them
+            opposite_position = get_edge_position(get_edge_index(edges_data), target_node, source_node)
+            opposite_edge_data = edges_data[opposite_position] if opposite_position is not None else None
 
-            if opposite_edge_data["data"][edge_color_by] is None or opposite_edge_data["data"][edge_color_by] == "None":
+            if (opposite_edge_data is None or opposite_edge_data["data"][edge_color_by] is None
+                    or opposite_edge_data["data"][edge_color_by] == "None"):
                 opposite_edge_color_value = None
             else:
                 opposite_edge_color_value = float(opposite_edge_data["data"][edge_color_by])
@@ -586,7 +696,8 @@ def update_edge_data(clicked_edge, edge_color_by):
             opposite_edge_color_value = -1
 
         if edge_color_by != "traffic_level":
-            min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by)
+            min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by,
+                                                                            data_key=data_key)
             print(min_val, max_val)
         else:
             min_val, max_val = 0, 1
@@ -631,49 +742,40 @@ def update_display(node_size, node_transparency, edge_width, edge_transparency):
 
 
 @app.callback(
-    Output('sylvereye-roadnet', 'edges_data', allow_duplicate=True),
-    Output('sylvereye-roadnet', 'nodes_data', allow_duplicate=True),
-    Input('range-slider-traffic-level', 'value'),
-    Input('node-type-show', 'value'),
+    Output('map-update', 'data'),
+    map_filter_dependency('range-slider-traffic-level', 'value'),
+    map_filter_dependency('node-type-show', 'value'),
     Input('date-hour-dropdown', 'value'),
     Input('edge-color-by', 'value'),
 
-    Input('name-input', 'value'),
-    Input('street-type-checklist', 'value'),
+    map_filter_dependency('name-input', 'value'),
+    map_filter_dependency('street-type-checklist', 'value'),
+    map_viewport_dependency('sylvereye-roadnet', 'map_zoom'),
+    map_viewport_dependency('sylvereye-roadnet', 'map_center'),
 
     Input('graph-display-dropdown', 'value'),
 
     State('traffic-level-simulation-store', 'data'),
+    State('session-id', 'data'),
 
     prevent_initial_call=True
 )
 def update_graph_displayed_map(range_slider_traffic_level, node_type_show, date_hour_dropdown, edge_color_by,
-                               name_input, street_type_checklist, graph_display_dropdown,
-                               traffic_level_simulation_store):
+                               name_input, street_type_checklist, map_zoom, map_center, graph_display_dropdown,
+                               traffic_level_simulation_store, session_id):
     print("Loading different graph", graph_display_dropdown, date_hour_dropdown)
 
-    global nodes_data, edges_data, current_datetime_graph, traffic_level_file
-
     # Reload the base graph to a new graph with the selected date and hour
-    if date_hour_dropdown is not None and current_datetime_graph != date_hour_dropdown and graph_display_dropdown == "date":
+    datetime_graph = get_session_state(session_id).get("datetime_graph")
+    if date_hour_dropdown is not None and datetime_graph != date_hour_dropdown and graph_display_dropdown == "date":
         print("Getting data from the database")
-        edges_list_from_date_hour = get_edges_by_filename(mongo_database, date_hour_dropdown)
-
-        if edges_list_from_date_hour is not None and len(edges_list_from_date_hour) > 0:
-            traffic_level_file = add_info_from_mongo_list(edges_list_from_date_hour, traffic_level_file)
-            edges_data = traffic_level_file
-            current_datetime_graph = date_hour_dropdown
+        # The snapshot is usually in the cache, as the previous and next ones are loaded in the background
+        if get_snapshot(mongo_database, date_hour_dropdown, base_edges_data) is not None:
+            update_session_state(session_id, datetime_graph=date_hour_dropdown)
         else:
             print("No data found for the selected date and hour.")
-    elif graph_display_dropdown == "simulation":
-        print("Getting data from the simulation")
-        # Convert to python object the json string
-        if traffic_level_simulation_store is not None:
-            traffic_level_simulation_store = json.loads(traffic_level_simulation_store)
-        edges_data = traffic_level_simulation_store
-    elif graph_display_dropdown == "date" and current_datetime_graph is not None and current_datetime_graph == date_hour_dropdown:
-        print("Getting data from the previous graph")
-        edges_data = traffic_level_file
+
+    edges_data, data_key = get_displayed_edges(session_id, graph_display_dropdown, traffic_level_simulation_store)
 
     for edge in edges_data:
         if edge["data"]["traffic_level"] is None or edge["data"]["traffic_level"] == "None":
@@ -681,59 +783,45 @@ def update_graph_displayed_map(range_slider_traffic_level, node_type_show, date_
 
     # Color by attribute
     if edge_color_by is not None:
-        min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by)
+        min_val, max_val = get_min_max_values_from_attribute_edges_data(edges_data, attribute=edge_color_by,
+                                                                        data_key=data_key)
         color_by_attribute(edges_data, attribute=edge_color_by, min_val=min_val, max_val=max_val)
 
-    # Filter by traffic level
-    edges_data_filtered = [edge for edge in edges_data if edge["data"]["traffic_level"] is None or
-                           range_slider_traffic_level[0] <= edge["data"]["traffic_level"] <= range_slider_traffic_level[
-                               1]]
-
-    # Filter by name
-    if name_input is not None and len(name_input) > 0:
-        list_names = name_input.split(",")
-        list_names = [name.lower().strip() for name in list_names if
-                      name.strip()]  # Strip whitespace, convert to lower case, and exclude empty strings
-        edges_data_filtered = [
-            edge for edge in edges_data_filtered
-            if 'name' in edge["data"] and edge["data"]["name"] is not None
-               and any(partial_name in edge["data"]["name"].lower() for partial_name in list_names)
-        ]
-    # Filter by street type
-    if street_type_checklist is not None and len(street_type_checklist) > 0:
-        edges_data_filtered = [edge for edge in edges_data_filtered if edge["data"]["highway"] in street_type_checklist]
-
-    # Don't show nodes that are not connected to any edge
-    nodes_connected_to_edges = []
-    for edge in edges_data_filtered:
-        if edge["data"]["source_osmid"] not in nodes_connected_to_edges:
-            nodes_connected_to_edges.append(edge["data"]["source_osmid"])
-        if edge["data"]["target_osmid"] not in nodes_connected_to_edges:
-            nodes_connected_to_edges.append(edge["data"]["target_osmid"])
+    if constants.CLIENTSIDE_FILTERS:
+        # These filters are applied in the browser (see 'FILTER_MAP_UPDATE')
+        range_slider_traffic_level = node_type_show = name_input = street_type_checklist = None
 
-    # Filter by node type
-    show_nodes_osmids = []
-    for node in nodes_data:
-        print(node)
-        # Get node type (highway) and traffic light status
-        node_type = str(node["data"].get("highway", ""))  # Default to empty string if not present
-        node_tl = node["data"].get("traffic_light", False)  # Default to False if not present
+    # Only the edges inside the map shown are sent, simplified at low zoom
+    viewport_mask, band = None, None
+    if constants.VIEWPORT_CULLING and map_zoom is not None and map_center is not None:
+        viewport_mask = get_viewport_mask(viewport_index, get_viewport_bounds(map_center, map_zoom))
+        band = get_level_of_detail_band(map_zoom)
 
-        # Check if node type or traffic light should be shown, based on node_type_show
-        should_show = False
+    # Filter the edges and nodes with the masks of each control
+    edges_mask, nodes_mask = get_map_masks(edges_data, nodes_data, data_key, range_slider_traffic_level,
+                                           node_type_show, name_input=name_input, street_types=street_type_checklist,
+                                           viewport_mask=viewport_mask)
 
-        if node_type and node_type in node_type_show:
-            should_show = True  # Node type (highway) matches
-        elif node_tl and "traffic_light" in node_type_show:
-            should_show = True  # Traffic light node is selected
+    return get_map_update(edges_data, edges_mask, nodes_mask, band=band)
 
-        # Only include nodes that should be shown and are connected to edges
-        if should_show and node["data"]["osmid"] in nodes_connected_to_edges:
-            show_nodes_osmids.append(node["data"]["osmid"])
 
-    nodes_data_filtered = [node for node in nodes_data if node["data"]["osmid"] in show_nodes_osmids]
+if constants.VIEWPORT_CULLING:
+    @app.callback(
+        Output('map-band-coords', 'data'),
+        Output('map-bands', 'data'),
+        Input('sylvereye-roadnet', 'map_zoom'),
+        State('map-bands', 'data'),
+    )
+    def update_level_of_detail_coords(map_zoom, map_bands):
+        # The simplified coordinates of each zoom band are only added once to the store of the browser (the map updates
+        # only name their band)
+        band = get_level_of_detail_band(map_zoom) if map_zoom is not None else None
+        if band is None or band in map_bands:
+            return no_update, no_update
 
-    return edges_data_filtered, nodes_data_filtered
+        band_coords = Patch()
+        band_coords[band] = get_level_of_detail_coords(viewport_index, base_edges_data, band)
+        return band_coords, map_bands + [band]
 
 
 @app.callback(
@@ -755,21 +843,10 @@ def update_available_dates_dropdown(start_date, end_date):
         # Add 23 hours and 59 minutes to the end date
         end_datetime = end_datetime.replace(hour=23, minute=59)
 
-        available_dates = get_available_graphs_by_date(mongo_database, start_datetime, end_datetime)
-
+        # The dates are found in the catalog of the snapshots (sorted in memory), without a query
         start_hour_minutes_string, end_hour_minutes_string = translate_float_array_to_hour_string(hours_range_slider)
-        available_dates = [date for date in available_dates if
-                           start_hour_minutes_string <= date.get("datetime").strftime(
-                               "%H:%M") <= end_hour_minutes_string]
-
-        dates_list = []
-        for i in available_dates:
-            object_date = i.get("datetime")
-            object_string = object_date.strftime("%Y/%m/%d - ") + i.get("day_of_week") + object_date.strftime(
-                " - %H:%M  ")
-            dates_list.append({'label': object_string, 'value': i.get("filename_extensions")})
-
-        return dates_list
+        return get_catalog_options(mongo_database, start_datetime, end_datetime, start_hour_minutes_string,
+                                   end_hour_minutes_string)
 
 
 @app.long_callback(
@@ -816,7 +893,6 @@ def begin_simulation(set_progress,
                      date_hour_dropdown, num_agents, steps, agents_start_method,
                      agents_end_method, respawn_enabled, routing_method, traffic_level_simulation_stored,
                      fig_avg_travel_time, fig_avg_waiting_time, fig_avg_additional_time, fig_hist_waiting_time):
-    global traffic_level_simulation
     print("Simulation function")
 
     # Initialize the progress bar
@@ -860,7 +936,7 @@ def begin_simulation(set_progress,
 
         print("Simulation finished")
 
-        traffic_output = add_info_from_mesa_list(sim_traffic, traffic_level_simulation)
+        traffic_output = add_info_from_mesa_list(sim_traffic, copy_edges(base_edges_data))
 
         existing_figures = [fig_avg_travel_time, fig_avg_waiting_time, fig_avg_additional_time, fig_hist_waiting_time]
         simulation_name = get_simulation_name(date_hour_dropdown, num_agents, steps, agents_start_method,
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import numpy as np
+
+from dashboardfunctions import constants
+
+DATES_PROJECTION = {"datetime": 1, "day_of_week": 1, "filename_extensions": 1}
+
+# Catalog of the snapshots of the 'dates' collection, sorted by datetime, so the dates shown in the dropdowns are found
+# with a binary search instead of a query. The new snapshots are read every CATALOG_REFRESH_SECONDS
+catalog = {
+    "datetimes": np.array([], dtype="datetime64[ms]"),
+    "minute_of_day": np.array([], dtype=np.int16),
+    "weekday": np.array([], dtype=np.int8),
+    "filenames": [],
+    "labels": [],
+    "last_refresh": None,
+}
+catalog_lock = threading.Lock()
+
+
+def __read_dates(db, after):
+    query = {"datetime": {"$gt": after}} if after is not None else {}
+    dates = list(db["dates"].find(query, DATES_PROJECTION).sort("datetime", 1))
+
+    datetimes = [document["datetime"] for document in dates]
+    return {
+        "datetimes": np.array(datetimes, dtype="datetime64[ms]"),
+        "minute_of_day": np.array([date.hour * 60 + date.minute for date in datetimes], dtype=np.int16),
+        "weekday": np.array([date.weekday() for date in datetimes], dtype=np.int8),
+        "filenames": [document.get("filename_extensions") for document in dates],
+        # Same label as the one of the dropdown of the dates (computed once for each snapshot)
+        "labels": [document["datetime"].strftime("%Y/%m/%d - ") + str(document.get("day_of_week")) +
+                   document["datetime"].strftime(" - %H:%M  ") for document in dates],
+    }
+
+
+def refresh_catalog(db, force=False):
+    """ Read the snapshots saved after the last one of the catalog (every snapshot the first time, or if some snapshots
+    were saved before the last one)
+    Args:
+        db: The database
+        force: A boolean to refresh the catalog even if it was refreshed less than CATALOG_REFRESH_SECONDS ago
+    Returns:
+        A copy of the catalog (its arrays are replaced, not modified, by the next refresh)"""
+
+    with catalog_lock:
+        if (not force and catalog["last_refresh"] is not None
+                and time.time() - catalog["last_refresh"] < constants.CATALOG_REFRESH_SECONDS):
+            return dict(catalog)
+
+        after = catalog["datetimes"][-1].astype(object) if len(catalog["datetimes"]) > 0 else None
+        new_dates = __read_dates(db, after)
+
+        if len(catalog["filenames"]) + len(new_dates["filenames"]) == db["dates"].count_documents({}):
+            catalog["datetimes"] = np.concatenate([catalog["datetimes"], new_dates["datetimes"]])
+            catalog["minute_of_day"] = np.concatenate([catalog["minute_of_day"], new_dates["minute_of_day"]])
+            catalog["weekday"] = np.concatenate([catalog["weekday"], new_dates["weekday"]])
+            catalog["filenames"] = catalog["filenames"] + new_dates["filenames"]
+            catalog["labels"] = catalog["labels"] + new_dates["labels"]
+        else:
+            # Some snapshots were saved (or deleted) before the last one, so every snapshot is read again
+            catalog.update(__read_dates(db, None))
+
+        catalog["last_refresh"] = time.time()
+
+        return dict(catalog)
+
+
+def __get_positions(current_catalog, from_date, to_date, start_hour_minute, end_hour_minute, weekdays):
+    # Binary search of the date range, the hours and weekdays are only compared inside it
+    first = np.searchsorted(current_catalog["datetimes"], np.datetime64(from_date, "ms"), side="left")
+    last = np.searchsorted(current_catalog["datetimes"], np.datetime64(to_date, "ms"), side="right")
+
+    start_hour, start_minute = [int(part) for part in start_hour_minute.split(":")]
+    end_hour, end_minute = [int(part) for part in end_hour_minute.split(":")]
+    minute_of_day = current_catalog["minute_of_day"][first:last]
+    mask = (minute_of_day >= start_hour * 60 + start_minute) & (minute_of_day <= end_hour * 60 + end_minute)
+    if weekdays is not None:
+        mask &= np.isin(current_catalog["weekday"][first:last], weekdays)
+
+    return first + np.flatnonzero(mask)
+
+
+def get_catalog_positions(db, from_date, to_date, start_hour_minute="00:00", end_hour_minute="24:00", weekdays=None):
+    """ Get the positions in the catalog of the snapshots that match the filters
+    Args:
+        db: The database (only used to read the new snapshots)
+        from_date: The first datetime
+        to_date: The last datetime
+        start_hour_minute: The first 'hours:minutes' of each day
+        end_hour_minute: The last 'hours:minutes' of each day
+        weekdays: The days of the week (0 is Monday), all if None
+    Returns:
+        The array of the positions, in chronological order"""
+
+    return __get_positions(refresh_catalog(db), from_date, to_date, start_hour_minute, end_hour_minute, weekdays)
+
+
+def get_catalog_options(db, from_date, to_date, start_hour_minute="00:00", end_hour_minute="24:00", weekdays=None):
+    """ Get the options of the dropdown of the dates with the snapshots that match the filters
+    (see 'get_catalog_positions')
+    Returns:
+        The list of options (label and filename)"""
+
+    current_catalog = refresh_catalog(db)
+    positions = __get_positions(current_catalog, from_date, to_date, start_hour_minute, end_hour_minute, weekdays)
+
+    return [{'label': current_catalog["labels"][i], 'value': current_catalog["filenames"][i]} for i in positions]
+
+
+def get_catalog_neighbours(db, snapshot_datetime, amount):
+    """ Get the filenames of the previous and next snapshots of a datetime
+    Args:
+        db: The database (only used to read the new snapshots)
+        snapshot_datetime: The datetime of the snapshot
+        amount: The amount of previous and next snapshots
+    Returns:
+        The list of filenames, the nearest first"""
+
+    current_catalog = refresh_catalog(db)
+    datetimes = current_catalog["datetimes"]
+    following = np.searchsorted(datetimes, np.datetime64(snapshot_datetime, "ms"), side="right")
+    previous = np.searchsorted(datetimes, np.datetime64(snapshot_datetime, "ms"), side="left") - 1
+
+    filenames = []
+    for i in range(amount):
+        if following + i < len(datetimes):
+            filenames.append(current_catalog["filenames"][following + i])
+        if previous - i >= 0:
+            filenames.append(current_catalog["filenames"][previous - i])
+
+    return filenames
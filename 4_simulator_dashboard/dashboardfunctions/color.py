@@ -1,3 +1,4 @@
+import numpy as np
 
 
 def float_to_hex_color(value, dashboard_output=False, min_val=0, max_val=1):
@@ -43,14 +44,48 @@ def float_to_hex_color(value, dashboard_output=False, min_val=0, max_val=1):
     return hex_color
 
 
+def values_to_colors(values, min_val=0, max_val=1):
+    """ Convert an array of values to integer colors (0xRRGGBB) in one call, with the same colors as
+    'float_to_hex_color'
+    Args:
+        values: The array of values
+        min_val: The value shown in red
+        max_val: The value shown in green
+    Returns:
+        The array of integer colors"""
+
+    values = np.asarray(values, dtype=np.float64)
+
+    # Normalize the values to the range [0, 1] (all 0 if min_val equals max_val)
+    if max_val != min_val:
+        values = (values - min_val) / (max_val - min_val)
+    else:
+        values = np.zeros(len(values), dtype=np.float64)
+
+    # Clamp the values to the range [0, 1] (NaN is 1, as with max(0, min(1, value)))
+    values = np.where(np.isnan(values), 1.0, np.clip(values, 0, 1))
+
+    # Interpolate between red and orange below 0.5, and between orange and green above
+    low = values < 0.5
+    ratio = np.where(low, values / 0.5, (values - 0.5) / 0.5)
+    r = np.where(low, 255, 255 - 255 * ratio).astype(np.int64)
+    g = np.where(low, 0 + ratio * 165, 165 + ratio * 90).astype(np.int64)
+    b = np.zeros_like(r)
+
+    return (r << 16) | (g << 8) | b
+
+
 def color_by_attribute(edges_data, attribute="traffic_level", min_val=0, max_val=1):
-    for edge in edges_data:
+    # The edges without the attribute (None or "None") are black
+    has_value = np.zeros(len(edges_data), dtype=bool)
+    values = np.zeros(len(edges_data), dtype=np.float64)
+    for i, edge in enumerate(edges_data):
         if ("traffic_level" in edge["data"]
                 and edge["data"][attribute] is not None
                 and edge["data"][attribute] != "None"):
+            has_value[i] = True
+            values[i] = float(edge["data"][attribute])
 
-            edge["color"] = int(
-                float_to_hex_color(float(edge["data"][attribute]), dashboard_output=True, min_val=min_val, max_val=max_val),
-                base=16)
-        else:
-            edge["color"] = 0x000000
+    colors = np.where(has_value, values_to_colors(values, min_val=min_val, max_val=max_val), 0x000000)
+    for edge, color in zip(edges_data, colors.tolist()):
+        edge["color"] = color
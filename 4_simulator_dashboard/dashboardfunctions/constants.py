@@ -20,3 +20,30 @@ SET_UP = {
 HIGHWAY_TYPES = ['secondary', 'motorway', 'motorway_link', 'primary', 'tertiary', 'residential', 'primary_link', 'tertiary_link', 'secondary_link', 'unclassified', 'living_street']
 
 MONGO_TOKEN = os.getenv("MONGO_URI")
+
+# State of each session of the dashboard (snapshot shown, last statistics...), shared by every worker so the dashboard
+# can run with several processes. SESSION_STORE is 'disk' (SESSION_STORE_FOLDER) or 'redis' (SESSION_STORE_REDIS_URL)
+SESSION_STORE = os.getenv("SESSION_STORE", "disk")
+SESSION_STORE_FOLDER = os.getenv("SESSION_STORE_FOLDER", "cache/sessions")
+SESSION_STORE_REDIS_URL = os.getenv("SESSION_STORE_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 86400))
+SESSION_STORE_SIZE_MB = int(os.getenv("SESSION_STORE_SIZE_MB", 256))
+
+# Snapshots of the map kept in memory (as arrays in the order of the edges), and amount of previous and next snapshots
+# loaded in the background when a snapshot is shown
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", 96))
+SNAPSHOT_PREFETCH = int(os.getenv("SNAPSHOT_PREFETCH", 3))
+
+# Apply the traffic level, node type, street name and street type filters of the map in the browser, without going back
+# to the server ('false' to filter the map in the server)
+CLIENTSIDE_FILTERS = os.getenv("CLIENTSIDE_FILTERS", "true").lower() == "true"
+
+# Only send the edges inside the map shown (the size of the map in pixels is VIEWPORT_WIDTH x VIEWPORT_HEIGHT, and a
+# margin of VIEWPORT_MARGIN times the size is added on each side), simplified at low zoom ('false' to send every edge)
+VIEWPORT_CULLING = os.getenv("VIEWPORT_CULLING", "true").lower() == "true"
+VIEWPORT_WIDTH = int(os.getenv("VIEWPORT_WIDTH", 1920))
+VIEWPORT_HEIGHT = int(os.getenv("VIEWPORT_HEIGHT", 1080))
+VIEWPORT_MARGIN = float(os.getenv("VIEWPORT_MARGIN", 0.5))
+
+# Seconds between two reads of the new snapshots of the catalog of the dates (the dropdowns of the dates use the catalog)
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", 60))
@@ -0,0 +1,217 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from dashboardfunctions.street_names import get_street_name_index, get_street_names_mask
+
+# Columns of the edges and nodes of the map that never change (highway types, node of each edge...), and the
+# columns that change with the data shown (traffic level and API data), computed once for each data key. They are
+# shared by every session of the process, so each one is built before it is added and it is never modified
+COLUMNS_CACHE_SIZE = 8
+static_columns = OrderedDict()
+data_columns = OrderedDict()
+
+# Last masks of each filter by the values used to compute them, so changing one control only recomputes its own mask
+MASK_CACHE_SIZE = 64
+mask_cache = OrderedDict()
+
+filters_cache_lock = threading.Lock()
+
+
+def __get_cached(cache, key, compute, cache_size):
+    with filters_cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+
+    value = compute()
+
+    with filters_cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > cache_size:
+            cache.popitem(last=False)
+
+    return value
+
+
+def __get_static_columns(edges, nodes):
+    return __get_cached(static_columns, (len(edges), len(nodes)), lambda: __compute_static_columns(edges, nodes),
+                        COLUMNS_CACHE_SIZE)
+
+
+def __compute_static_columns(edges, nodes):
+    highway_masks = {}
+    for i, edge in enumerate(edges):
+        highway = edge["data"].get("highway")
+        # The edges with a list of highway types don't match any type (as in the street type checklist)
+        if isinstance(highway, str):
+            highway_masks.setdefault(highway, np.zeros(len(edges), dtype=bool))[i] = True
+
+    node_type_masks = {}
+    traffic_light_mask = np.zeros(len(nodes), dtype=bool)
+    node_positions = {}
+    for i, node in enumerate(nodes):
+        node_type = str(node["data"].get("highway", ""))
+        if node_type:
+            node_type_masks.setdefault(node_type, np.zeros(len(nodes), dtype=bool))[i] = True
+        traffic_light_mask[i] = bool(node["data"].get("traffic_light", False))
+        node_positions[node["data"]["osmid"]] = i
+
+    # Position in the nodes of the source and target of each edge (-1 if the node is not in the map)
+    sources = np.array([node_positions.get(edge["data"]["source_osmid"], -1) for edge in edges], dtype=np.int64)
+    targets = np.array([node_positions.get(edge["data"]["target_osmid"], -1) for edge in edges], dtype=np.int64)
+
+    return {
+        "sizes": (len(edges), len(nodes)),
+        "highway_masks": highway_masks,
+        "node_type_masks": node_type_masks,
+        "traffic_light_mask": traffic_light_mask,
+        "sources": sources,
+        "targets": targets,
+    }
+
+
+def __get_data_columns(edges, data_key):
+    return __get_cached(data_columns, (data_key, len(edges)), lambda: __compute_data_columns(edges, data_key),
+                        COLUMNS_CACHE_SIZE)
+
+
+def __compute_data_columns(edges, data_key):
+    # The edges without traffic level (None or "None") are NaN
+    traffic_level = np.array([edge["data"]["traffic_level"] if isinstance(edge["data"]["traffic_level"], (int, float))
+                              else np.nan for edge in edges], dtype=np.float64)
+
+    api_data_none = np.zeros(len(edges), dtype=bool)
+    api_data_strings = np.full(len(edges), "", dtype=object)
+    for i, edge in enumerate(edges):
+        if "api_data" not in edge["data"]:
+            continue
+        if edge["data"]["api_data"] is None:
+            api_data_none[i] = True
+        else:
+            api_data_strings[i] = str(edge["data"]["api_data"])
+
+    return {
+        "data_key": data_key,
+        "size": len(edges),
+        "traffic_level": traffic_level,
+        "api_data_none": api_data_none,
+        "api_data_strings": api_data_strings,
+    }
+
+
+def __get_mask(name, key, compute):
+    return __get_cached(mask_cache, (name, key), compute, MASK_CACHE_SIZE)
+
+
+def __traffic_level_mask(columns, traffic_level_range):
+    traffic_level = columns["traffic_level"]
+    with np.errstate(invalid="ignore"):
+        in_range = (traffic_level >= traffic_level_range[0]) & (traffic_level <= traffic_level_range[1])
+
+    return np.isnan(traffic_level) | in_range
+
+
+def __api_data_mask(columns, api_data):
+    return columns["api_data_none"] | np.isin(columns["api_data_strings"], [str(value) for value in api_data])
+
+
+def __any_mask(masks, values, size):
+    mask = np.zeros(size, dtype=bool)
+    for value in values:
+        if value in masks:
+            mask |= masks[value]
+
+    return mask
+
+
+def __node_type_mask(columns, node_type_show, size):
+    mask = __any_mask(columns["node_type_masks"], node_type_show, size)
+    if "traffic_light" in node_type_show:
+        mask = mask | columns["traffic_light_mask"]
+
+    return mask
+
+
+def get_map_masks(edges, nodes, data_key, traffic_level_range, node_type_show, api_data=None, name_input=None,
+                  street_types=None, viewport_mask=None):
+    """ Get the masks of the edges and nodes shown in the map. The edges without traffic level are always shown, and
+    the nodes are only shown if they are connected to a shown edge
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+        nodes: The nodes of the map (Sylvereye nodes data)
+        data_key: The key of the data of the edges (it must change when their traffic level or API data change)
+        traffic_level_range: The minimum and maximum traffic level (all if None)
+        node_type_show: The node types to show ('traffic_light' for the nodes with traffic lights, all if None)
+        api_data: The API data values to show (all if None or empty)
+        name_input: The partial names of the streets to show separated by commas (all if None or empty)
+        street_types: The street types (highway) to show (all if None or empty)
+        viewport_mask: The boolean array of the edges inside the map shown (all if None)
+    Returns:
+        The boolean arrays of the edges and of the nodes shown"""
+
+    columns = __get_static_columns(edges, nodes)
+    columns_data = __get_data_columns(edges, data_key)
+
+    edges_mask = np.ones(len(edges), dtype=bool)
+
+    if traffic_level_range is not None:
+        edges_mask = __get_mask("traffic_level", (data_key, len(edges), tuple(traffic_level_range)),
+                                lambda: __traffic_level_mask(columns_data, traffic_level_range))
+
+    if api_data is not None and len(api_data) > 0:
+        edges_mask = edges_mask & __get_mask("api_data", (data_key, len(edges), tuple(api_data)),
+                                             lambda: __api_data_mask(columns_data, api_data))
+
+    if name_input is not None and len(name_input) > 0:
+        # Strip whitespace and exclude empty strings (the index of the street names ignores case and accents)
+        names = tuple(name.strip() for name in name_input.split(",") if name.strip())
+        edges_mask = edges_mask & __get_mask("name", (columns["sizes"], names),
+                                             lambda: get_street_names_mask(get_street_name_index(edges), names))
+
+    if street_types is not None and len(street_types) > 0:
+        edges_mask = edges_mask & __get_mask("street_type", (columns["sizes"], tuple(street_types)),
+                                             lambda: __any_mask(columns["highway_masks"], street_types, len(edges)))
+
+    if viewport_mask is not None:
+        edges_mask = edges_mask & viewport_mask
+
+    # Don't show nodes that are not connected to any shown edge
+    connected = np.zeros(len(nodes) + 1, dtype=bool)
+    connected[columns["sources"][edges_mask]] = True
+    connected[columns["targets"][edges_mask]] = True
+    # The last position is the one of the nodes that are not in the map (-1)
+    nodes_mask = connected[:-1]
+
+    if node_type_show is not None:
+        nodes_mask = nodes_mask & __get_mask("node_type", (columns["sizes"], tuple(node_type_show)),
+                                             lambda: __node_type_mask(columns, node_type_show, len(nodes)))
+
+    return edges_mask, nodes_mask
+
+
+def get_edge_nodes(edges, nodes):
+    """ Get the positions in the nodes of the map of the source and target of each edge
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+        nodes: The nodes of the map (Sylvereye nodes data)
+    Returns:
+        The arrays of the positions of the sources and of the targets (-1 if the node is not in the map)"""
+
+    columns = __get_static_columns(edges, nodes)
+    return columns["sources"], columns["targets"]
+
+
+def filter_map(edges, nodes, data_key, traffic_level_range, node_type_show, api_data=None, name_input=None,
+               street_types=None):
+    """ Filter the edges and nodes shown in the map (see 'get_map_masks')
+    Returns:
+        The filtered edges and the filtered nodes"""
+
+    edges_mask, nodes_mask = get_map_masks(edges, nodes, data_key, traffic_level_range, node_type_show, api_data,
+                                           name_input, street_types)
+
+    return [edges[i] for i in np.flatnonzero(edges_mask)], [nodes[i] for i in np.flatnonzero(nodes_mask)]
@@ -4,6 +4,8 @@ import networkx as nx
 from pymongo import MongoClient
 
 from dashboardfunctions import constants
+from dashboardfunctions.compact import get_compact_edges_by_filename
+from dashboardfunctions.retention import get_compacted_edges_by_filename
 
 
 def get_database(database_name="TFG"):
@@ -27,11 +29,18 @@ def get_graph_by_filename(db, filename):
 
 
 def get_edges_by_filename(db, filename):
+    # The snapshots saved with GRAPHS_STORAGE_MODE='compact' are only in 'compact_graphs', 'graphs' has the complete
+    # documents of the default mode (and of older runs)
+    edges = get_compact_edges_by_filename(db, filename)
+    if edges is not None:
+        return edges
+
     mongo_object = db["graphs"].find_one({"filename": filename})
     if mongo_object:
         return mongo_object["links"]
     else:
-        return None
+        # The snapshots older than the retention boundary are only in 'compacted_graphs'
+        return get_compacted_edges_by_filename(db, filename)
 
 
 def get_data_from_graphs_with_filters_by_name(db, from_date, to_date, names_pattern, highway_types, start_hour_minute,
@@ -83,32 +92,17 @@ def __generate_aggregation_previos_to_group(from_date, to_date, names_pattern, h
 
     print(start_hour_int, start_minute_int, end_hour_int, end_minute_int)
 
+    # 'minute_of_day' is saved at ingest, so the hours filter is a range that can use the (datetime, minute_of_day)
+    # index (the pipeline adds it to the old snapshots, see 'update_data_mongo/indexes.py' in '2_refine_data')
     match_conditions = {
         "datetime": {
             "$gte": from_date,
             "$lte": to_date
         },
-        "hour_int": {
-            "$gte": start_hour_int,
-            "$lte": end_hour_int
-        },
-        # "$expr": {
-        #     "$and": [
-        #         {"$gte": ["$minute_int", start_minute_int]},
-        #         {"$lte": ["$minute_int", end_minute_int]},
-        #
-        #         {"$or": [
-        #             {"$ne": ["$hour_int", start_hour_int]},
-        #             {"$gte": ["$minute_int", start_minute_int]},
-        #         ]},
-        #
-        #         {"$or": [
-        #             {"$ne": ["$hour_int", end_hour_int]},
-        #             {"$lte": ["$minute_int", end_minute_int]}
-        #         ]}
-        #
-        #     ]
-        # }
+        "minute_of_day": {
+            "$gte": start_hour_int * 60 + start_minute_int,
+            "$lte": end_hour_int * 60 + end_minute_int
+        }
     }
 
     # Add the name patterns condition if the list is not empty
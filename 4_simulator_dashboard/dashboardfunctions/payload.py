@@ -0,0 +1,184 @@
+import numpy as np
+
+from dashboardfunctions.filters import get_edge_nodes
+
+# Attributes of the edges that change with the data shown in the map (the rest of the edge never changes)
+DYNAMIC_ATTRIBUTES = ["traffic_level", "current_speed", "api_data"]
+
+# Clientside callback that builds the edges and nodes of the map from the static geometry (sent once with the layout)
+# and the compact update of each map callback (positions of the shown edges and nodes, and their colors and attributes).
+# At low zoom the update only names its zoom band, and the simplified coordinates of the band are read from the store
+# where they are sent once (see 'get_level_of_detail_band'), or the static ones while they haven't arrived yet
+MERGE_MAP_UPDATE = """
+function(update, bandCoords, staticEdges, staticNodes) {
+    if (!staticEdges || !staticNodes) {
+        return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+    }
+    if (!update) {
+        return [staticEdges, staticNodes];
+    }
+
+    const edges = update.edges.map(function (position, i) {
+        const edge = staticEdges[position];
+        const data = Object.assign({}, edge.data);
+        for (const attribute of update.attributes) {
+            data[attribute] = update[attribute][i];
+        }
+        const coords = update.band && bandCoords && bandCoords[update.band] ? bandCoords[update.band][position]
+            : edge.coords;
+        return Object.assign({}, edge, {color: update.colors[i], coords: coords, data: data});
+    });
+    const nodes = update.nodes.map(function (position) {
+        return staticNodes[position];
+    });
+
+    return [edges, nodes];
+}
+"""
+
+# Clientside callback that also applies the filters of the traffic level, node type, street name and street type (the
+# server only sends the edges of the snapshot and the filters that depend on the data), so moving these controls doesn't
+# go back to the server. The filters are the same ones as in 'filters.get_map_masks'
+FILTER_MAP_UPDATE = """
+function(update, trafficLevelRange, nodeTypeShow, nameInput, streetTypes, bandCoords, staticEdges, staticNodes,
+         filterIndex) {
+    if (!staticEdges || !staticNodes || !filterIndex) {
+        return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+    }
+
+    // Same normalization as 'street_names.normalize_street_name' (lower case, without accents and single spaces)
+    function normalize(text) {
+        return text.normalize('NFKD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase().split(/\\s+/)
+            .filter(function (word) { return word.length > 0; }).join(' ');
+    }
+
+    let nameMask = null;
+    const patterns = (nameInput || '').split(',').map(normalize).filter(function (pattern) {
+        return pattern.length > 0;
+    });
+    if (patterns.length > 0) {
+        nameMask = new Uint8Array(staticEdges.length);
+        filterIndex.names.forEach(function (name, nameId) {
+            if (patterns.some(function (pattern) { return name.includes(pattern); })) {
+                for (const position of filterIndex.name_positions[nameId]) {
+                    nameMask[position] = 1;
+                }
+            }
+        });
+    }
+    const types = streetTypes && streetTypes.length > 0 ? new Set(streetTypes) : null;
+    const range = trafficLevelRange || [-Infinity, Infinity];
+
+    const edgePositions = update ? update.edges : staticEdges.map(function (edge, position) { return position; });
+    const nodePositions = update ? update.nodes : staticNodes.map(function (node, position) { return position; });
+
+    const edges = [];
+    const connected = new Uint8Array(staticNodes.length);
+    edgePositions.forEach(function (position, i) {
+        const edge = staticEdges[position];
+        const trafficLevel = update ? update.traffic_level[i] : edge.data.traffic_level;
+        // The edges without traffic level are always shown
+        if (typeof trafficLevel === 'number' && (trafficLevel < range[0] || trafficLevel > range[1])) {
+            return;
+        }
+        if (types && !(typeof edge.data.highway === 'string' && types.has(edge.data.highway))) {
+            return;
+        }
+        if (nameMask && !nameMask[position]) {
+            return;
+        }
+
+        if (update) {
+            const data = Object.assign({}, edge.data);
+            for (const attribute of update.attributes) {
+                data[attribute] = update[attribute][i];
+            }
+            const coords = update.band && bandCoords && bandCoords[update.band] ? bandCoords[update.band][position]
+            : edge.coords;
+            edges.push(Object.assign({}, edge, {color: update.colors[i], coords: coords, data: data}));
+        } else {
+            edges.push(edge);
+        }
+        for (const node of [filterIndex.sources[position], filterIndex.targets[position]]) {
+            if (node >= 0) {
+                connected[node] = 1;
+            }
+        }
+    });
+
+    // Don't show nodes that are not connected to any shown edge
+    const showTypes = new Set(nodeTypeShow || []);
+    const nodes = [];
+    for (const position of nodePositions) {
+        const node = staticNodes[position];
+        const nodeType = String(node.data.highway === undefined ? '' : node.data.highway);
+        if (connected[position] && ((nodeType && showTypes.has(nodeType)) ||
+                                    (showTypes.has('traffic_light') && node.data.traffic_light))) {
+            nodes.push(node);
+        }
+    }
+
+    return [edges, nodes];
+}
+"""
+
+
+def get_static_edges(edges):
+    """ Get the static part of the edges of the map, sent once to the browser
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        The edges without the WKT 'geometry' (the same points are already in 'coords')"""
+
+    return [
+        {**edge, "data": {key: value for key, value in edge["data"].items() if key != "geometry"}}
+        for edge in edges
+    ]
+
+
+def get_map_update(edges, edges_mask, nodes_mask, band=None):
+    """ Get the compact update of the map: the positions of the edges and nodes shown, and the color and the dynamic
+    attributes of each shown edge
+    Args:
+        edges: The edges of the map (Sylvereye edges data), already colored
+        edges_mask: The boolean array of the edges shown
+        nodes_mask: The boolean array of the nodes shown
+        band: The zoom band of the simplified coordinates of the edges (see 'get_level_of_detail_band'), or None for
+            the static ones
+    Returns:
+        A dictionary with a list for each field (merged with the static edges and nodes by 'MERGE_MAP_UPDATE')"""
+
+    positions = np.flatnonzero(edges_mask).tolist()
+
+    update = {
+        "edges": positions,
+        "nodes": np.flatnonzero(nodes_mask).tolist(),
+        "colors": [edges[i]["color"] for i in positions],
+        "attributes": DYNAMIC_ATTRIBUTES,
+    }
+    for attribute in DYNAMIC_ATTRIBUTES:
+        update[attribute] = [edges[i]["data"].get(attribute) for i in positions]
+    if band is not None:
+        update["band"] = band
+
+    return update
+
+
+def get_filter_index(edges, nodes, name_index):
+    """ Get the index used by the browser to filter the map (see 'FILTER_MAP_UPDATE'), sent once to the browser
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+        nodes: The nodes of the map (Sylvereye nodes data)
+        name_index: The index of the street names of the edges (see 'street_names.get_street_name_index')
+    Returns:
+        A dictionary with the normalised street names, the positions of the edges of each name and the positions of
+        the source and target nodes of each edge"""
+
+    sources, targets = get_edge_nodes(edges, nodes)
+
+    return {
+        "names": name_index["normalized_names"],
+        "name_positions": [positions.tolist() for positions in name_index["positions"]],
+        "sources": sources.tolist(),
+        "targets": targets.tolist(),
+    }
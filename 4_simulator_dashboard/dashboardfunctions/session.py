@@ -0,0 +1,94 @@
+import pickle
+import uuid
+
+from dashboardfunctions import constants
+
+KEY_PREFIX = "dashboard_session:"
+
+# Backend of the store of the sessions ('disk' or 'redis', and its client), created on first use
+session_store = None
+
+
+def __get_session_store():
+    global session_store
+
+    if session_store is None:
+        if constants.SESSION_STORE == "redis":
+            import redis
+
+            session_store = ("redis", redis.Redis.from_url(constants.SESSION_STORE_REDIS_URL))
+        else:
+            import diskcache
+
+            # The folder is shared by every worker of the dashboard, and the least recently used sessions are evicted
+            # when it is full
+            session_store = ("disk", diskcache.Cache(constants.SESSION_STORE_FOLDER,
+                                                     size_limit=constants.SESSION_STORE_SIZE_MB * 1024 * 1024,
+                                                     eviction_policy="least-recently-used"))
+
+    return session_store
+
+
+def new_session_id():
+    # Each page load gets a new session (the id is kept in the 'session-id' store of the layout)
+    return uuid.uuid4().hex
+
+
+def get_session_state(session_id):
+    """ Get the state of a session (the sessions expire SESSION_TTL_SECONDS after their last use)
+    Args:
+        session_id: The id of the session
+    Returns:
+        The dictionary with the state of the session (empty for a new or expired session)"""
+
+    if session_id is None:
+        return {}
+
+    backend, client = __get_session_store()
+    key = KEY_PREFIX + session_id
+
+    if backend == "disk":
+        state = client.get(key)
+        if state is not None:
+            client.touch(key, expire=constants.SESSION_TTL_SECONDS)
+        return state if state is not None else {}
+
+    # Each value of the state is a field of the hash of the session
+    pipeline = client.pipeline()
+    pipeline.hgetall(key)
+    pipeline.expire(key, constants.SESSION_TTL_SECONDS)
+    fields = pipeline.execute()[0]
+    return {field.decode(): pickle.loads(value) for field, value in fields.items()}
+
+
+def update_session_state(session_id, **values):
+    """ Save some values in the state of a session. The other values of the state are kept, even if another worker
+    saves them at the same time (the values are fields of a Redis hash, or the state is updated in a transaction of
+    diskcache)
+    Args:
+        session_id: The id of the session
+        **values: The values to save
+    Returns:
+        The dictionary with the new state of the session"""
+
+    if session_id is None:
+        return dict(values)
+
+    backend, client = __get_session_store()
+    key = KEY_PREFIX + session_id
+
+    if backend == "disk":
+        # The transaction locks the cache for the other workers between the read and the write of the state
+        with client.transact():
+            state = get_session_state(session_id)
+            state.update(values)
+            client.set(key, state, expire=constants.SESSION_TTL_SECONDS)
+        return state
+
+    # Only the given fields are written, so the fields saved by other workers are not overwritten
+    pipeline = client.pipeline()
+    pipeline.hset(key, mapping={field: pickle.dumps(value) for field, value in values.items()})
+    pipeline.expire(key, constants.SESSION_TTL_SECONDS)
+    pipeline.hgetall(key)
+    fields = pipeline.execute()[-1]
+    return {field.decode(): pickle.loads(value) for field, value in fields.items()}
@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 import pandas as pd
 from dash_sylvereye.defaults import get_default_node_options, get_default_edge_options
 from dash_sylvereye.enums import EdgeColorMethod
@@ -6,6 +9,8 @@ import plotly.graph_objects as go
 
 from dash_sylvereye.utils import load_from_osmnx_graph
 from dashboardfunctions.color import color_by_attribute
+from dashboardfunctions.edge_index import get_edge_index, new_edge_attributes, set_attributes_from_links, \
+    set_attributes_from_mesa, set_attributes_to_edges
 
 
 def get_node_edge_options():
@@ -79,50 +84,46 @@ def translate_from_float_to_time_string(time_float):
 
 
 def add_info_from_mesa_list(edges_list_with_data, edges):
-    for edge in edges:
-        source = edge['data']['source_osmid']
-        target = edge['data']['target_osmid']
-        edge['data']['traffic_level'] = float(edges_list_with_data[(source, target, 0)])
-        edge['data']['current_speed'] = float(edges_list_with_data[(source, target, 0)]) * float(
-            edge['data']['maxspeed'])
+    index = get_edge_index(edges)
+    attributes = set_attributes_from_mesa(index, new_edge_attributes(index), edges_list_with_data, edges)
 
-    return edges
+    return set_attributes_to_edges(attributes, edges)
 
 
 # {'osmid': 359280372, 'current_speed': 39.47466081733532, 'api_data': False, 'traffic_level': 0.7894932163467063, 'source': 21497117, 'target': 21497131, 'key': 0}
 # {'coords': [[36.7201549, -4.4601866], [36.7200901, -4.4603168]], 'visible': True, 'alpha': 1.0, 'width': 0.25, 'color': 0, 'data': {'access': None, 'bridge': None, 'geometry': None, 'highway': 'secondary', 'junction': 'roundabout', 'lanes': '3', 'length': 13.66, 'maxspeed': '50', 'name': 'Plaza Pintor Sandro Botticelli', 'oneway': True, 'osmid': 359280372, 'ref': None, 'service': None, 'source_osmid': 21497117, 'target_osmid': 21497131, 'traffic_level': None, 'current_speed': None, 'api_data': 'False', 'bearing': 238.2}}
 def add_info_from_mongo_list(edges_list_with_data, edges, attribute='traffic_level'):
-    traffic_level_dict = {
-        (edge['source'], edge['target']): float(edge['traffic_level'])
-        for edge in edges_list_with_data
-    }
+    # The links are placed with the index of the edges, and the edges are only modified once at the end
+    index = get_edge_index(edges)
+    attributes = set_attributes_from_links(index, new_edge_attributes(index), edges_list_with_data)
 
-    current_speed_dict = {
-        (edge['source'], edge['target']): float(edge['current_speed'])
-        for edge in edges_list_with_data
-    }
+    return set_attributes_to_edges(attributes, edges)
 
-    api_data_dict = {
-        (edge['source'], edge['target']): edge['api_data']
-        for edge in edges_list_with_data
-    }
 
-    for edge in edges:
-        source = edge['data']['source_osmid']
-        target = edge['data']['target_osmid']
-        if (source, target) in traffic_level_dict:
-            edge['data']['traffic_level'] = traffic_level_dict[(source, target)]
+# Minimum and maximum of each attribute of the data shown in the map by data key, shared by every session of the process
+MIN_MAX_CACHE_SIZE = 32
+min_max_cache = OrderedDict()
+min_max_cache_lock = threading.Lock()
+
 
-        if (source, target) in current_speed_dict:
-            edge['data']['current_speed'] = current_speed_dict[(source, target)]
+def get_min_max_values_from_attribute_edges_data(edges_data, attribute="traffic_level", data_key=None):
+    # With a data key, the values are computed once until the data shown in the map changes
+    if data_key is not None:
+        key = (data_key, len(edges_data), attribute)
+        with min_max_cache_lock:
+            if key in min_max_cache:
+                min_max_cache.move_to_end(key)
+                return min_max_cache[key]
 
-        if (source, target) in api_data_dict:
-            edge['data']['api_data'] = api_data_dict[(source, target)]
+        min_max = get_min_max_values_from_attribute_edges_data(edges_data, attribute)
 
-    return edges
+        with min_max_cache_lock:
+            min_max_cache[key] = min_max
+            while len(min_max_cache) > MIN_MAX_CACHE_SIZE:
+                min_max_cache.popitem(last=False)
 
+        return min_max
 
-def get_min_max_values_from_attribute_edges_data(edges_data, attribute="traffic_level"):
     min_val = 500.0
     max_val = 0.0
 
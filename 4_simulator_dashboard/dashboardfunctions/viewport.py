@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+from shapely import STRtree, LineString, box
+
+from dashboardfunctions import constants
+
+# Tolerance (in degrees) of the simplification of the edges for the zoom levels below each zoom, from the lowest zoom.
+# From the last zoom the edges are shown with all their points
+SIMPLIFY_TOLERANCES = [(13, 0.0002), (15, 0.00005)]
+
+# Index of the bounding boxes of the edges of the map and their simplified coordinates for each zoom band, built from
+# the edges of the base graph (their geometry never changes, so the index is only computed again if the amount of edges
+# changes)
+viewport_index = {}
+
+
+def get_viewport_index(edges):
+    """ Get the index of the bounding boxes of the edges of the map (an R-tree)
+    Args:
+        edges: The edges of the map (Sylvereye edges data)
+    Returns:
+        A dictionary with the R-tree of the edges and the simplified coordinates already computed"""
+
+    if viewport_index.get("size") == len(edges):
+        return viewport_index
+
+    # The coordinates of the edges are [lat, lon], so the boxes are (min lat, min lon, max lat, max lon)
+    boxes = []
+    for edge in edges:
+        coords = np.array(edge["coords"], dtype=np.float64)
+        boxes.append(box(*coords.min(axis=0), *coords.max(axis=0)))
+
+    viewport_index.clear()
+    viewport_index.update({
+        "size": len(edges),
+        "tree": STRtree(boxes),
+        "simplified_coords": {},
+    })
+
+    return viewport_index
+
+
+def get_viewport_bounds(map_center, map_zoom):
+    """ Get the bounds of the map shown, from its center and zoom (Web Mercator) and the size of the map in pixels
+    (VIEWPORT_WIDTH and VIEWPORT_HEIGHT), with a margin of VIEWPORT_MARGIN on each side
+    Args:
+        map_center: The center of the map [lat, lon]
+        map_zoom: The zoom of the map
+    Returns:
+        The minimum latitude, minimum longitude, maximum latitude and maximum longitude"""
+
+    world_size = 256 * 2 ** map_zoom
+    half_width = constants.VIEWPORT_WIDTH * (0.5 + constants.VIEWPORT_MARGIN)
+    half_height = constants.VIEWPORT_HEIGHT * (0.5 + constants.VIEWPORT_MARGIN)
+
+    lat, lon = map_center
+    half_lon = half_width * 360 / world_size
+
+    # The latitude is not linear in Web Mercator, so the center is converted to pixels and back
+    y = world_size * (1 - math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / math.pi) / 2
+
+    def y_to_lat(y_pixel):
+        return math.degrees(2 * math.atan(math.exp(math.pi * (1 - 2 * y_pixel / world_size))) - math.pi / 2)
+
+    return y_to_lat(y + half_height), lon - half_lon, y_to_lat(y - half_height), lon + half_lon
+
+
+def get_viewport_mask(index, bounds):
+    """ Get the mask of the edges of the map inside the bounds
+    Args:
+        index: The index of the edges (see 'get_viewport_index')
+        bounds: The minimum latitude, minimum longitude, maximum latitude and maximum longitude
+    Returns:
+        The boolean array with one value for each edge of the map"""
+
+    mask = np.zeros(index["size"], dtype=bool)
+    mask[index["tree"].query(box(*bounds))] = True
+
+    return mask
+
+
+def get_level_of_detail_band(map_zoom):
+    """ Get the zoom band of the map, the edges are simplified with the same tolerance in every zoom of a band
+    Args:
+        map_zoom: The zoom of the map
+    Returns:
+        The name of the band (the zoom where it ends), or None if the edges are shown with all their points"""
+
+    return next((str(zoom) for zoom, tolerance in SIMPLIFY_TOLERANCES if map_zoom < zoom), None)
+
+
+def get_level_of_detail_coords(index, edges, band):
+    """ Get the coordinates of the edges of the map simplified for a zoom band (Douglas-Peucker)
+    Args:
+        index: The index of the edges (see 'get_viewport_index')
+        edges: The edges of the map (Sylvereye edges data)
+        band: The zoom band (see 'get_level_of_detail_band')
+    Returns:
+        The list of the coordinates of each edge"""
+
+    # The coordinates of each zoom band are only simplified once
+    if band not in index["simplified_coords"]:
+        tolerance = dict(SIMPLIFY_TOLERANCES)[int(band)]
+        index["simplified_coords"][band] = [
+            [list(point) for point in LineString(edge["coords"]).simplify(tolerance).coords]
+            if len(edge["coords"]) > 2 else edge["coords"]
+            for edge in edges
+        ]
+
+    return index["simplified_coords"][band]
@@ -1,7 +1,12 @@
+import datetime
+
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
 
+from dashboardfunctions.compact import get_compact_edges_by_filename
+from dashboardfunctions.retention import get_compacted_edges_by_filename
+
 load_dotenv()
 
 
@@ -14,8 +19,29 @@ def get_database(database_name="TFG"):
 
 
 def get_edges_by_filename(db, filename):
+    # The snapshots saved with GRAPHS_STORAGE_MODE='compact' are only in 'compact_graphs', 'graphs' has the complete
+    # documents of the default mode (and of older runs)
+    edges = get_compact_edges_by_filename(db, filename)
+    if edges is not None:
+        return edges
+
     mongo_object = db["graphs"].find_one({"filename": filename})
     if mongo_object:
         return mongo_object["links"]
+    else:
+        # The snapshots older than the retention boundary are only in 'compacted_graphs'
+        return get_compacted_edges_by_filename(db, filename)
+
+
+def get_slot_from_datetime(date, slot_minutes=15):
+    # Same slot numbers as 'resampling.py' in '2_refine_data' (slot 0 starts at 1970-01-01 00:00)
+    return int((date - datetime.datetime(1970, 1, 1)).total_seconds() // (slot_minutes * 60))
+
+
+def get_edges_by_slot(db, slot, slot_minutes=15):
+    # The slots flagged as gaps have no links (there was no snapshot near them)
+    mongo_object = db["resampled_graphs"].find_one({"slot": slot, "slot_minutes": slot_minutes})
+    if mongo_object and not mongo_object["gap"]:
+        return mongo_object["links"]
     else:
         return None
@@ -1,5 +1,8 @@
 from traffic_model.model import TrafficModel
-from traffic_model.mongo_connections import get_database, get_edges_by_filename
+import datetime
+
+from traffic_model.mongo_connections import get_database, get_edges_by_filename, get_edges_by_slot, \
+    get_slot_from_datetime
 import logging
 
 import osmnx as ox
@@ -41,9 +44,22 @@ def set_traffic_level_graph(date):
     graph = ox.load_graphml('base_graph.graphml')
 
     db = get_database("TFG")
-    edges = get_edges_by_filename(db, date)
+
+    # The date can be a filename, or a datetime or the number of a resampled slot
+    if isinstance(date, datetime.datetime):
+        date = get_slot_from_datetime(date)
+    if isinstance(date, int):
+        edges = get_edges_by_slot(db, date)
+        if edges is None:
+            raise ValueError(f"The slot {date} has no traffic data (it is a gap or it was not resampled)")
+    else:
+        edges = get_edges_by_filename(db, date)
 
     for edge in edges:
+        # Resampled slots have no traffic level for the edges without data in the nearest snapshots
+        if edge['traffic_level'] is None:
+            continue
+
         graph.edges[edge['source'], edge['target'], 0]["traffic_level"] = float(edge['traffic_level'])
         # Inverse traffic level to be able to use it as a weight
         graph.edges[edge['source'], edge['target'], 0]["weight"] = float(1 + (1 - edge['traffic_level']))